@@ -1,11 +1,11 @@
 from flask import Blueprint, request, jsonify
-from core.ollama import call_ollama_keywords, call_ollama_tags
+from core.ollama import call_ollama_keywords_and_tags
 from core.extractors import extract_text_for_keywords
 import json, urllib.request, tempfile, os, re
 from pathlib import Path
 from core.settings import SETTINGS
 from datetime import datetime
-from core.state import STATE, save_state
+from core.keyword_store import get_keyword_store
 
 bp = Blueprint("ai", __name__, url_prefix="/api/ai")
 
@@ -19,6 +19,12 @@ def _contains_pathlike(s: str) -> bool:
 def health():
     return jsonify({"ok": True})
 
+@bp.get("/cache")
+def generation_cache_stats():
+    from core.generation_cache import get_generation_cache
+    cache = get_generation_cache()
+    return jsonify({"ok": True, "enabled": cache is not None, **(cache.stats() if cache else {})})
+
 @bp.get("/ollama/models")
 def list_ollama_models():
     base = SETTINGS.get("ai", {}).get("url", "http://localhost:11434").rstrip("/")
@@ -38,15 +44,13 @@ def keywords():
     max_len = int(data.get("max_len", 50))
     if _contains_pathlike(text):
         return jsonify({"ok": False, "error": "path-like content forbidden"}), 400
-    out = call_ollama_keywords(text[:80], text, max_total_chars=max_len, seeds=seeds)
+    out, tags = call_ollama_keywords_and_tags(text[:80], text, max_total_chars=max_len, seeds=seeds)
     if not out:
         prefix = (seeds + ", ") if seeds else ""
         remain = max_len - len(prefix)
         out = (prefix + text.replace("\n"," ")[:max(0, remain)]).strip(", ")
-    tags = call_ollama_tags(text[:80], text)
     kw_list = [w.strip() for w in re.split(r"[，,;；]", out or "") if w.strip()]
-    STATE.setdefault("keywords_log", [])
-    STATE["keywords_log"].append({
+    get_keyword_store().append_log({
         "time": datetime.utcnow().isoformat(),
         "source": "text",
         "seeds": seeds,
@@ -54,8 +58,6 @@ def keywords():
         "keywords": kw_list,
         "tags": tags,
     })
-    STATE["keywords_log"] = STATE["keywords_log"][-100:]
-    save_state()
     return jsonify({"ok": True, "keywords": kw_list, "tags": tags})
 
 @bp.post("/keywords_file")
@@ -79,16 +81,15 @@ def keywords_file():
             except Exception:
                 pass
     title = f.filename or ""
-    kw = call_ollama_keywords(title, body, max_total_chars=max_len, seeds=seeds) or ""
+    kw, tags = call_ollama_keywords_and_tags(title, body, max_total_chars=max_len, seeds=seeds)
+    kw = kw or ""
     if not kw:
         base = Path(title).stem.replace("_", " ").replace("-", " ")
         prefix = (seeds + ", ") if seeds else ""
         kw = prefix + base[:max(0, max_len - len(prefix))]
     kw = kw[:max_len]
-    tags = call_ollama_tags(title, body)
     kw_list = [w.strip() for w in re.split(r"[，,;；]", kw or "") if w.strip()]
-    STATE.setdefault("keywords_log", [])
-    STATE["keywords_log"].append({
+    get_keyword_store().append_log({
         "time": datetime.utcnow().isoformat(),
         "source": "file",
         "filename": title,
@@ -96,6 +97,4 @@ def keywords_file():
         "keywords": kw_list,
         "tags": tags,
     })
-    STATE["keywords_log"] = STATE["keywords_log"][-100:]
-    save_state()
     return jsonify({"ok": True, "keywords": kw_list, "tags": tags})
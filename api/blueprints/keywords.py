@@ -1,12 +1,17 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, session, stream_with_context
+import json
+from contextlib import closing
 from pathlib import Path
 import re
 import tempfile
 import os
 import logging
+import threading
+import time
+import uuid
 
 from core.utils.iterfiles import is_under_allowed_roots, detect_category
-from core.state import STATE, save_state
+from core.keyword_store import get_keyword_store
 from core.settings import SETTINGS
 from core.config import CFG
 from services.ai_keywords import AIKeywordService
@@ -36,6 +41,47 @@ def _compose_keywords(seeds: str, parts: list, max_chars: int = 50) -> str:
     s = s.replace(",", "，").replace(";", "，") # unify
     return s[:max_chars]
 
+def _flat_keywords(res_dict: dict, seeds_raw: str) -> list:
+    kw_list = res_dict.get("keywords", [])
+    # If the service returns objects, flatten them
+    flat_kws = []
+    for k in kw_list:
+        if isinstance(k, dict): flat_kws.append(k.get("term", ""))
+        elif isinstance(k, str): flat_kws.append(k)
+
+    # Fallback to just seeds if empty
+    if not flat_kws and seeds_raw:
+         flat_kws = [s.strip() for s in re.split(r"[,;，；]", seeds_raw) if s.strip()]
+    return flat_kws
+
+def _sse(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+# POST /keywords/stream/jobs 登记的待执行流式任务：job_id -> (user, paths, seeds, 创建时间)。
+# GET 只能凭 job_id 取出一次，本身不携带任何会写入关键词库的参数。
+_STREAM_JOBS: dict = {}
+_STREAM_JOBS_LOCK = threading.Lock()
+_STREAM_JOB_TTL = 300
+_STREAM_JOBS_MAX = 256
+
+def _new_stream_job(paths: list, seeds: str) -> str:
+    now = time.time()
+    job_id = uuid.uuid4().hex
+    with _STREAM_JOBS_LOCK:
+        for k in [k for k, v in _STREAM_JOBS.items() if now - v[3] > _STREAM_JOB_TTL]:
+            del _STREAM_JOBS[k]
+        while len(_STREAM_JOBS) >= _STREAM_JOBS_MAX:
+            del _STREAM_JOBS[next(iter(_STREAM_JOBS))]
+        _STREAM_JOBS[job_id] = (session.get("user"), paths, seeds, now)
+    return job_id
+
+def _take_stream_job(job_id: str):
+    with _STREAM_JOBS_LOCK:
+        job = _STREAM_JOBS.pop(job_id or "", None)
+    if job is None or job[0] != session.get("user") or time.time() - job[3] > _STREAM_JOB_TTL:
+        return None
+    return job[1], job[2]
+
 @bp.post("/keywords")
 def gen_keywords():
     if not SETTINGS.get("features", {}).get("enable_ai_keywords", True):
@@ -54,57 +100,124 @@ def gen_keywords():
     # (can be added later or we rely on the service's own heuristics).
     
     from core.extractors import extract_text_for_keywords
+    from core.extract_pool import extract_many
     
     out = {}
-    STATE.setdefault("keywords", {})
+    generated = {}
+    paths = [p for p in paths if is_under_allowed_roots(p)]
+
+    # 多个文件时先在进程池里并行抽取文本，再并发调用模型
+    bodies = {}
+    if len(paths) > 1:
+        for res in extract_many(paths, mode="text", max_chars=3000):
+            if not res.ok:
+                logger.warning(f"Text extraction failed for {res.path}: {res.error}")
+            bodies[res.path] = res.text
     
+    # 1. Extract text
+    docs = {}
     for p in paths:
-        if not is_under_allowed_roots(p):
-            continue
-            
         try:
-            # 1. Extract text
-            body = extract_text_for_keywords(p, max_chars=3000)
-            
-            # 2. Generate
-            # If simplistic fast mode is requested, we might just skip AI service call 
-            # to save tokens/time if we had a local jieba implementation.
-            # For this refactor, we route complex requests to AI Service.
-            
-            title = Path(p).name
-            cat = detect_category(Path(p).suffix.lower().lstrip("."))
-            
-            # Simple wrapper to use the service
-            # In a full impl, we'd pass strategy to service or have different methods
-            res_dict = ai_service.map_reduce_keywords(title, body, cat, seeds=seeds_raw, max_len=max_chars)
-            
-            kw_list = res_dict.get("keywords", [])
-            # If the service returns objects, flatten them
-            flat_kws = []
-            for k in kw_list:
-                if isinstance(k, dict): flat_kws.append(k.get("term", ""))
-                elif isinstance(k, str): flat_kws.append(k)
-            
-            # Fallback to just seeds if empty
-            if not flat_kws and seeds_raw:
-                 flat_kws = [s.strip() for s in re.split(r"[,;，；]", seeds_raw) if s.strip()]
-
-            out[p] = flat_kws
-            STATE["keywords"][p] = flat_kws
-            
+            body = bodies[p] if p in bodies else extract_text_for_keywords(p, max_chars=3000)
+            docs[p] = (Path(p).name, body, detect_category(Path(p).suffix.lower().lstrip(".")))
         except Exception as e:
             logger.error(f"Keyword gen failed for {p}: {e}")
+
+    # 2. Generate: documents run concurrently, their LLM calls share one
+    # bounded queue (ai.max_in_flight) in the service's client
+    results = dict(ai_service.map_reduce_many(docs, seeds=seeds_raw, max_len=max_chars))
+    for p in paths:
+        res_dict = results.get(p)
+        if res_dict is None or isinstance(res_dict, Exception):
+            if res_dict is not None:
+                logger.error(f"Keyword gen failed for {p}: {res_dict}")
             out[p] = []
+            continue
 
-    save_state()
+        flat_kws = _flat_keywords(res_dict, seeds_raw)
+        out[p] = flat_kws
+        generated[p] = flat_kws
+
+    get_keyword_store().set_many(generated)
     return jsonify({"ok": True, "keywords": out})
 
+@bp.post("/keywords/stream/jobs")
+def create_keywords_stream():
+    """登记一个流式关键词任务，返回 ``job_id``，再用 GET ``/keywords/stream?job=...`` 接收事件。"""
+    if not SETTINGS.get("features", {}).get("enable_ai_keywords", True):
+        return jsonify({"ok": False, "error": "关键词功能已禁用"}), 403
+    data = request.get_json(silent=True) or {}
+    paths = [p for p in data.get("paths", []) if isinstance(p, str) and is_under_allowed_roots(p)]
+    job_id = _new_stream_job(paths, (data.get("seeds") or "").strip())
+    return jsonify({"ok": True, "job_id": job_id, "total": len(paths)}), 202
+
+@bp.route("/keywords/stream", methods=["GET", "POST"])
+def gen_keywords_stream():
+    """Server-sent events 版本的 ``/keywords``，逐个文件生成。
+
+    事件：``map``（某个分块的 map 结果）、``reduce``（完成一层分组合并）、
+    ``token``（最终 reduce 的输出片段）、
+    ``result``（该文件的最终关键词，已保存）、``error``，最后是 ``done``。
+    POST 直接接收与 ``/keywords`` 相同的 JSON。GET（便于 ``EventSource``）只接受
+    ``?job=...``：任务由 POST ``/keywords/stream/jobs`` 登记，只能取用一次，
+    因此跨站构造的 GET 无法触发生成和写入。客户端断开时取消排队中的 map 请求
+    并中断正在进行的 reduce 生成；已经发出的 map 请求会跑完，结果被丢弃。
+    """
+    if not SETTINGS.get("features", {}).get("enable_ai_keywords", True):
+        return jsonify({"ok": False, "error": "关键词功能已禁用"}), 403
+
+    if request.method == "GET":
+        # 全局登录检查只拦截 POST/JSON 请求，GET 需要单独检查
+        if "user" not in session:
+            return jsonify({"ok": False, "error": "未登录"}), 401
+        job = _take_stream_job(request.args.get("job", ""))
+        if job is None:
+            return jsonify({"ok": False, "error": "任务不存在或已过期"}), 404
+        paths, seeds_raw = job
+    else:
+        data = request.get_json(silent=True) or {}
+        paths = data.get("paths", [])
+        seeds_raw = (data.get("seeds") or "").strip()
+    paths = [p for p in paths if is_under_allowed_roots(p)]
+    max_chars = int(CFG.get("keywords", {}).get("max_chars", 50))
+
+    from core.extractors import extract_text_for_keywords
+
+    def stream():
+        done = 0
+        for p in paths:
+            try:
+                body = extract_text_for_keywords(p, max_chars=3000)
+                doc_type = detect_category(Path(p).suffix.lower().lstrip("."))
+                # closing(): a client disconnect closes this generator, which
+                # must in turn cancel the service's pending LLM calls
+                with closing(ai_service.map_reduce_stream(Path(p).name, body, doc_type,
+                                                          seeds_raw, max_chars)) as events:
+                    for kind, value in events:
+                        if kind == "map":
+                            yield _sse("map", {"path": p, **value})
+                        elif kind == "token":
+                            yield _sse("token", {"path": p, "text": value})
+                        elif kind == "reduce":
+                            yield _sse("reduce", {"path": p, **value})
+                        else:
+                            flat_kws = _flat_keywords(value, seeds_raw)
+                            get_keyword_store().set(p, flat_kws)
+                            done += 1
+                            yield _sse("result", {"path": p, "keywords": flat_kws})
+            except Exception as e:
+                logger.error(f"Keyword gen failed for {p}: {e}")
+                yield _sse("error", {"path": p, "error": str(e)})
+        yield _sse("done", {"ok": True, "total": len(paths), "done": done})
+
+    return Response(stream_with_context(stream()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @bp.post("/update_keywords")
 def update_keywords():
     data = request.get_json(silent=True) or {}
     updates = data.get("updates", [])
-    STATE.setdefault("keywords", {})
-    saved = 0
+    items = {}
     for u in updates:
         p = u.get("path")
         kw_raw = u.get("keywords", [])
@@ -113,9 +226,8 @@ def update_keywords():
         else:
             kw_list = [str(w).strip() for w in kw_raw if str(w).strip()]
         if p and is_under_allowed_roots(p):
-            STATE["keywords"][p] = kw_list
-            saved += 1
-    save_state()
+            items[p] = kw_list
+    saved = get_keyword_store().set_many(items)
     return jsonify({"ok": True, "saved": saved})
 
 @bp.post("/clear_keywords")
@@ -124,13 +236,7 @@ def clear_keywords():
         return jsonify({"ok": False, "error": "关键词功能已禁用"}), 403
     data = request.get_json(silent=True) or {}
     paths = data.get("paths", [])
-    STATE.setdefault("keywords", {})
-    cleared = 0
-    for p in paths:
-        if p and is_under_allowed_roots(p) and p in STATE["keywords"]:
-            del STATE["keywords"][p]
-            cleared += 1
-    save_state()
+    cleared = get_keyword_store().delete_many(p for p in paths if p and is_under_allowed_roots(p))
     return jsonify({"ok": True, "cleared": cleared})
 
 @bp.post("/keywords_image")
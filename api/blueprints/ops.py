@@ -8,7 +8,7 @@ from PIL import Image
 from core.utils.iterfiles import is_under_allowed_roots
 from core.settings import SETTINGS
 from core.mysql_log import log_op
-from core.normalize_runner import normalize_file
+from core.normalize_runner import normalize_many
 # from core.config import SETTINGS as CFG_DICT # removed to fix import error
 
 bp = Blueprint("ops", __name__)
@@ -64,14 +64,13 @@ def normalize_endpoint():
     out_root = Path(base_dir) / collection
     
     results = []
-    for f in files:
-        try:
-            res = normalize_file(f, out_root, on_unsupported=strategy)
+    for f, res in normalize_many(files, out_root, on_unsupported=strategy):
+        if isinstance(res, Exception):
+            results.append({"path": f, "ok": False, "error": str(res)})
+        else:
             results.append({
                 "path": f, "ok": res.ok, "doc_id": res.doc_id
             })
-        except Exception as e:
-             results.append({"path": f, "ok": False, "error": str(e)})
     return jsonify({"ok": True, "results": results})
 
 @bp.get("/file")
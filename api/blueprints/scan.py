@@ -6,7 +6,9 @@ import csv
 import os
 
 from core.config import ALLOWED_ROOTS, DEFAULT_SCAN_DIR, PAGE_SIZE_DEFAULT, ENABLE_HASH_DEFAULT
-from core.utils.iterfiles import is_under_allowed_roots, iter_files
+from core.catalog import get_catalog
+from core.scan_session import decode_cursor, encode_cursor, get_session, start_session
+from core.utils.iterfiles import is_under_allowed_roots, iter_files, to_file_rows
 from core.mysql_log import get_mysql_conn
 
 bp = Blueprint("scan", __name__)
@@ -49,21 +51,57 @@ def list_dirs():
 
 @bp.get("/scan")
 def scan():
+    page_size = max(int(request.values.get("page_size", str(PAGE_SIZE_DEFAULT))), 1)
+    wait = min(max(float(request.values.get("wait", "2")), 0.0), 30.0)
+    cursor = request.values.get("cursor")
+    if cursor:
+        try:
+            session_id, seq, after = decode_cursor(cursor)
+        except ValueError:
+            return jsonify({"ok": False, "error": "游标无效"}), 400
+        session = get_session(session_id)
+        if session is None:
+            return jsonify({"ok": False, "error": "扫描会话已过期，请重新扫描"}), 410
+        return _session_page(session, seq, after, page_size, wait)
+
     scan_dir = request.values.get("dir", DEFAULT_SCAN_DIR)
     with_hash = request.values.get("hash", "0") == "1"
     recursive = _parse_recursive(request.values)
-    page = max(int(request.values.get("page", "1")), 1)
-    page_size = max(int(request.values.get("page_size", str(PAGE_SIZE_DEFAULT))), 1)
     category = request.values.get("category")
     types = _parse_types(request.values)
 
     if not is_under_allowed_roots(scan_dir):
         return jsonify({"ok": False, "error": "目录不在允许的根目录内"}), 400
 
-    rows = [asdict(r) for r in iter_files(scan_dir, with_hash, category, types, recursive)]
-    total = len(rows)
-    start, end = (page - 1) * page_size, (page * page_size)
-    return jsonify({"ok": True, "data": rows[start:end], "total": total})
+    if request.values.get("stream", "0") == "1":
+        session = start_session(scan_dir, recursive, with_hash, category, types)
+        return _session_page(session, 0, None, page_size, wait)
+
+    # 兼容旧的 page 分页：刷新目录后只取当前页
+    page = max(int(request.values.get("page", "1")), 1)
+    catalog = get_catalog()
+    catalog.refresh(scan_dir, recursive=recursive, with_hash=with_hash)
+    total = catalog.count(scan_dir, recursive, category, types)
+    rows = [
+        asdict(r) for r in to_file_rows(
+            catalog.iter_rows(scan_dir, recursive, category, types, offset=(page - 1) * page_size, limit=page_size),
+            with_hash,
+        )
+    ]
+    return jsonify({"ok": True, "data": rows, "total": total})
+
+def _session_page(session, seq, after, page_size, wait):
+    rows, seq, after = session.page(seq, after, page_size, wait)
+    done = session.finished(seq)
+    return jsonify({
+        "ok": session.error is None,
+        "error": session.error,
+        "data": rows,
+        "total": session.total,
+        "total_final": session.done,
+        "done": done,
+        "cursor": None if done else encode_cursor(session.id, seq, after),
+    })
 
 @bp.get("/export_csv")
 def export_csv():
@@ -1,7 +1,9 @@
-from flask import Blueprint, request, jsonify, current_app
+import json
+
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from services.retrieval import CollectionManager
 from core.extractors import extract_chunks
-from core.chunking import index_chunks
+from core.index_jobs import get_job, replace_documents, start_job
 from core.utils.iterfiles import is_under_allowed_roots
 
 bp = Blueprint("search", __name__)
@@ -11,21 +13,69 @@ bp = Blueprint("search", __name__)
 # For simplicity in this plan, we instantiate one global here, similar to previous routes.py
 retriever = CollectionManager()
 
+def _parse_k(p):
+    try:
+        k = int(p.get("k", 10))
+    except (TypeError, ValueError):
+        raise ValueError("k 必须是正整数") from None
+    if k < 1:
+        raise ValueError("k 必须是正整数")
+    return k
+
+
 @bp.post("/search")
 def search():
     p = request.get_json(silent=True) or {}
     collection = p.get("collection", "default")
+    embeddings = p.get("query_embeddings")
+    if embeddings is None and p.get("query_embedding") is not None:
+        embeddings = [p["query_embedding"]]
+
+    try:
+        res = retriever.query(
+            collection,
+            [p.get("query", "")],
+            k=_parse_k(p),
+            where=p.get("where"),
+            where_document=p.get("where_document"),
+            search_type=p.get("search_type", "hybrid"),
+            query_embeddings=embeddings,
+            fusion=p.get("fusion"),
+        )
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+
+    return jsonify({"results": _format_hits(res)})
 
-    res = retriever.query(
-        collection,
-        [p.get("query", "")],
-        k=p.get("k", 10),
-        where=p.get("where"),
-        where_document=p.get("where_document"),
-        search_type=p.get("search_type", "hybrid"),
-    )
 
-    hits = {
+@bp.post("/search_batch")
+def search_batch():
+    p = request.get_json(silent=True) or {}
+    queries = p.get("queries") or []
+    embeddings = p.get("query_embeddings")
+    if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+        return jsonify({"ok": False, "error": "queries 必须是字符串列表"}), 400
+    if not queries and not embeddings:
+        return jsonify({"results": []})
+
+    try:
+        batch = retriever.query_batch(
+            p.get("collection", "default"),
+            queries,
+            k=_parse_k(p),
+            where=p.get("where"),
+            where_document=p.get("where_document"),
+            search_type=p.get("search_type", "hybrid"),
+            query_embeddings=embeddings,
+            fusion=p.get("fusion"),
+        )
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    return jsonify({"results": [_format_hits(res) for res in batch]})
+
+
+def _format_hits(res):
+    return {
         "ids": [h["id"] for h in res],
         "documents": [h["document"] for h in res],
         "metadatas": [h["metadata"] for h in res],
@@ -33,14 +83,84 @@ def search():
         "chunks": [h.get("chunk", {}) for h in res],
     }
 
-    return jsonify({"results": hits})
-
 @bp.post("/index")
 def index_file():
     data = request.get_json(silent=True) or {}
+    collection = data.get("collection", "default")
+    sources = data.get("paths") or data.get("dirs")
+    if sources is None and data.get("dir"):
+        sources = [data["dir"]]
+    if sources is not None:
+        return _start_index_job(data, collection, sources)
+
+    # 单个文件：同步抽取并写入
     path = data.get("path")
     if not (path and is_under_allowed_roots(path)):
         return jsonify({"ok": False, "error": "路径不合法"}), 400
     chunks = extract_chunks(path)
-    count = index_chunks(chunks, retriever)
+    count, _ = replace_documents(retriever, collection, {path: chunks})
     return jsonify({"ok": True, "chunks": count})
+
+
+def _start_index_job(data, collection, sources):
+    if isinstance(sources, str):
+        sources = [sources]
+    if not sources or not all(isinstance(s, str) and is_under_allowed_roots(s) for s in sources):
+        return jsonify({"ok": False, "error": "路径不合法"}), 400
+    types = data.get("types")
+    if isinstance(types, str):
+        types = [t for t in types.split(",") if t]
+    try:
+        batch_size = max(int(data.get("batch_size", 512)), 1)
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "batch_size 必须是整数"}), 400
+    job = start_job(
+        retriever, collection, sources,
+        recursive=bool(data.get("recursive", True)),
+        category=data.get("category"),
+        types=types,
+        batch_size=batch_size,
+    )
+    return jsonify({"ok": True, "job_id": job.id, "status": job.status()}), 202
+
+
+@bp.get("/index/jobs/<job_id>")
+def index_job_status(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"ok": False, "error": "任务不存在"}), 404
+    return jsonify({"ok": True, **job.status()})
+
+
+@bp.post("/index/jobs/<job_id>/cancel")
+def index_job_cancel(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"ok": False, "error": "任务不存在"}), 404
+    job.cancel()
+    return jsonify({"ok": True, **job.status()})
+
+
+@bp.get("/index/jobs/<job_id>/events")
+def index_job_events(job_id):
+    """Server-sent events：每隔 ``interval`` 秒推送一次进度，结束时发送 ``done`` 事件。"""
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"ok": False, "error": "任务不存在"}), 404
+    try:
+        interval = min(max(float(request.args.get("interval", "1")), 0.2), 30.0)
+    except ValueError:
+        return jsonify({"ok": False, "error": "interval 必须是数字"}), 400
+
+    def stream():
+        while True:
+            finished = job.finished
+            payload = json.dumps(job.status(), ensure_ascii=False)
+            if finished:
+                yield f"event: done\ndata: {payload}\n\n"
+                return
+            yield f"data: {payload}\n\n"
+            job.wait(interval)
+
+    return Response(stream_with_context(stream()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
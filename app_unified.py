@@ -60,6 +60,18 @@ def create_app() -> Flask:
     from api.blueprints import register_blueprints
     register_blueprints(app)
 
+    # 文件监听（settings.json 的 watcher.enabled），与 /full/search 共用同一个集合管理器
+    if (SETTINGS.get("watcher") or {}).get("enabled"):
+        from api.blueprints.search import retriever
+        from core.watcher import start_watcher
+        start_watcher(retriever)
+
+    # 规范化进程池预热（normalize.prewarm），后台启动，不阻塞应用
+    if (SETTINGS.get("normalize") or {}).get("prewarm"):
+        import threading
+        from core.normalize_pool import get_normalizer_pool
+        threading.Thread(target=lambda: get_normalizer_pool().warm(), name="normalize-warm", daemon=True).start()
+
     # --------------------------- Home ---------------------------
     # 访问根路径 → 进入完整页面（/full/ 渲染 full.html）
     @app.get("/")
@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+"""持久化文件目录（File catalog）。
+
+SQLite 中保存 ``(path, size, mtime, inode, sha256, category)``，扫描时只做增量刷新：
+
+* 目录用 ``os.scandir`` 在线程池中并行遍历；
+* 目录自身 mtime 未变化时不再列举，沿用目录表中的子目录，只逐个 stat 已知文件
+  （新增、删除、改名都会改变父目录 mtime；原地改写文件只改变文件自身的
+  size / mtime）；``deep=True`` 时总是重新列举；
+* 只对新文件或 size / mtime 变化的文件重新计算 SHA-256，哈希在写锁之外进行。
+
+数据库默认位于 ``data/catalog.db``，可用 config.toml 的 ``catalog_db`` 覆盖。
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from dateutil.tz import tzlocal
+
+from core.config import CFG, ROOT_DIR
+from core.models import CATEGORIES
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path      TEXT PRIMARY KEY,
+    dir       TEXT NOT NULL,
+    name      TEXT NOT NULL,
+    ext       TEXT NOT NULL,
+    category  TEXT NOT NULL,
+    size      INTEGER NOT NULL,
+    mtime_ns  INTEGER NOT NULL,
+    mtime_iso TEXT NOT NULL,
+    inode     INTEGER,
+    sha256    TEXT
+);
+CREATE INDEX IF NOT EXISTS files_dir ON files(dir);
+CREATE TABLE IF NOT EXISTS dirs (
+    path     TEXT PRIMARY KEY,
+    parent   TEXT,
+    mtime_ns INTEGER           -- NULL: 已发现但尚未列举
+);
+CREATE INDEX IF NOT EXISTS dirs_parent ON dirs(parent);
+CREATE TABLE IF NOT EXISTS scan_dirs (
+    session TEXT NOT NULL,
+    seq     INTEGER NOT NULL,
+    dir     TEXT NOT NULL,
+    PRIMARY KEY (session, seq)
+);
+"""
+
+_EXT_CATEGORY = {ext: cat for cat, exts in CATEGORIES.items() for ext in exts}
+_HASH_BLOCK = 1024 * 1024
+# SQLite 按 UTF-8 字节比较文本，U+10FFFF 是最大的合法字符
+_MAX_CHAR = "\U0010ffff"
+
+
+def detect_category(ext: str) -> str:
+    return _EXT_CATEGORY.get((ext or "").lower().lstrip("."), "TEXT")
+
+
+def sha256_file(path: str) -> Optional[str]:
+    h = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(_HASH_BLOCK), b""):
+                h.update(chunk)
+    except OSError:
+        return None
+    return h.hexdigest()
+
+
+def _norm(path: str) -> str:
+    return os.path.normpath(os.path.abspath(path))
+
+
+def _subtree(root: str) -> Tuple[str, str]:
+    """``path`` 区间 ``(lo, hi)``，覆盖 ``root`` 下的所有后代。"""
+
+    prefix = root if root.endswith(os.sep) else root + os.sep
+    return prefix, prefix + _MAX_CHAR
+
+
+def _list_dir(path: str) -> Tuple[int, List[Tuple[str, int, int, int]], List[str]]:
+    """列举一个目录：返回 (目录 mtime_ns, [(文件名, size, mtime_ns, inode)], [子目录])。"""
+
+    mtime_ns = os.stat(path).st_mtime_ns
+    files, subdirs = [], []
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.is_file():
+                    st = entry.stat()
+                    files.append((entry.name, st.st_size, st.st_mtime_ns, st.st_ino or entry.inode()))
+            except OSError:
+                continue
+    return mtime_ns, files, subdirs
+
+
+class FileCatalog:
+    """SQLite 文件目录，线程安全（每线程一个连接，写入串行化）。"""
+
+    def __init__(self, db_path: str | Path, workers: int | None = None) -> None:
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.workers = workers or min(32, (os.cpu_count() or 4) * 4)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # 刷新 ---------------------------------------------------------------
+    def refresh(
+        self,
+        root: str,
+        recursive: bool = True,
+        with_hash: bool = False,
+        deep: bool = False,
+        on_dir: Optional[Callable[[str], None]] = None,
+        on_change: Optional[Callable[[str, str], None]] = None,
+        stop: Optional[threading.Event] = None,
+    ) -> Dict[str, int]:
+        """增量刷新 ``root``；返回统计 ``{listed, skipped, changed, removed, hashed}``。
+
+        ``on_dir`` 在每个目录的结果提交后（于刷新线程中）被调用，可用于流式读取。
+        ``on_change(kind, path)`` 对每个新增/变化（``"upsert"``）或消失（``"delete"``）
+        的文件调用一次，同样在提交之后。``stop`` 被置位后不再遍历新的目录，尚未遍历的
+        子目录保持 mtime 为空，下次刷新时补上。
+        """
+
+        root = _norm(root)
+        stats = {"listed": 0, "skipped": 0, "changed": 0, "removed": 0, "hashed": 0}
+        changes: Optional[List[Tuple[str, str]]] = [] if on_change is not None else None
+        with self._write_lock:
+            if not os.path.isdir(root):
+                with self._conn() as conn:
+                    stats["removed"] += self._drop_tree(conn, root, changes)
+                for kind, path in changes or ():
+                    on_change(kind, path)
+                return stats
+            conn = self._conn()
+            known = self._known_dirs(conn, root, recursive)
+            tz = tzlocal()
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="catalog") as pool:
+                pending = {pool.submit(self._visit, root, known.get(root), deep)}
+                while pending:
+                    if stop is not None and stop.is_set():
+                        for fut in pending:
+                            fut.cancel()
+                        break
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    visited = []
+                    with conn:
+                        for fut in done:
+                            result = fut.result()
+                            subdirs = self._apply(conn, result, tz, stats, changes)
+                            if result[0] != "gone":
+                                visited.append(result[1])
+                            if recursive:
+                                pending |= {pool.submit(self._visit, d, known.get(d), deep) for d in subdirs}
+                    if on_dir is not None:
+                        for d in visited:
+                            on_dir(d)
+                    if changes:
+                        for kind, path in changes:
+                            on_change(kind, path)
+                        changes.clear()
+        if with_hash:
+            self._hash_missing(root, recursive, stats)
+        return stats
+
+    @staticmethod
+    def _known_dirs(conn: sqlite3.Connection, root: str, recursive: bool) -> Dict[str, Optional[int]]:
+        if recursive:
+            lo, hi = _subtree(root)
+            cur = conn.execute(
+                "SELECT path, mtime_ns FROM dirs WHERE path = ? OR (path > ? AND path < ?)", (root, lo, hi)
+            )
+        else:
+            cur = conn.execute("SELECT path, mtime_ns FROM dirs WHERE path = ?", (root,))
+        return {r["path"]: r["mtime_ns"] for r in cur}
+
+    def _visit(self, path: str, known_mtime: Optional[int], deep: bool):
+        try:
+            if not deep and known_mtime is not None and os.stat(path).st_mtime_ns == known_mtime:
+                return ("skip", path, self._stat_known(path))
+            return ("list", path) + _list_dir(path)
+        except OSError:
+            return ("gone", path)
+
+    def _stat_known(self, path: str) -> List[Tuple[str, int, int, int]]:
+        """目录未变化时逐个 stat 已编目的文件，返回 size / mtime 变化了的那些。"""
+
+        changed = []
+        for r in self._conn().execute("SELECT path, size, mtime_ns FROM files WHERE dir = ?", (path,)):
+            fn = os.path.basename(r["path"])
+            try:
+                st = os.stat(r["path"])
+            except OSError:
+                continue  # 消失的文件会改变目录 mtime，下次刷新时列举
+            if (st.st_size, st.st_mtime_ns) != (r["size"], r["mtime_ns"]):
+                changed.append((fn, st.st_size, st.st_mtime_ns, st.st_ino))
+        return changed
+
+    def _apply(self, conn: sqlite3.Connection, result, tz, stats: Dict[str, int],
+               changes: Optional[List[Tuple[str, str]]] = None) -> List[str]:
+        """在写线程中落库一个目录的结果，返回需要继续遍历的子目录。"""
+
+        kind, path = result[0], result[1]
+        if kind == "skip":
+            stats["skipped"] += 1
+            self._upsert_files(conn, path, result[2], tz, stats, changes)
+            return [r["path"] for r in conn.execute("SELECT path FROM dirs WHERE parent = ?", (path,))]
+        if kind == "gone":
+            stats["removed"] += self._drop_tree(conn, path, changes)
+            return []
+
+        mtime_ns, files, subdirs = result[2], result[3], result[4]
+        stats["listed"] += 1
+        old = {
+            r["path"]: (r["size"], r["mtime_ns"])
+            for r in conn.execute("SELECT path, size, mtime_ns FROM files WHERE dir = ?", (path,))
+        }
+        self._upsert_files(
+            conn, path, [f for f in files if old.pop(os.path.join(path, f[0]), None) != (f[1], f[2])],
+            tz, stats, changes,
+        )
+        if old:
+            conn.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in old])
+            stats["removed"] += len(old)
+            if changes is not None:
+                changes.extend(("delete", p) for p in old)
+
+        existing = {r["path"] for r in conn.execute("SELECT path FROM dirs WHERE parent = ?", (path,))}
+        for gone in existing.difference(subdirs):
+            stats["removed"] += self._drop_tree(conn, gone, changes)
+        conn.executemany(
+            "INSERT OR IGNORE INTO dirs (path, parent, mtime_ns) VALUES (?, ?, NULL)",
+            [(d, path) for d in subdirs if d not in existing],
+        )
+        conn.execute(
+            "INSERT INTO dirs (path, parent, mtime_ns) VALUES (?, ?, ?)"
+            " ON CONFLICT(path) DO UPDATE SET mtime_ns = excluded.mtime_ns",
+            (path, os.path.dirname(path), mtime_ns),
+        )
+        return subdirs
+
+    @staticmethod
+    def _upsert_files(conn: sqlite3.Connection, path: str, files: List[Tuple[str, int, int, int]], tz,
+                      stats: Dict[str, int], changes: Optional[List[Tuple[str, str]]]) -> None:
+        upserts = []
+        for fn, size, f_mtime, inode in files:
+            name, ext = os.path.splitext(fn)
+            ext = ext.lower().lstrip(".")
+            iso = datetime.fromtimestamp(f_mtime / 1e9, tz).isoformat(timespec="seconds")
+            upserts.append((
+                os.path.join(path, fn), path, name, ext, detect_category(ext),
+                size, f_mtime, iso, inode,
+            ))
+        if not upserts:
+            return
+        # 内容可能已变化：sha256 置空，等待按需重算
+        conn.executemany(
+            "INSERT OR REPLACE INTO files (path, dir, name, ext, category, size, mtime_ns, mtime_iso, inode, sha256)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, NULL)",
+            upserts,
+        )
+        stats["changed"] += len(upserts)
+        if changes is not None:
+            changes.extend(("upsert", u[0]) for u in upserts)
+
+    @staticmethod
+    def _drop_tree(conn: sqlite3.Connection, path: str,
+                   changes: Optional[List[Tuple[str, str]]] = None) -> int:
+        lo, hi = _subtree(path)
+        if changes is not None:
+            cur = conn.execute("SELECT path FROM files WHERE path > ? AND path < ?", (lo, hi))
+            changes.extend(("delete", r["path"]) for r in cur)
+        n = conn.execute("DELETE FROM files WHERE path > ? AND path < ?", (lo, hi)).rowcount
+        conn.execute("DELETE FROM dirs WHERE path = ? OR (path > ? AND path < ?)", (path, lo, hi))
+        return n
+
+    def _hash_missing(self, root: str, recursive: bool, stats: Dict[str, int]) -> None:
+        """计算缺失的 SHA-256；哈希不持有写锁，只在短事务中落库。"""
+
+        conn = self._conn()
+        where, args = self._scope(root, recursive)
+        todo = conn.execute(f"SELECT path, size, mtime_ns FROM files WHERE {where} AND sha256 IS NULL",
+                            args).fetchall()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="catalog-hash") as pool:
+            done = []
+            for row, digest in zip(todo, pool.map(sha256_file, [r["path"] for r in todo])):
+                if digest is not None:
+                    done.append((digest, row["path"], row["size"], row["mtime_ns"]))
+                if len(done) >= 256 or (done and row is todo[-1]):
+                    # 哈希期间文件又被刷新成新的 size / mtime 时不写入
+                    with self._write_lock, conn:
+                        stats["hashed"] += conn.executemany(
+                            "UPDATE files SET sha256 = ? WHERE path = ? AND size = ? AND mtime_ns = ?", done
+                        ).rowcount
+                    done = []
+
+    # 查询 ---------------------------------------------------------------
+    @staticmethod
+    def _scope(root: str, recursive: bool) -> Tuple[str, Tuple[Any, ...]]:
+        if recursive:
+            lo, hi = _subtree(root)
+            return "(path > ? AND path < ?)", (lo, hi)
+        return "dir = ?", (root,)
+
+    def _filters(self, root: str, recursive: bool, category: Optional[str],
+                 types: Optional[Iterable[str]]) -> Tuple[str, List[Any]]:
+        where, args = self._scope(_norm(root), recursive)
+        return self._narrow(where, list(args), category, types)
+
+    @staticmethod
+    def _narrow(where: str, params: List[Any], category: Optional[str],
+                types: Optional[Iterable[str]]) -> Tuple[str, List[Any]]:
+        if category:
+            where += " AND category = ?"
+            params.append(category)
+        if types:
+            exts = sorted({t.lower().lstrip(".") for t in types})
+            where += f" AND ext IN ({','.join('?' * len(exts))})"
+            params.extend(exts)
+        return where, params
+
+    def iter_rows(self, root: str, recursive: bool = True, category: Optional[str] = None,
+                  types: Optional[Iterable[str]] = None, offset: int = 0,
+                  limit: Optional[int] = None) -> Iterator[sqlite3.Row]:
+        """按路径顺序返回 ``root`` 下已编目的文件（可选 offset / limit 分页）。"""
+
+        where, params = self._filters(root, recursive, category, types)
+        sql = f"SELECT * FROM files WHERE {where} ORDER BY path"
+        if limit is not None or offset:
+            sql += " LIMIT ? OFFSET ?"
+            params += [-1 if limit is None else limit, offset]
+        yield from self._conn().execute(sql, params)
+
+    def dir_rows(self, dir_path: str, category: Optional[str] = None, types: Optional[Iterable[str]] = None,
+                 after: Optional[str] = None, limit: int = -1) -> List[sqlite3.Row]:
+        """单个目录内 ``path > after`` 的文件，按路径排序。"""
+
+        where, params = self._narrow("dir = ?", [dir_path], category, types)
+        if after is not None:
+            where += " AND path > ?"
+            params.append(after)
+        return self._conn().execute(
+            f"SELECT * FROM files WHERE {where} ORDER BY path LIMIT ?", params + [limit]
+        ).fetchall()
+
+    def count_dir(self, dir_path: str, category: Optional[str] = None,
+                  types: Optional[Iterable[str]] = None) -> int:
+        where, params = self._narrow("dir = ?", [dir_path], category, types)
+        return self._conn().execute(f"SELECT COUNT(*) FROM files WHERE {where}", params).fetchone()[0]
+
+    # 扫描会话的目录序列 -------------------------------------------------
+    def add_session_dir(self, session: str, seq: int, dir_path: str) -> None:
+        with self._conn() as conn:
+            conn.execute("INSERT OR REPLACE INTO scan_dirs (session, seq, dir) VALUES (?, ?, ?)",
+                         (session, seq, dir_path))
+
+    def session_dir(self, session: str, seq: int) -> Optional[str]:
+        row = self._conn().execute(
+            "SELECT dir FROM scan_dirs WHERE session = ? AND seq = ?", (session, seq)
+        ).fetchone()
+        return row["dir"] if row else None
+
+    def drop_session(self, session: str) -> None:
+        with self._conn() as conn:
+            conn.execute("DELETE FROM scan_dirs WHERE session = ?", (session,))
+
+    def count(self, root: str, recursive: bool = True, category: Optional[str] = None,
+              types: Optional[Iterable[str]] = None) -> int:
+        where, params = self._filters(root, recursive, category, types)
+        return self._conn().execute(f"SELECT COUNT(*) FROM files WHERE {where}", params).fetchone()[0]
+
+
+_CATALOG: FileCatalog | None = None
+_CATALOG_LOCK = threading.Lock()
+
+
+def get_catalog() -> FileCatalog:
+    """全局目录实例（首次使用时创建数据库）。"""
+
+    global _CATALOG
+    with _CATALOG_LOCK:
+        if _CATALOG is None:
+            db = Path(CFG.get("catalog_db", "data/catalog.db"))
+            if not db.is_absolute():
+                db = ROOT_DIR / db
+            _CATALOG = FileCatalog(db, workers=CFG.get("scan_workers"))
+        return _CATALOG
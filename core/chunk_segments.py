@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+"""Append-only, segmented chunk storage.
+
+Every :meth:`SegmentStore.append` call writes one new immutable segment
+instead of rewriting the whole table::
+
+    <directory>/
+        manifest.json             # live segments, tombstones, next sequence
+        seg-000001.parquet        # chunk rows (or seg-000001.jsonl)
+        seg-000001.vec            # clip vectors as raw float32 matrices
+        seg-000002.parquet
+        ...
+
+Chunk rows go to a Parquet file (one row group) when ``pyarrow`` is
+installed and to JSON lines otherwise.  ``metadata["clip_vector"]`` is moved
+out of the row into a ``*.vec`` array container (see
+:mod:`services.retrieval.storage`), one ``float32`` matrix per dimension, so
+vectors are neither stored as text nor parsed when only text is needed.
+
+:meth:`SegmentStore.delete` only records tombstones.  A tombstone hides an id
+in segments written *before* it, so re-adding a deleted id works.  When more
+than ``max_small_segments`` segments below ``small_rows`` accumulate, a
+background thread merges each run of consecutive small segments into one,
+dropping tombstoned and overwritten rows; the manifest is switched
+atomically and the replaced files are removed afterwards.
+"""
+
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from core.chunking import Chunk
+from core.config import ROOT_DIR
+
+try:  # optional: Parquet segments
+    import pyarrow as pa  # type: ignore
+    import pyarrow.parquet as pq  # type: ignore
+except ImportError:  # pragma: no cover - depends on the environment
+    pa = pq = None
+
+try:  # optional: clip vectors as float32 matrices
+    import numpy as np  # type: ignore
+except ImportError:  # pragma: no cover - depends on the environment
+    np = None
+
+from services.retrieval.storage import read_arrays, write_arrays
+
+logger = logging.getLogger(__name__)
+
+_JSON_COLUMNS = ("section_path", "span", "metadata")
+
+
+def _to_row(ch: Chunk | Dict[str, Any]) -> Tuple[Dict[str, Any], Any]:
+    d = ch.to_dict() if isinstance(ch, Chunk) else dict(ch)
+    meta = dict(d.get("metadata") or {})
+    vec = None
+    if np is not None and isinstance(meta.get("clip_vector"), (list, tuple)) and meta["clip_vector"]:
+        vec = meta.pop("clip_vector")
+    d["metadata"] = meta
+    return d, vec
+
+
+def _from_row(row: Dict[str, Any], vec: Any = None) -> Chunk:
+    meta = dict(row.get("metadata") or {})
+    if vec is not None:
+        meta["clip_vector"] = [float(x) for x in vec]
+    return Chunk(
+        id=row["id"],
+        doc_id=row.get("doc_id", ""),
+        text=row.get("text", ""),
+        page=row.get("page"),
+        section_path=tuple(row.get("section_path") or ()),
+        span=tuple(row["span"]) if row.get("span") else None,
+        metadata=meta,
+    )
+
+
+class SegmentStore:
+    """Append-only chunk store made of immutable segments (see module docs)."""
+
+    def __init__(self, directory: str | Path, small_rows: int = 4096, max_small_segments: int = 8,
+                 background: bool = True) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.small_rows = small_rows
+        self.max_small_segments = max_small_segments
+        self.background = background
+        self._lock = threading.RLock()
+        self._compacting: Optional[threading.Thread] = None
+        self._manifest = self._read_manifest()
+        self._remove_garbage()
+
+    # Manifest ------------------------------------------------------------
+    def _read_manifest(self) -> Dict[str, Any]:
+        try:
+            m = json.loads((self.directory / "manifest.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            m = {}
+        m.setdefault("next", 1)
+        m.setdefault("segments", [])
+        m.setdefault("tombstones", {})
+        m.setdefault("garbage", [])
+        return m
+
+    def _write_manifest(self) -> None:
+        tmp = self.directory / "manifest.json.tmp"
+        tmp.write_text(json.dumps(self._manifest, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.directory / "manifest.json")
+
+    def _remove_garbage(self) -> None:
+        with self._lock:
+            left = []
+            for name in self._manifest["garbage"]:
+                try:
+                    (self.directory / name).unlink(missing_ok=True)
+                except OSError:  # still open elsewhere (Windows); retry later
+                    left.append(name)
+            if left != self._manifest["garbage"]:
+                self._manifest["garbage"] = left
+                self._write_manifest()
+
+    @property
+    def segments(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(s) for s in self._manifest["segments"]]
+
+    # Segment files -------------------------------------------------------
+    def _write_segment(self, seq: int, rows: List[Dict[str, Any]], vectors: List[Tuple[int, Any]],
+                       tag: str = "") -> Dict[str, Any]:
+        stem = f"seg-{seq:06d}{tag}"
+        if pa is not None:
+            name = stem + ".parquet"
+            cols = {k: [r.get(k) for r in rows] for k in ("id", "doc_id", "text", "page")}
+            for k in _JSON_COLUMNS:
+                cols[k] = [json.dumps(r.get(k), ensure_ascii=False, default=str) for r in rows]
+            pq.write_table(pa.table(cols), self.directory / name, row_group_size=max(len(rows), 1))
+        else:
+            name = stem + ".jsonl"
+            with open(self.directory / name, "w", encoding="utf-8") as f:
+                for r in rows:
+                    f.write(json.dumps(r, ensure_ascii=False, default=str) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        seg = {"seq": seq, "file": name, "rows": len(rows)}
+        if vectors:
+            by_dim: Dict[int, List[Tuple[int, Any]]] = {}
+            for row, vec in vectors:
+                by_dim.setdefault(len(vec), []).append((row, vec))
+            arrays = {}
+            for dim, items in by_dim.items():
+                arrays[f"rows_{dim}"] = np.asarray([r for r, _ in items], dtype=np.int64)
+                arrays[f"vectors_{dim}"] = np.asarray([v for _, v in items], dtype=np.float32).reshape(len(items), dim)
+            write_arrays(self.directory / (stem + ".vec"), arrays, {"rows": len(rows)})
+            seg["vec"] = stem + ".vec"
+        return seg
+
+    def _read_segment(self, seg: Dict[str, Any]) -> Iterator[Tuple[Dict[str, Any], Any]]:
+        vecs: Dict[int, Any] = {}
+        if seg.get("vec"):
+            _, arrays = read_arrays(self.directory / seg["vec"])
+            for key, rows in arrays.items():
+                if key.startswith("rows_"):
+                    mat = arrays["vectors_" + key[5:]]
+                    vecs.update((int(r), mat[i]) for i, r in enumerate(rows))
+        path = self.directory / seg["file"]
+        if seg["file"].endswith(".parquet"):
+            if pq is None:
+                raise RuntimeError(f"pyarrow is required to read {path}")
+            for i, r in enumerate(pq.read_table(path).to_pylist()):
+                for k in _JSON_COLUMNS:
+                    r[k] = json.loads(r[k]) if r.get(k) else None
+                yield r, vecs.get(i)
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                for i, line in enumerate(f):
+                    yield json.loads(line), vecs.get(i)
+
+    # Public API ----------------------------------------------------------
+    def append(self, chunks: Iterable[Chunk | Dict[str, Any]]) -> int:
+        """Write ``chunks`` as a new segment; returns the number of rows."""
+
+        rows, vectors = [], []
+        for ch in chunks:
+            row, vec = _to_row(ch)
+            if vec is not None:
+                vectors.append((len(rows), vec))
+            rows.append(row)
+        if not rows:
+            return 0
+        with self._lock:
+            seq = self._manifest["next"]
+            self._manifest["next"] = seq + 1
+            seg = self._write_segment(seq, rows, vectors)
+            self._manifest["segments"].append(seg)
+            self._write_manifest()
+        self._maybe_compact()
+        return len(rows)
+
+    def delete(self, ids: Iterable[str]) -> None:
+        """Tombstone ``ids`` in every segment written so far."""
+
+        with self._lock:
+            seq = self._manifest["next"]
+            self._manifest["tombstones"].update({i: seq for i in ids})
+            self._write_manifest()
+
+    def _live(self, segments: List[Dict[str, Any]], tombstones: Dict[str, int]) -> Iterator[Tuple[Dict[str, Any], Any]]:
+        seen: set[str] = set()
+        for seg in reversed(segments):  # newest first: the latest write wins
+            for row, vec in self._read_segment(seg):
+                id_ = row["id"]
+                if id_ in seen or tombstones.get(id_, 0) > seg["seq"]:
+                    continue
+                seen.add(id_)
+                yield row, vec
+
+    def iter_chunks(self) -> Iterator[Chunk]:
+        """Live chunks (newest version of each id, tombstones applied)."""
+
+        with self._lock:
+            segments = list(self._manifest["segments"])
+            tombstones = dict(self._manifest["tombstones"])
+        for row, vec in self._live(segments, tombstones):
+            yield _from_row(row, vec)
+
+    # Compaction ----------------------------------------------------------
+    def _small_runs(self) -> List[List[Dict[str, Any]]]:
+        runs: List[List[Dict[str, Any]]] = [[]]
+        for seg in self._manifest["segments"]:
+            if seg["rows"] < self.small_rows:
+                runs[-1].append(seg)
+            elif runs[-1]:
+                runs.append([])
+        return [r for r in runs if len(r) > 1]
+
+    def _maybe_compact(self) -> None:
+        with self._lock:
+            small = sum(1 for s in self._manifest["segments"] if s["rows"] < self.small_rows)
+            if small <= self.max_small_segments:
+                return
+            if self._compacting is not None and self._compacting.is_alive():
+                return
+            if not self.background:
+                self.compact()
+                return
+            self._compacting = threading.Thread(target=self._compact_quietly, name="chunk-compact", daemon=True)
+            self._compacting.start()
+
+    def _compact_quietly(self) -> None:
+        try:
+            self.compact()
+        except Exception:
+            logger.exception("compacting %s failed", self.directory)
+
+    def compact(self, full: bool = False) -> int:
+        """Merge runs of small segments (or everything with ``full``).
+
+        Returns the number of segments replaced.
+        """
+
+        with self._lock:
+            runs = [list(self._manifest["segments"])] if full else self._small_runs()
+            tombstones = dict(self._manifest["tombstones"])
+        replaced = 0
+        for run in runs:
+            if not run or (len(run) == 1 and not full):
+                continue
+            # the merged segment keeps the newest sequence of the run, so its
+            # position relative to segments outside the run is unchanged
+            rows, vectors = [], []
+            for row, vec in self._live(run, tombstones):
+                if vec is not None:
+                    vectors.append((len(rows), vec))
+                rows.append(row)
+            rows.reverse()
+            vectors = [(len(rows) - 1 - i, v) for i, v in vectors]
+            top = run[-1]["seq"]
+            with self._lock:
+                merged = []
+                if rows:
+                    merged = [self._write_segment(top, rows, vectors, tag=f".c{self._manifest['next']}")]
+                    self._manifest["next"] += 1
+                segs = self._manifest["segments"]
+                idx = next(i for i, s in enumerate(segs) if s["file"] == run[0]["file"])
+                self._manifest["segments"] = segs[:idx] + merged + segs[idx + len(run):]
+                for s in run:
+                    self._manifest["garbage"] += [s["file"]] + ([s["vec"]] if s.get("vec") else [])
+                # tombstones older than every remaining segment have nothing left to hide
+                oldest = min((s["seq"] for s in self._manifest["segments"]), default=None)
+                self._manifest["tombstones"] = {
+                    i: t for i, t in self._manifest["tombstones"].items() if oldest is not None and t > oldest
+                }
+                self._write_manifest()
+                replaced += len(run)
+        self._remove_garbage()
+        return replaced
+
+
+_STORES: Dict[Path, SegmentStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_segment_store(directory: str | Path = "data/chunks") -> SegmentStore:
+    """Shared store per directory (relative paths are under the project root)."""
+
+    path = Path(directory)
+    if not path.is_absolute():
+        path = ROOT_DIR / path
+    with _STORES_LOCK:
+        store = _STORES.get(path)
+        if store is None:
+            store = _STORES[path] = SegmentStore(path)
+        return store
+
+
+__all__ = ["SegmentStore", "get_segment_store"]
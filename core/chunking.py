@@ -1,10 +1,21 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
-"""Utilities and data structures for chunk based indexing."""
+"""Utilities and data structures for chunk based indexing.
 
+Besides the :class:`Chunk` container this module holds the structure-aware
+chunking stage.  Plugins that implement ``iter_sections(path)`` stream their
+document as :class:`Section` objects (a heading, page, slide or sheet block);
+:func:`chunk_sections` packs them into chunks of at most ``max_tokens``
+tokens with ``overlap_tokens`` of trailing context carried into the next
+chunk.  Chunks never cross a ``section_path`` change but may span several
+pages of the same section.  Work is streaming: only the current section and
+the chunk being filled are held in memory.
+"""
+
+import re
 from dataclasses import dataclass, field
-from typing import Dict, Any, Iterable, Tuple, List
-import json
+from pathlib import Path
+from typing import Dict, Any, Iterable, Iterator, Tuple, List
 
 
 @dataclass
@@ -59,52 +70,190 @@ class Chunk:
         }
 
 
-def persist_chunks(
-    chunks: Iterable[Chunk],
-    chunks_path: str = "chunks.parquet",
-    vec_index_path: str = "vec.index",
-) -> None:
-    """Persist chunks and vector data to disk.
-
-    ``chunks_path`` stores a table of chunk metadata while ``vec_index_path``
-    keeps a minimal vector index mapping chunk id to the stored embedding.
-    Both operations are best-effort; if optional dependencies such as
-    ``pandas`` are missing the function silently falls back to JSON lines.
+@dataclass
+class Section:
+    """A structural block of a document as streamed by a plugin."""
+
+    text: str
+    section_path: Tuple[str, ...] = ()
+    page: int | None = None
+
+
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+# budget tokens: one per Latin/digit word, one per CJK character
+_TOKEN_RE = re.compile(rf"[{_CJK}]|[^\W_{_CJK}]+")
+_LINE_RE = re.compile(r"[^\n]+")
+_SENTENCE_RE = re.compile(r"[^。！？!?；;.]+(?:[。！？!?；;]+|\.(?=\s|$))?\s*|[。！？!?；;.]+\s*")
+
+
+def count_tokens(text: str) -> int:
+    """Approximate token count used for chunk budgets."""
+
+    return sum(1 for _ in _TOKEN_RE.finditer(text))
+
+
+@dataclass
+class _Unit:
+    text: str
+    sep: str  # original text between the previous unit and this one
+    start: int
+    end: int
+    tokens: int
+    page: int | None
+
+
+def _windows(text: str, base: int, max_tokens: int, overlap: int) -> Iterator[Tuple[int, int]]:
+    """Split an over-long piece into token windows; yields relative spans."""
+
+    spans = [m.span() for m in _TOKEN_RE.finditer(text)]
+    if not spans:
+        yield 0, len(text)
+        return
+    step = max(max_tokens - overlap, 1)
+    i = 0
+    while i < len(spans):
+        j = min(i + max_tokens, len(spans))
+        start = 0 if i == 0 else spans[i][0]
+        end = len(text) if j == len(spans) else spans[j][0]
+        yield start, end
+        if j == len(spans):
+            return
+        i += step
+
+
+def _units(section: Section, offset: int, max_tokens: int, overlap: int) -> Iterator[_Unit]:
+    text = section.text
+    prev_end = None
+    for line in _LINE_RE.finditer(text):
+        pieces: List[Tuple[int, int]] = [line.span()]
+        if count_tokens(line.group(0)) > max_tokens:
+            pieces = []
+            for sent in _SENTENCE_RE.finditer(line.group(0)):
+                s0, s1 = sent.start() + line.start(), sent.end() + line.start()
+                if count_tokens(sent.group(0)) > max_tokens:
+                    pieces.extend((s0 + a, s0 + b) for a, b in _windows(sent.group(0), s0, max_tokens, overlap))
+                else:
+                    pieces.append((s0, s1))
+        for a, b in pieces:
+            piece = text[a:b]
+            if not piece.strip():
+                continue
+            if prev_end is None:
+                sep = "\n"
+            elif a >= prev_end:
+                sep = text[prev_end:a]
+            else:  # overlapping token windows
+                sep = " "
+            prev_end = b
+            yield _Unit(piece, sep, offset + a, offset + b, count_tokens(piece), section.page)
+
+
+def chunk_sections(
+    doc_id: str,
+    sections: Iterable[Section],
+    max_tokens: int = 512,
+    overlap_tokens: int = 64,
+    metadata: Dict[str, Any] | None = None,
+) -> Iterator[Chunk]:
+    """Pack streamed ``sections`` into token-bounded, overlapping chunks.
+
+    ``span`` is the character range of the chunk in the document formed by
+    joining all section texts with ``"\\n"``; ``page`` is the first page the
+    chunk touches (``metadata["page_end"]`` the last, when different).
     """
 
-    chunk_list = list(chunks)
+    max_tokens = max(int(max_tokens), 1)
+    overlap_tokens = max(min(int(overlap_tokens), max_tokens - 1), 0)
+    buf: List[_Unit] = []
+    tokens = 0
+    path: Tuple[str, ...] | None = None
+    n = 0
+    offset = 0
+    fresh = False  # buffer holds more than carried-over overlap
+
+    def emit() -> Chunk:
+        nonlocal n
+        text = buf[0].text + "".join(u.sep + u.text for u in buf[1:])
+        meta = dict(metadata or {})
+        meta["tokens"] = tokens
+        pages = [u.page for u in buf if u.page is not None]
+        if pages and pages[-1] != pages[0]:
+            meta["page_end"] = pages[-1]
+        ch = Chunk(
+            id=f"{doc_id}#c{n}", doc_id=doc_id, text=text,
+            page=pages[0] if pages else None, section_path=path or (),
+            span=(buf[0].start, buf[-1].end), metadata=meta,
+        )
+        n += 1
+        return ch
+
+    def carry() -> None:
+        nonlocal buf, tokens
+        keep: List[_Unit] = []
+        kept = 0
+        for u in reversed(buf):
+            if kept + u.tokens > overlap_tokens:
+                break
+            keep.insert(0, u)
+            kept += u.tokens
+        buf, tokens = keep, kept
+
+    for section in sections:
+        sp = tuple(section.section_path)
+        if sp != path:
+            if fresh:
+                yield emit()
+            buf, tokens, fresh, path = [], 0, False, sp
+        for unit in _units(section, offset, max_tokens, overlap_tokens):
+            if fresh and tokens + unit.tokens > max_tokens:
+                yield emit()
+                carry()
+                fresh = False
+            while buf and tokens + unit.tokens > max_tokens:  # overlap would not fit
+                tokens -= buf.pop(0).tokens
+            buf.append(unit)
+            tokens += unit.tokens
+            fresh = True
+        offset += len(section.text) + 1
+    if fresh:
+        yield emit()
+
+
+def sections_text(sections: Iterable[Section], max_chars: int) -> str:
+    """First ``max_chars`` characters of the streamed document."""
+
+    parts: List[str] = []
+    size = 0
+    for section in sections:
+        if not section.text:
+            continue
+        parts.append(section.text)
+        size += len(section.text) + 1
+        if size >= max_chars:
+            break
+    return "\n".join(parts)[:max_chars]
+
+
+def persist_chunks(chunks: Iterable[Chunk], directory: str | Path = "data/chunks") -> int:
+    """Append chunks to the segment store in ``directory``.
+
+    Each call writes one new segment (Parquet when ``pyarrow`` is available,
+    JSON lines otherwise) plus a float32 ``.vec`` file for ``clip_vector``
+    metadata; existing data is never rewritten.  Relative directories are
+    resolved against the project root.  See :mod:`core.chunk_segments`.
+    """
+
+    from core.chunk_segments import get_segment_store
 
-    # -------- chunks.parquet --------
-    rows = [ch.to_dict() for ch in chunk_list]
-    try:  # Try Parquet via pandas
-        import pandas as pd  # type: ignore
-
-        df = pd.DataFrame(rows)
-        df.to_parquet(chunks_path, index=False)
-    except Exception:
-        # Fallback to JSON lines
-        with open(chunks_path, "w", encoding="utf-8") as f:
-            for row in rows:
-                f.write(json.dumps(row, ensure_ascii=False) + "\n")
-
-    # -------- vec.index --------
-    vectors = {
-        ch.id: ch.metadata.get("clip_vector")
-        for ch in chunk_list
-        if ch.metadata.get("clip_vector") is not None
-    }
-    if vectors:
-        with open(vec_index_path, "w", encoding="utf-8") as f:
-            json.dump(vectors, f)
+    return get_segment_store(directory).append(chunks)
 
 
 def index_chunks(
     chunks: Iterable[Chunk],
     retriever=None,
-    chunks_path: str = "chunks.parquet",
-    vec_index_path: str = "vec.index",
+    directory: str | Path = "data/chunks",
 ) -> int:
-    """Upsert chunks into the retriever and persist to disk.
+    """Upsert chunks into the retriever and append them to disk.
 
     Parameters
     ----------
@@ -112,8 +261,8 @@ def index_chunks(
         Iterable of :class:`Chunk` objects.
     retriever:
         Optional retrieval backend implementing ``upsert``.
-    chunks_path, vec_index_path:
-        Destination files for persisted data.
+    directory:
+        Segment store receiving the chunks (see :func:`persist_chunks`).
 
     Returns
     -------
@@ -124,8 +273,11 @@ def index_chunks(
     chunk_list = list(chunks)
     if retriever is not None:
         retriever.upsert([ch.to_retriever_dict() for ch in chunk_list])
-    persist_chunks(chunk_list, chunks_path, vec_index_path)
+    persist_chunks(chunk_list, directory)
     return len(chunk_list)
 
 
-__all__ = ["Chunk", "persist_chunks", "index_chunks"]
+__all__ = [
+    "Chunk", "Section", "count_tokens", "chunk_sections", "sections_text",
+    "persist_chunks", "index_chunks",
+]
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""插件抽取结果缓存。
+
+``ExtractorPlugin.extract`` 的结果（text / meta / chunks）按
+``(文件指纹, 插件名, 插件版本, max_chars)`` 存入 SQLite（分块结果以分块参数代替
+``max_chars``，见 :func:`cached_call`），值为 zlib 压缩的 JSON。
+文件指纹默认取 ``(st_dev, st_ino, st_size, st_mtime_ns)``，调用方已知 SHA-256 时
+可改用内容哈希，此时不同路径下的相同文件共用一条记录（命中时把分块 id / doc_id
+中的原路径替换为当前路径）。
+
+总大小超过 ``extract_cache_max_mb``（默认 512MB）时按最近访问时间淘汰最旧的
+记录。数据库默认位于 ``data/extract_cache.db``，可用 config.toml 的
+``extract_cache_db`` 覆盖；``extract_cache = false`` 关闭缓存。
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from core.chunking import Chunk
+from core.config import CFG, ROOT_DIR
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS extract_cache (
+    key         TEXT PRIMARY KEY,
+    path        TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    last_access REAL NOT NULL,
+    value       BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS extract_cache_access ON extract_cache(last_access);
+-- 总大小由触发器维护：抽取工作进程各自写入同一个库，进程内计数并不可靠
+CREATE TABLE IF NOT EXISTS extract_cache_meta (
+    name  TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO extract_cache_meta (name, value)
+    SELECT 'total', COALESCE(SUM(size), 0) FROM extract_cache;
+CREATE TRIGGER IF NOT EXISTS extract_cache_added AFTER INSERT ON extract_cache BEGIN
+    UPDATE extract_cache_meta SET value = value + NEW.size WHERE name = 'total';
+END;
+CREATE TRIGGER IF NOT EXISTS extract_cache_removed AFTER DELETE ON extract_cache BEGIN
+    UPDATE extract_cache_meta SET value = value - OLD.size WHERE name = 'total';
+END;
+"""
+
+_TOUCH_INTERVAL = 60.0  # 秒；命中时最多这么久更新一次访问时间，减少写入
+_EVICT_BATCH = 64
+
+
+def fingerprint(path: str, sha256: Optional[str] = None) -> Optional[str]:
+    """文件指纹；文件不存在时返回 ``None``。"""
+
+    if sha256:
+        return f"sha256:{sha256}"
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return f"stat:{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def _encode(result: Dict[str, Any]) -> bytes:
+    chunks = [c.to_dict() if isinstance(c, Chunk) else c for c in result.get("chunks") or []]
+    payload = {"text": result.get("text") or "", "meta": result.get("meta") or {}, "chunks": chunks}
+    return zlib.compress(json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8"))
+
+
+def _rebase(value: str, old: str, new: str) -> str:
+    return new + value[len(old):] if old != new and value.startswith(old) else value
+
+
+def _decode(blob: bytes, old_path: str, path: str) -> Dict[str, Any]:
+    payload = json.loads(zlib.decompress(blob).decode("utf-8"))
+    chunks = []
+    for d in payload.get("chunks") or []:
+        chunks.append(Chunk(
+            id=_rebase(d["id"], old_path, path),
+            doc_id=_rebase(d["doc_id"], old_path, path),
+            text=d.get("text", ""),
+            page=d.get("page"),
+            section_path=tuple(d.get("section_path") or ()),
+            span=tuple(d["span"]) if d.get("span") else None,
+            metadata=d.get("metadata") or {},
+        ))
+    payload["chunks"] = chunks
+    return payload
+
+
+class ExtractCache:
+    """大小受限的抽取结果缓存，线程安全（每线程一个连接）。"""
+
+    def __init__(self, db_path: str | Path, max_bytes: int = 512 * 1024 * 1024) -> None:
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+        self.hits = 0
+        self.misses = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def key(fp: str, plugin: str, version: str, variant: Any) -> str:
+        return f"{fp}|{plugin}|{version}|{variant}"
+
+    def get(self, key: str, path: str) -> Optional[Dict[str, Any]]:
+        conn = self._conn()
+        row = conn.execute("SELECT path, last_access, value FROM extract_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        now = time.time()
+        if now - row[1] > _TOUCH_INTERVAL:
+            with conn:
+                conn.execute("UPDATE extract_cache SET last_access = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return _decode(row[2], row[0], path)
+
+    def put(self, key: str, path: str, result: Dict[str, Any]) -> None:
+        blob = _encode(result)
+        if len(blob) > self.max_bytes:
+            return
+        conn = self._conn()
+        with self._lock, conn:
+            # 立即取得写锁，总大小的读取与淘汰在同一事务内，不受其他进程干扰
+            conn.execute("BEGIN IMMEDIATE")
+            # 先删后插（不用 INSERT OR REPLACE），让删除触发器扣掉旧条目的大小
+            conn.execute("DELETE FROM extract_cache WHERE key = ?", (key,))
+            conn.execute(
+                "INSERT INTO extract_cache (key, path, size, last_access, value) VALUES (?, ?, ?, ?, ?)",
+                (key, path, len(blob), time.time(), blob),
+            )
+            total = self._read_total(conn)
+            if total > self.max_bytes:
+                self._evict(conn, total, int(self.max_bytes * 0.9))
+
+    @staticmethod
+    def _read_total(conn: sqlite3.Connection) -> int:
+        row = conn.execute("SELECT value FROM extract_cache_meta WHERE name = 'total'").fetchone()
+        return int(row[0]) if row else 0
+
+    @staticmethod
+    def _evict(conn: sqlite3.Connection, total: int, target: int) -> None:
+        while total > target:
+            rows = conn.execute(
+                "SELECT key, size FROM extract_cache ORDER BY last_access LIMIT ?", (_EVICT_BATCH,)
+            ).fetchall()
+            if not rows:
+                return
+            drop = []
+            for key, size in rows:
+                drop.append((key,))
+                total -= size
+                if total <= target:
+                    break
+            conn.executemany("DELETE FROM extract_cache WHERE key = ?", drop)
+
+    def clear(self) -> None:
+        with self._lock, self._conn() as conn:
+            conn.execute("DELETE FROM extract_cache")
+
+    @property
+    def total_bytes(self) -> int:
+        """所有进程写入的条目总大小（读自数据库）。"""
+
+        return self._read_total(self._conn())
+
+
+_CACHE: Optional[ExtractCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_extract_cache() -> Optional[ExtractCache]:
+    """全局缓存实例；配置关闭或数据库无法打开时返回 ``None``。"""
+
+    global _CACHE
+    if CFG.get("extract_cache", True) is False:
+        return None
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            db = Path(CFG.get("extract_cache_db", "data/extract_cache.db"))
+            if not db.is_absolute():
+                db = ROOT_DIR / db
+            try:
+                _CACHE = ExtractCache(db, int(float(CFG.get("extract_cache_max_mb", 512)) * 1024 * 1024))
+            except (OSError, sqlite3.Error):
+                logger.exception("extract cache unavailable")
+                return None
+        return _CACHE
+
+
+def _lookup(plugin, path: str, variant: Any, sha256: Optional[str]):
+    """返回 ``(cache, key, 命中结果)``；缓存不可用时 ``cache`` 为 ``None``。"""
+
+    cache = get_extract_cache()
+    fp = fingerprint(path, sha256) if cache is not None else None
+    if fp is None:
+        return None, None, None
+    key = ExtractCache.key(fp, getattr(plugin, "name", type(plugin).__name__),
+                           str(getattr(plugin, "version", "")), variant)
+    try:
+        return cache, key, cache.get(key, path)
+    except (sqlite3.Error, ValueError, zlib.error):
+        logger.warning("extract cache read failed for %s", path, exc_info=True)
+        return cache, key, None
+
+
+def _store(cache: ExtractCache, key: str, path: str, res: Dict[str, Any]) -> None:
+    try:
+        cache.put(key, path, res)
+    except sqlite3.Error:
+        logger.warning("extract cache write failed for %s", path, exc_info=True)
+
+
+def cached_call(plugin, path: str, variant: Any, compute: Callable[[], Dict[str, Any]],
+                sha256: Optional[str] = None) -> Dict[str, Any]:
+    """按 ``(文件, 插件, 插件版本, variant)`` 缓存 ``compute()`` 的结果。
+
+    ``compute`` 返回与 ``ExtractResult`` 相同结构的字典（text / meta / chunks）。
+    """
+
+    cache, key, hit = _lookup(plugin, path, variant, sha256)
+    if hit is not None:
+        return hit
+    res = compute() or {}
+    if cache is not None:
+        _store(cache, key, path, res)
+    return res
+
+
+def cached_chunks(plugin, path: str, variant: Any, produce: Callable[[], Iterable[Chunk]],
+                  max_chars: int, sha256: Optional[str] = None) -> Iterator[Chunk]:
+    """流式版 :func:`cached_call`：``produce()`` 的分块边产出边交给调用方。
+
+    只有分块文本合计不超过 ``max_chars`` 的文档才写入缓存；超过后不再保留已产出
+    的分块，大文档因此不会为了缓存而整份留在内存里。调用方提前停止迭代时不写缓存。
+    """
+
+    cache, key, hit = _lookup(plugin, path, variant, sha256)
+    if hit is not None:
+        yield from hit.get("chunks") or []
+        return
+    kept: Optional[List[Chunk]] = [] if cache is not None else None
+    size = 0
+    for ch in produce():
+        if kept is not None:
+            size += len(ch.text)
+            if size > max_chars:
+                kept = None
+            else:
+                kept.append(ch)
+        yield ch
+    if kept is not None:
+        _store(cache, key, path, {"chunks": kept})
+
+
+def cached_extract(plugin, path: str, max_chars: int, sha256: Optional[str] = None) -> Dict[str, Any]:
+    """调用 ``plugin.extract``，相同文件与参数的结果直接从缓存读取。"""
+
+    return cached_call(plugin, path, max_chars, lambda: plugin.extract(path, max_chars=max_chars), sha256)
+
+
+__all__ = ["ExtractCache", "fingerprint", "get_extract_cache", "cached_call", "cached_chunks", "cached_extract"]
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""多进程抽取执行器。
+
+插件解析（PyPDF2、python-pptx 等）是纯 Python 的 CPU 密集任务，放在请求线程里
+串行执行既占满 GIL，又会被单个超大文件卡住。:class:`ExtractionExecutor` 把
+:func:`core.extractors.extract_chunks` / :func:`extract_text_for_keywords` 放到
+进程池中：
+
+* 工作进程处理 ``max_tasks_per_child`` 个文件后自动重建，避免解析库的内存泄漏
+  累积；
+* 每个任务按其插件（:func:`core.extractors.handler_for`）取超时，超时后结束整个
+  进程池并重建，其余未完成的任务重新排队；
+* 在支持 ``resource`` 的平台上按插件限制工作进程的地址空间（``RLIMIT_AS``），
+  超限时插件抛出 ``MemoryError``，照常回退到下一个插件或兜底逻辑；
+* 工作进程意外退出时，受影响的任务重试一次。
+
+同时在途的任务数不超过进程数，因此“提交时间”就是开始时间，超时只计算真正
+执行的时长。配置位于 ``config/settings.json`` 的 ``extraction`` 段。
+"""
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, CancelledError, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from core.chunking import Chunk
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ExtractOutcome:
+    path: str
+    ok: bool
+    text: str = ""
+    chunks: List[Chunk] = field(default_factory=list)
+    error: Optional[str] = None
+    elapsed: float = 0.0
+
+
+def _limit_memory(limit: Optional[int]) -> None:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    new = hard if not limit else (limit if hard == resource.RLIM_INFINITY else min(limit, hard))
+    if new != soft:
+        resource.setrlimit(resource.RLIMIT_AS, (new, hard))
+
+
+def _extract_task(path: str, mode: str, max_chars: int, mem_limit: Optional[int]) -> Tuple[str, List[Chunk], float]:
+    """在工作进程中执行一次抽取。"""
+
+    from core.extractors import extract_chunks, extract_text_for_keywords
+
+    _limit_memory(mem_limit)
+    t0 = time.perf_counter()
+    if mode == "text":
+        return extract_text_for_keywords(path, max_chars=max_chars), [], time.perf_counter() - t0
+    return "", extract_chunks(path, max_chars=max_chars), time.perf_counter() - t0
+
+
+class ExtractionExecutor:
+    """进程池抽取，``extract_many`` 按完成顺序产出结果。"""
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        max_tasks_per_child: int = 50,
+        timeout_sec: float = 120.0,
+        plugin_timeouts: Optional[Dict[str, float]] = None,
+        memory_limit_mb: Optional[int] = None,
+        plugin_memory_mb: Optional[Dict[str, int]] = None,
+    ) -> None:
+        self.workers = workers or os.cpu_count() or 2
+        self.max_tasks_per_child = max_tasks_per_child
+        self.timeout_sec = timeout_sec
+        self.plugin_timeouts = plugin_timeouts or {}
+        self.memory_limit_mb = memory_limit_mb
+        self.plugin_memory_mb = plugin_memory_mb or {}
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.workers)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._epoch = 0
+        self._killed: set[int] = set()
+
+    @classmethod
+    def from_settings(cls, settings: Optional[Dict[str, Any]] = None) -> "ExtractionExecutor":
+        from core.settings import SETTINGS
+
+        cfg = ((SETTINGS if settings is None else settings).get("extraction") or {})
+        return cls(
+            workers=cfg.get("workers"),
+            max_tasks_per_child=int(cfg.get("max_tasks_per_child", 50)),
+            timeout_sec=float(cfg.get("timeout_sec", 120)),
+            plugin_timeouts=cfg.get("plugin_timeouts"),
+            memory_limit_mb=cfg.get("memory_limit_mb"),
+            plugin_memory_mb=cfg.get("plugin_memory_mb"),
+        )
+
+    # 进程池 -------------------------------------------------------------
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # fork 与 max_tasks_per_child 不兼容，且 Flask 进程里有线程，统一用 spawn
+        kwargs: Dict[str, Any] = {"mp_context": multiprocessing.get_context("spawn")}
+        if sys.version_info >= (3, 11) and self.max_tasks_per_child:
+            kwargs["max_tasks_per_child"] = self.max_tasks_per_child
+        return ProcessPoolExecutor(max_workers=self.workers, **kwargs)
+
+    def _submit(self, *args: Any) -> Tuple[Future, int]:
+        with self._lock:
+            for _ in range(2):
+                if self._pool is None:
+                    self._pool = self._new_pool()
+                    self._epoch += 1
+                try:
+                    return self._pool.submit(_extract_task, *args), self._epoch
+                except (BrokenProcessPool, RuntimeError):  # 某个工作进程已崩溃
+                    self._pool.shutdown(wait=False, cancel_futures=True)
+                    self._pool = None
+            raise BrokenProcessPool("cannot start extraction workers")
+
+    def _kill(self, epoch: int) -> None:
+        """结束 ``epoch`` 代进程池（卡住的任务无法单独取消）。"""
+
+        with self._lock:
+            if self._pool is None or self._epoch != epoch:
+                return
+            pool, self._pool = self._pool, None
+            self._killed.add(epoch)
+        procs = list((getattr(pool, "_processes", None) or {}).values())
+        pool.shutdown(wait=False, cancel_futures=True)
+        for proc in procs:
+            proc.terminate()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _limits(self, path: str) -> Tuple[float, Optional[int]]:
+        from core.extractors import handler_for
+
+        plugin = handler_for(path)
+        name = getattr(plugin, "name", None)
+        timeout = float(self.plugin_timeouts.get(name, self.timeout_sec))
+        mem = self.plugin_memory_mb.get(name, self.memory_limit_mb)
+        return timeout, int(mem) * 1024 * 1024 if mem else None
+
+    # 抽取 ---------------------------------------------------------------
+    def extract_many(self, paths: Iterable[str], mode: str = "chunks", max_chars: int = 4000) -> Iterator[ExtractOutcome]:
+        """并行抽取 ``paths``；``mode`` 为 ``"chunks"`` 或 ``"text"``。
+
+        ``paths`` 按需惰性读取，可以是生成器（例如边扫描边抽取）。
+        """
+
+        source = iter(paths)
+        queue: Deque[Tuple[str, int]] = deque()  # 待提交（含需要重试）的任务
+        running: Dict[Future, Tuple[str, int, int, float, float]] = {}  # path, attempt, epoch, start, deadline
+
+        def pending() -> bool:
+            if not queue:
+                nxt = next(source, None)
+                if nxt is None:
+                    return False
+                queue.append((str(nxt), 0))
+            return True
+
+        def acquire() -> bool:
+            # 没有自己的在途任务时才阻塞等待空闲进程
+            return self._slots.acquire(blocking=False) if running else self._slots.acquire(timeout=0.5)
+
+        def release(fut: Future) -> Tuple[str, int, int, float, float]:
+            self._slots.release()
+            return running.pop(fut)
+
+        try:
+            while pending() or running:
+                while pending() and acquire():
+                    path, attempt = queue.popleft()
+                    timeout, mem = self._limits(path)
+                    try:
+                        fut, epoch = self._submit(path, mode, max_chars, mem)
+                    except Exception as e:
+                        self._slots.release()
+                        yield ExtractOutcome(path, False, error=str(e))
+                        continue
+                    start = time.monotonic()
+                    running[fut] = (path, attempt, epoch, start, start + timeout)
+                if not running:
+                    continue
+                deadline = min(d for *_, d in running.values())
+                done, _ = wait(list(running), timeout=max(0.0, deadline - time.monotonic()),
+                               return_when=FIRST_COMPLETED)
+                for fut in done:
+                    path, attempt, epoch, _, _ = release(fut)
+                    try:
+                        text, chunks, elapsed = fut.result()
+                    except (BrokenProcessPool, CancelledError):
+                        if epoch in self._killed:
+                            queue.append((path, attempt))  # 被别的超时任务连累，免费重试
+                        elif attempt < 1:
+                            queue.append((path, attempt + 1))
+                        else:
+                            yield ExtractOutcome(path, False, error="extraction worker crashed")
+                        continue
+                    except Exception as e:
+                        yield ExtractOutcome(path, False, error=str(e))
+                        continue
+                    yield ExtractOutcome(path, True, text=text, chunks=chunks, elapsed=elapsed)
+                now = time.monotonic()
+                for fut, (path, attempt, epoch, start, deadline) in list(running.items()):
+                    if deadline > now or fut.done():
+                        continue
+                    release(fut)
+                    logger.warning("extraction of %s timed out; recycling workers", path)
+                    yield ExtractOutcome(path, False, error="timeout", elapsed=now - start)
+                    self._kill(epoch)
+                    # 同一进程池里的其余任务会随之失败，直接重新排队
+                    for other, (p, a, e, _, _) in list(running.items()):
+                        if e == epoch:
+                            release(other)
+                            queue.append((p, a))
+        finally:
+            for fut in list(running):
+                fut.cancel()
+                release(fut)
+
+
+_EXECUTOR: Optional[ExtractionExecutor] = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def get_executor() -> ExtractionExecutor:
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ExtractionExecutor.from_settings()
+        return _EXECUTOR
+
+
+def extract_many(paths: Iterable[str], mode: str = "chunks", max_chars: int = 4000) -> Iterator[ExtractOutcome]:
+    """用全局执行器并行抽取，按完成顺序产出 :class:`ExtractOutcome`。"""
+
+    return get_executor().extract_many(paths, mode, max_chars)
+
+
+__all__ = ["ExtractOutcome", "ExtractionExecutor", "get_executor", "extract_many"]
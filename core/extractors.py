@@ -11,16 +11,22 @@ Extractor orchestrator with safe fallback.
 2) 命中 plugin.can_handle(path) 则 plugin.extract()；
 3) 否则回退到只读纯文本的兜底逻辑。
 
+插件结果经 :mod:`core.extract_cache` 缓存，未变化的文件再次抽取只是一次查表。
+提供 ``iter_sections`` 的插件由 :func:`core.chunking.chunk_sections` 按文档结构
+分块（token 上限与重叠见 settings.json 的 ``chunking`` 段）。
+
 注意：不要在本文件最前面放任何其他 import/代码，
 以保证 `from __future__ import annotations` 位于文件开头。
 """
 
 from pathlib import Path
-from typing import Iterable, List
+from typing import Iterable, Iterator, List
 
 from core.plugin_loader import discover_plugins, get_plugins
 from core.plugin_base import ExtractorPlugin
-from core.chunking import Chunk
+from core.chunking import Chunk, chunk_sections
+from core.extract_cache import cached_chunks, cached_extract
+from core.settings import SETTINGS
 
 # ---------------- internal state ----------------
 _PLUGINS_READY = False
@@ -64,6 +70,17 @@ def _fallback_extract_text(path: str, max_chars: int = 4000) -> str:
     return ""
 
 # ---------------- public API ----------------
+def handler_for(path: str) -> ExtractorPlugin | None:
+    """第一个声明能处理 ``path`` 的插件（用于按插件配置超时等）。"""
+    _ensure_plugins()
+    for plugin in get_plugins():
+        try:
+            if plugin.can_handle(str(path)):
+                return plugin
+        except Exception:
+            continue
+    return None
+
 def extract_text_for_keywords(path: str, max_chars: int = 4000) -> str:
     """优先插件，失败则兜底。始终返回字符串。"""
     p = Path(path)
@@ -74,7 +91,7 @@ def extract_text_for_keywords(path: str, max_chars: int = 4000) -> str:
         for plugin in get_plugins():  # type: Iterable[ExtractorPlugin]
             try:
                 if plugin.can_handle(str(p)):
-                    res = plugin.extract(str(p), max_chars=max_chars) or {}
+                    res = cached_extract(plugin, str(p), max_chars)
                     txt = (res.get("text") or "")
                     if txt:
                         return txt[:max_chars]
@@ -90,8 +107,68 @@ def extract_text_for_keywords(path: str, max_chars: int = 4000) -> str:
     except Exception:
         return ""
 
+# 分块文本合计超过这个字符数的文档不进抽取缓存（也就不为缓存整份保留）
+_CACHE_MAX_CHARS = 4 * 1024 * 1024
+
+def _section_chunks(plugin, path: str) -> Iterator[Chunk]:
+    cfg = SETTINGS.get("chunking") or {}
+    max_tokens = int(cfg.get("max_tokens", 512))
+    overlap = int(cfg.get("overlap_tokens", 64))
+
+    def produce():
+        return chunk_sections(path, plugin.iter_sections(path), max_tokens, overlap,
+                              metadata={"handler": plugin.name})
+
+    return cached_chunks(plugin, path, f"chunks:{max_tokens}:{overlap}", produce, _CACHE_MAX_CHARS)
+
+def _plugin_chunks(plugin, p: Path, max_chars: int) -> Iterator[Chunk]:
+    """单个插件产出的分块（可能为空）。"""
+    if hasattr(plugin, "iter_sections"):
+        yield from _section_chunks(plugin, str(p))
+        return
+    res = cached_extract(plugin, str(p), max_chars)
+    chunks = res.get("chunks")
+    if chunks:
+        yield from chunks
+        return
+    txt = res.get("text") or ""
+    if txt:
+        yield Chunk(id=f"{p}#0", doc_id=str(p), text=txt[:max_chars])
+
+def iter_chunks(path: str, max_chars: int = 4000) -> Iterator[Chunk]:
+    """Streaming form of :func:`extract_chunks`.
+
+    Chunks of ``iter_sections`` plugins are yielded as they are produced.  A
+    plugin that fails before its first chunk falls through to the next one;
+    a failure after that propagates, since chunks were already handed out.
+    """
+
+    p = Path(path)
+    _ensure_plugins()
+    for plugin in get_plugins():  # type: Iterable[ExtractorPlugin]
+        try:
+            if not plugin.can_handle(str(p)):
+                continue
+            it = _plugin_chunks(plugin, p, max_chars)
+            first = next(it, None)
+        except Exception:
+            continue
+        if first is not None:
+            yield first
+            yield from it
+            return
+
+    txt = _fallback_extract_text(str(p), max_chars=max_chars)
+    if txt:
+        yield Chunk(id=f"{p}#0", doc_id=str(p), text=txt)
+
 def extract_chunks(path: str, max_chars: int = 4000) -> List[Chunk]:
-    """Extract structured chunks from a document."""
+    """Extract structured chunks from a document.
+
+    Plugins with ``iter_sections`` are chunked over the whole document;
+    ``max_chars`` only applies to the legacy single-result plugins.  Use
+    :func:`iter_chunks` to consume the chunks without holding them all.
+    """
 
     p = Path(path)
     _ensure_plugins()
@@ -100,13 +177,9 @@ def extract_chunks(path: str, max_chars: int = 4000) -> List[Chunk]:
         for plugin in get_plugins():  # type: Iterable[ExtractorPlugin]
             try:
                 if plugin.can_handle(str(p)):
-                    res = plugin.extract(str(p), max_chars=max_chars) or {}
-                    chunks = res.get("chunks")
+                    chunks = list(_plugin_chunks(plugin, p, max_chars))
                     if chunks:
-                        return chunks[:]
-                    txt = res.get("text") or ""
-                    if txt:
-                        return [Chunk(id=f"{p}#0", doc_id=str(p), text=txt[:max_chars])]
+                        return chunks
             except Exception:
                 continue
     except Exception:
@@ -118,4 +191,4 @@ def extract_chunks(path: str, max_chars: int = 4000) -> List[Chunk]:
     return []
 
 
-__all__ = ["extract_text_for_keywords", "extract_chunks"]
+__all__ = ["extract_text_for_keywords", "extract_chunks", "iter_chunks", "handler_for"]
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""模型生成结果缓存。
+
+同一文件、同一分块、同一提示词模板再次提交给模型时，直接返回上次的输出。键为
+``sha256(provider, model, options, 完整提示词)``，值为模型的原始输出文本。
+
+* 条目超过 ``ttl_days`` 视为过期；总大小超过 ``max_mb`` 时按最近访问淘汰；
+* 每个条目记录写入时的配置签名（``settings.json`` 的 ``prompts`` 与
+  ``ai.provider`` / ``ai.model``），签名变化后旧条目在下一次访问时整体清除；
+* ``hits`` / ``misses`` 计数可通过 ``GET /api/ai/cache`` 查看。
+
+配置位于 ``settings.json`` 的 ``ai.generation_cache``（``enabled``、``ttl_days``、
+``max_mb``、``db``），数据库默认 ``data/generation_cache.db``。
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from core.config import ROOT_DIR
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS generations (
+    key         TEXT PRIMARY KEY,
+    sig         TEXT NOT NULL,
+    created     REAL NOT NULL,
+    last_access REAL NOT NULL,
+    size        INTEGER NOT NULL,
+    value       TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS generations_access ON generations(last_access);
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+_TOUCH_INTERVAL = 60.0
+_EVICT_BATCH = 64
+
+
+def generation_key(provider: str, model: str, options: Optional[Dict[str, Any]], prompt: str,
+                   **extra: Any) -> str:
+    raw = json.dumps([provider, model, options or {}, prompt, extra], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def config_signature(settings: Dict[str, Any]) -> str:
+    ai = settings.get("ai") or {}
+    raw = json.dumps([settings.get("prompts") or {}, ai.get("provider"), ai.get("model")],
+                     ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class GenerationCache:
+    """TTL + 容量受限的生成缓存，线程安全（每线程一个连接）。"""
+
+    def __init__(self, db_path: str | Path, ttl_sec: float = 30 * 86400,
+                 max_bytes: int = 256 * 1024 * 1024, now: Callable[[], float] = time.time) -> None:
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl_sec = ttl_sec
+        self.max_bytes = max_bytes
+        self._now = now
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+            self._total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM generations").fetchone()[0]
+            row = conn.execute("SELECT value FROM meta WHERE name = 'sig'").fetchone()
+        self.sig = row[0] if row else ""
+        self.hits = 0
+        self.misses = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def use_signature(self, sig: str) -> int:
+        """切换配置签名；签名变化时删除其它签名的条目，返回删除数。"""
+
+        if sig == self.sig:
+            return 0
+        with self._lock, self._conn() as conn:
+            if sig == self.sig:
+                return 0
+            dropped = conn.execute("DELETE FROM generations WHERE sig != ?", (sig,)).rowcount
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('sig', ?)", (sig,))
+            self._total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM generations").fetchone()[0]
+            self.sig = sig
+        if dropped:
+            logger.info("prompts or model changed; dropped %d cached generations", dropped)
+        return dropped
+
+    def get(self, key: str) -> Optional[str]:
+        conn = self._conn()
+        row = conn.execute("SELECT created, last_access, value FROM generations WHERE key = ?", (key,)).fetchone()
+        now = self._now()
+        if row is None or now - row[0] > self.ttl_sec:
+            self.misses += 1
+            return None
+        if now - row[1] > _TOUCH_INTERVAL:
+            with conn:
+                conn.execute("UPDATE generations SET last_access = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return row[2]
+
+    def put(self, key: str, value: str) -> None:
+        size = len(value.encode("utf-8")) + len(key)
+        if size > self.max_bytes:
+            return
+        now = self._now()
+        conn = self._conn()
+        with self._lock, conn:
+            old = conn.execute("SELECT size FROM generations WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO generations (key, sig, created, last_access, size, value) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, self.sig, now, now, size, value),
+            )
+            self._total += size - (old[0] if old else 0)
+            if self._total > self.max_bytes:
+                self._evict(conn, int(self.max_bytes * 0.9))
+
+    def _evict(self, conn: sqlite3.Connection, target: int) -> None:
+        # 先清过期条目，再按最近访问淘汰
+        expired = conn.execute("SELECT COALESCE(SUM(size), 0) FROM generations WHERE created < ?",
+                               (self._now() - self.ttl_sec,)).fetchone()[0]
+        if expired:
+            conn.execute("DELETE FROM generations WHERE created < ?", (self._now() - self.ttl_sec,))
+            self._total -= expired
+        while self._total > target:
+            rows = conn.execute(
+                "SELECT key, size FROM generations ORDER BY last_access LIMIT ?", (_EVICT_BATCH,)
+            ).fetchall()
+            if not rows:
+                self._total = 0
+                return
+            drop = []
+            for key, size in rows:
+                drop.append((key,))
+                self._total -= size
+                if self._total <= target:
+                    break
+            conn.executemany("DELETE FROM generations WHERE key = ?", drop)
+
+    def clear(self) -> None:
+        with self._lock, self._conn() as conn:
+            conn.execute("DELETE FROM generations")
+            self._total = 0
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "bytes": self._total,
+            "entries": self._conn().execute("SELECT COUNT(*) FROM generations").fetchone()[0],
+        }
+
+
+_CACHE: Optional[GenerationCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_generation_cache() -> Optional[GenerationCache]:
+    """全局缓存（已按当前配置签名清理）；关闭或无法打开时返回 ``None``。"""
+
+    global _CACHE
+    from core.settings import SETTINGS
+
+    cfg = (SETTINGS.get("ai") or {}).get("generation_cache") or {}
+    if cfg.get("enabled", True) is False:
+        return None
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            db = Path(cfg.get("db") or "data/generation_cache.db")
+            if not db.is_absolute():
+                db = ROOT_DIR / db
+            try:
+                _CACHE = GenerationCache(db, float(cfg.get("ttl_days", 30)) * 86400,
+                                         int(float(cfg.get("max_mb", 256)) * 1024 * 1024))
+            except (OSError, sqlite3.Error):
+                logger.exception("generation cache unavailable")
+                return None
+    try:
+        _CACHE.use_signature(config_signature(SETTINGS))
+    except sqlite3.Error:
+        logger.warning("generation cache signature update failed", exc_info=True)
+    return _CACHE
+
+
+__all__ = ["GenerationCache", "generation_key", "config_signature", "get_generation_cache"]
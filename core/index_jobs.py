@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""批量建索引任务：扫描 → 抽取 → 分块 → 写入，流水线执行。
+
+一个任务接收若干目录或文件路径（目录可按 ``category`` / ``types`` 过滤，与
+:func:`core.utils.iterfiles.iter_files` 一致），在后台线程中运行：
+
+1. 扫描线程对每个目录执行 :meth:`FileCatalog.refresh`，每提交一个目录就把它放进
+   队列；
+2. 抽取端按目录从目录表读出文件，惰性地喂给
+   :func:`core.extract_pool.extract_many`，多进程并行解析；
+3. 抽取结果按 ``batch_size`` 个分块攒批，经 :func:`replace_documents` 一次性
+   写入集合（先删除同一文件旧的分块）。
+
+进度（已发现/已完成/失败文件数、分块数、吞吐）通过 :meth:`IndexJob.status` 读取，
+HTTP 接口见 ``/full/index`` 与 ``/full/index/jobs/<id>``。
+"""
+from __future__ import annotations
+
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from core.catalog import FileCatalog, get_catalog
+
+logger = logging.getLogger(__name__)
+
+MAX_JOBS = 32  # 保留的已结束任务数
+MAX_ERRORS = 50  # 状态里保留的最近错误数
+
+
+def document_records(path: str, chunks: Iterable[Any]) -> List[Dict[str, Any]]:
+    """把分块转成 ``Retriever.upsert`` 的记录，并在元数据中标记来源 ``path``。"""
+
+    out = []
+    for ch in chunks:
+        d = ch.to_retriever_dict() if hasattr(ch, "to_retriever_dict") else dict(ch)
+        d["metadata"] = {**(d.get("metadata") or {}), "path": path}
+        out.append(d)
+    return out
+
+
+def _segment_store():
+    """``chunking.segment_dir`` 配置了目录时返回对应的分段存储，否则 ``None``。"""
+
+    from core.settings import SETTINGS
+
+    directory = (SETTINGS.get("chunking") or {}).get("segment_dir")
+    if not directory:
+        return None
+    from core.chunk_segments import get_segment_store
+    return get_segment_store(directory)
+
+
+def replace_documents(manager, collection: str, docs: Dict[str, List[Any]],
+                      removed: Iterable[str] = (), store=None) -> Tuple[int, int]:
+    """用 ``docs`` (``path -> chunks``) 替换集合中这些文件的分块，并删除 ``removed``。
+
+    ``store`` （默认取 :func:`_segment_store`）为 :class:`core.chunk_segments.SegmentStore`
+    时同步追加新分块、为旧分块记录墓碑。返回 ``(写入数, 删除数)``。
+    """
+
+    paths = list(docs) + [p for p in removed if p not in docs]
+    if not paths:
+        return 0, 0
+    fresh = [r for path, chunks in docs.items() for r in document_records(path, chunks)]
+    fresh_ids = {r["id"] for r in fresh}
+    stale = [i for i in manager.ids_where(collection, {"path": {"$in": paths}}) if i not in fresh_ids]
+    deleted = manager.delete(collection, stale) if stale else 0
+    upserted = manager.upsert(collection, fresh) if fresh else 0
+    store = store if store is not None else _segment_store()
+    if store is not None:
+        if stale:
+            store.delete(stale)
+        store.append(ch for chunks in docs.values() for ch in chunks)
+    return upserted, deleted
+
+
+class IndexJob:
+    def __init__(
+        self,
+        manager,
+        collection: str,
+        sources: List[str],
+        recursive: bool = True,
+        category: Optional[str] = None,
+        types: Optional[List[str]] = None,
+        batch_size: int = 512,
+        catalog: Optional[FileCatalog] = None,
+        extract: Optional[Callable[[Iterable[str]], Iterator[Any]]] = None,
+    ) -> None:
+        self.id = uuid.uuid4().hex
+        self.manager = manager
+        self.collection = collection
+        self.sources = sources
+        self.recursive = recursive
+        self.category = category
+        self.types = types
+        self.batch_size = batch_size
+        self.catalog = catalog or get_catalog()
+        if extract is None:
+            from core.extract_pool import extract_many as extract
+        self.extract = extract
+        self.state = "pending"
+        self.files_total = 0
+        self.scan_done = False
+        self.files_done = 0
+        self.files_failed = 0
+        self.chunks = 0
+        self.deleted = 0
+        self.errors: List[Dict[str, str]] = []
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=f"index-{self.id[:8]}", daemon=True)
+
+    def start(self) -> "IndexJob":
+        self.started_at = time.time()
+        self.state = "running"
+        self._thread.start()
+        return self
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    @property
+    def finished(self) -> bool:
+        return self.state in ("done", "failed", "cancelled")
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            end = self.finished_at or time.time()
+            elapsed = max(end - (self.started_at or end), 1e-9)
+            return {
+                "job_id": self.id,
+                "collection": self.collection,
+                "state": self.state,
+                "files_total": self.files_total,
+                "total_final": self.scan_done,
+                "files_done": self.files_done,
+                "files_failed": self.files_failed,
+                "chunks": self.chunks,
+                "deleted": self.deleted,
+                "elapsed_sec": round(elapsed, 3),
+                "files_per_sec": round(self.files_done / elapsed, 2),
+                "chunks_per_sec": round(self.chunks / elapsed, 2),
+                "errors": list(self.errors),
+            }
+
+    # 流水线 -------------------------------------------------------------
+    def _scan(self, dirs: "queue.Queue[Optional[str]]") -> None:
+        try:
+            for src in self.sources:
+                if self._cancel.is_set():
+                    break
+                if os.path.isdir(src):
+                    self.catalog.refresh(src, self.recursive, on_dir=dirs.put, stop=self._cancel)
+                else:
+                    dirs.put("\0" + src)  # 单个文件
+        except Exception as e:
+            logger.exception("index job %s: scan failed", self.id)
+            self._error("", f"scan failed: {e}")
+        finally:
+            dirs.put(None)
+
+    def _paths(self) -> Iterator[str]:
+        dirs: "queue.Queue[Optional[str]]" = queue.Queue()
+        threading.Thread(target=self._scan, args=(dirs,), name=f"index-scan-{self.id[:8]}", daemon=True).start()
+        while not self._cancel.is_set():
+            d = dirs.get()
+            if d is None:
+                break
+            if d.startswith("\0"):
+                batch = [d[1:]] if os.path.isfile(d[1:]) else []
+            else:
+                batch = [r["path"] for r in self.catalog.dir_rows(d, self.category, self.types)]
+            with self._lock:
+                self.files_total += len(batch)
+            yield from batch
+        with self._lock:
+            self.scan_done = True
+
+    def _error(self, path: str, error: str) -> None:
+        with self._lock:
+            self.errors.append({"path": path, "error": error})
+            del self.errors[:-MAX_ERRORS]
+
+    def _flush(self, docs: Dict[str, List[Any]]) -> None:
+        if not docs:
+            return
+        upserted, deleted = replace_documents(self.manager, self.collection, docs)
+        with self._lock:
+            self.chunks += upserted
+            self.deleted += deleted
+        docs.clear()
+
+    def _run(self) -> None:
+        docs: Dict[str, List[Any]] = {}
+        pending = 0
+        results = self.extract(self._paths())
+        try:
+            for res in results:
+                if res.ok:
+                    docs[res.path] = res.chunks
+                    pending += len(res.chunks)
+                    with self._lock:
+                        self.files_done += 1
+                else:
+                    self._error(res.path, res.error or "extraction failed")
+                    with self._lock:
+                        self.files_failed += 1
+                if pending >= self.batch_size:
+                    self._flush(docs)
+                    pending = 0
+                if self._cancel.is_set():
+                    break
+            self._flush(docs)
+            state = "cancelled" if self._cancel.is_set() else "done"
+        except Exception as e:
+            logger.exception("index job %s failed", self.id)
+            self._error("", str(e))
+            state = "failed"
+        finally:
+            close = getattr(results, "close", None)
+            if close is not None:
+                close()
+        with self._lock:
+            self.state = state
+            self.finished_at = time.time()
+
+
+_JOBS: Dict[str, IndexJob] = {}
+_LOCK = threading.Lock()
+
+
+def start_job(manager, collection: str, sources: List[str], **kwargs: Any) -> IndexJob:
+    with _LOCK:
+        done = sorted((j for j in _JOBS.values() if j.finished), key=lambda j: j.finished_at or 0)
+        for j in done[:max(0, len(_JOBS) - MAX_JOBS + 1)]:
+            _JOBS.pop(j.id, None)
+        job = IndexJob(manager, collection, sources, **kwargs)
+        _JOBS[job.id] = job
+    return job.start()
+
+
+def get_job(job_id: str) -> Optional[IndexJob]:
+    with _LOCK:
+        return _JOBS.get(job_id)
+
+
+__all__ = ["IndexJob", "document_records", "replace_documents", "start_job", "get_job"]
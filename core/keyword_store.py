@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""文件关键词与关键词生成日志的 SQLite 存储。
+
+取代整体重写的 ``state.json``：每个路径一行，按主键读写；批量更新在一个事务中
+提交。数据库使用 WAL 模式，读操作不阻塞写操作，每个线程使用自己的连接，写入
+由进程内锁串行化。
+
+数据库默认位于 ``data/keywords.db``（config.toml 的 ``keyword_db`` 可覆盖）。
+首次打开空库时自动导入项目根目录下旧的 ``state.json``，导入后该文件改名为
+``state.json.migrated``；也可以手动调用 :meth:`KeywordStore.import_state_json`。
+"""
+from __future__ import annotations
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Mapping, Optional
+
+from core.config import CFG, ROOT_DIR
+
+logger = logging.getLogger(__name__)
+
+LEGACY_STATE = ROOT_DIR / "state.json"
+LOG_KEEP = 100  # 保留的关键词生成日志条数
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS keywords (
+    path     TEXT PRIMARY KEY,
+    keywords TEXT NOT NULL,
+    updated  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS keywords_log (
+    id    INTEGER PRIMARY KEY AUTOINCREMENT,
+    entry TEXT NOT NULL
+);
+"""
+
+_IN_BATCH = 500  # SQLite 单条语句的参数上限以内
+
+
+def _dump(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False)
+
+
+class KeywordStore:
+    """路径 → 关键词列表，外加最近 ``LOG_KEEP`` 条生成日志。线程安全。"""
+
+    def __init__(self, db_path: str | Path) -> None:
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # 关键词 -------------------------------------------------------------
+    def get(self, path: str) -> Optional[List[str]]:
+        row = self._conn().execute("SELECT keywords FROM keywords WHERE path = ?", (path,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_many(self, paths: Iterable[str]) -> Dict[str, List[str]]:
+        paths = list(paths)
+        out: Dict[str, List[str]] = {}
+        conn = self._conn()
+        for i in range(0, len(paths), _IN_BATCH):
+            part = paths[i:i + _IN_BATCH]
+            marks = ",".join("?" * len(part))
+            for path, kw in conn.execute(f"SELECT path, keywords FROM keywords WHERE path IN ({marks})", part):
+                out[path] = json.loads(kw)
+        return out
+
+    def set(self, path: str, keywords: List[str]) -> None:
+        self.set_many({path: keywords})
+
+    def set_many(self, items: Mapping[str, List[str]]) -> int:
+        """一个事务内写入多个路径的关键词，返回写入条数。"""
+
+        if not items:
+            return 0
+        now = time.time()
+        rows = [(p, _dump(list(kw)), now) for p, kw in items.items()]
+        with self._lock, self._conn() as conn:
+            conn.executemany("INSERT OR REPLACE INTO keywords (path, keywords, updated) VALUES (?, ?, ?)", rows)
+        return len(rows)
+
+    def delete_many(self, paths: Iterable[str]) -> int:
+        """删除这些路径的关键词，返回实际删除的条数。"""
+
+        paths = list(paths)
+        deleted = 0
+        with self._lock, self._conn() as conn:
+            for i in range(0, len(paths), _IN_BATCH):
+                part = paths[i:i + _IN_BATCH]
+                marks = ",".join("?" * len(part))
+                deleted += conn.execute(f"DELETE FROM keywords WHERE path IN ({marks})", part).rowcount
+        return deleted
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM keywords").fetchone()[0]
+
+    # 日志 ---------------------------------------------------------------
+    def append_log(self, entry: Dict[str, Any], keep: int = LOG_KEEP) -> None:
+        with self._lock, self._conn() as conn:
+            conn.execute("INSERT INTO keywords_log (entry) VALUES (?)", (_dump(entry),))
+            conn.execute(
+                "DELETE FROM keywords_log WHERE id <= (SELECT MAX(id) FROM keywords_log) - ?", (keep,)
+            )
+
+    def recent_log(self, limit: int = LOG_KEEP) -> List[Dict[str, Any]]:
+        rows = self._conn().execute("SELECT entry FROM keywords_log ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [json.loads(r[0]) for r in reversed(rows)]
+
+    # 迁移 ---------------------------------------------------------------
+    def import_state_json(self, path: str | Path = LEGACY_STATE) -> int:
+        """导入旧版 ``state.json`` 的 ``keywords`` 与 ``keywords_log``，返回导入的路径数。"""
+
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+        items = {}
+        for p, kw in (data.get("keywords") or {}).items():
+            if isinstance(kw, str):  # 早期版本存的是逗号拼接的字符串
+                kw = [w.strip() for w in kw.replace("，", ",").replace("；", ",").replace(";", ",").split(",")
+                      if w.strip()]
+            items[p] = kw
+        self.set_many(items)
+        log = (data.get("keywords_log") or [])[-LOG_KEEP:]
+        if log:
+            with self._lock, self._conn() as conn:
+                conn.executemany("INSERT INTO keywords_log (entry) VALUES (?)", [(_dump(e),) for e in log])
+        return len(items)
+
+
+_STORE: Optional[KeywordStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_keyword_store() -> KeywordStore:
+    """全局关键词库；首次打开空库时迁移旧的 ``state.json``。"""
+
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            db = Path(CFG.get("keyword_db", "data/keywords.db"))
+            if not db.is_absolute():
+                db = ROOT_DIR / db
+            store = KeywordStore(db)
+            if LEGACY_STATE.exists() and store.count() == 0 and not store.recent_log(1):
+                try:
+                    n = store.import_state_json(LEGACY_STATE)
+                    LEGACY_STATE.rename(LEGACY_STATE.with_name(LEGACY_STATE.name + ".migrated"))
+                    logger.info("imported keywords of %d files from %s", n, LEGACY_STATE)
+                except (OSError, ValueError):
+                    logger.exception("importing %s failed", LEGACY_STATE)
+            _STORE = store
+        return _STORE
+
+
+__all__ = ["KeywordStore", "get_keyword_store", "LOG_KEEP"]
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""常驻的规范化工作进程池。
+
+规范化插件（docx / pdf / excel）原先每个文件启动一个新的 ``sys.executable``
+子进程，每次都要付出解释器启动和 python-docx、PyPDF2、openpyxl 的导入开销。
+:class:`NormalizerPool` 维护 ``normalize.max_concurrency`` 个预热好的工作进程
+（启动时即导入全部规范化插件），插件的 ``normalize`` 把实际转换
+（``plugin.process``）交给它执行：
+
+* 同时在途的任务数不超过进程数（``_slots``），进程池新建后先等工作进程完成
+  初始化再提交，因此超时只计算真正执行的时长；
+* 每个任务按插件自己的超时等待，超时后结束整个进程池并重建；
+* 工作进程崩溃时任务重试一次，被其他任务超时连累的任务直接重新提交；
+* 工作进程处理 ``max_tasks_per_child`` 个文件后自动重建。
+"""
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional, Tuple
+
+from core.normalize_base import NormalizeResult
+
+logger = logging.getLogger(__name__)
+
+
+def _warm() -> None:
+    """工作进程初始化：导入全部规范化插件及其依赖库。"""
+
+    from core.normalize_runner import discover_normalizers
+
+    discover_normalizers()
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _process(name: str, path: str, out_dir: str) -> NormalizeResult:
+    """在工作进程中用名为 ``name`` 的插件转换一个文件。"""
+
+    from core.normalize_base import REGISTRY
+
+    for plugin in REGISTRY:
+        if plugin.name == name:
+            return plugin.process(path, out_dir)
+    return NormalizeResult(False, message=f"normalizer {name!r} not available")
+
+
+class NormalizerPool:
+    def __init__(self, max_concurrency: int = 2, max_tasks_per_child: int = 20) -> None:
+        self.workers = max(1, int(max_concurrency or 1))
+        self.max_tasks_per_child = max_tasks_per_child
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._epoch = 0
+        self._ready_epoch = 0
+        self._killed: set[int] = set()
+        self._slots = threading.BoundedSemaphore(self.workers)
+
+    @classmethod
+    def from_settings(cls, settings: Optional[Dict[str, Any]] = None) -> "NormalizerPool":
+        from core.settings import SETTINGS
+
+        cfg = ((SETTINGS if settings is None else settings).get("normalize") or {})
+        return cls(int(cfg.get("max_concurrency") or 2), int(cfg.get("max_tasks_per_child", 20)))
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        kwargs: Dict[str, Any] = {"mp_context": multiprocessing.get_context("spawn"), "initializer": _warm}
+        if sys.version_info >= (3, 11) and self.max_tasks_per_child:
+            kwargs["max_tasks_per_child"] = self.max_tasks_per_child
+        return ProcessPoolExecutor(max_workers=self.workers, **kwargs)
+
+    def _submit(self, fn, *args: Any) -> Tuple[Future, int]:
+        with self._lock:
+            for _ in range(2):
+                if self._pool is None:
+                    self._pool = self._new_pool()
+                    self._epoch += 1
+                try:
+                    return self._pool.submit(fn, *args), self._epoch
+                except (BrokenProcessPool, RuntimeError):
+                    self._pool.shutdown(wait=False, cancel_futures=True)
+                    self._pool = None
+            raise BrokenProcessPool("cannot start normalizer workers")
+
+    def _kill(self, epoch: int) -> None:
+        with self._lock:
+            if self._pool is None or self._epoch != epoch:
+                return
+            pool, self._pool = self._pool, None
+            self._killed.add(epoch)
+        procs = list((getattr(pool, "_processes", None) or {}).values())
+        pool.shutdown(wait=False, cancel_futures=True)
+        for proc in procs:
+            proc.terminate()
+
+    def warm(self) -> "NormalizerPool":
+        """提前启动全部工作进程（否则在第一次提交时启动）。"""
+
+        subs = [self._submit(_ping) for _ in range(self.workers)]
+        for fut, epoch in subs:
+            try:
+                fut.result(timeout=120)
+            except Exception:
+                logger.warning("warming normalizer workers failed", exc_info=True)
+                break
+        else:
+            with self._lock:
+                self._ready_epoch = max(self._ready_epoch, subs[-1][1])
+        return self
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _ensure_ready(self) -> None:
+        """新建的进程池先完成启动和插件导入，不计入任务超时。"""
+
+        with self._lock:
+            if self._pool is not None and self._epoch == self._ready_epoch:
+                return
+        ping, epoch = self._submit(_ping)
+        ping.result(timeout=120)
+        with self._lock:
+            self._ready_epoch = max(self._ready_epoch, epoch)
+
+    def run(self, name: str, path: str, out_dir: str, timeout: Optional[float] = None) -> NormalizeResult:
+        """用插件 ``name`` 转换 ``path``，阻塞直到完成、失败或超时。
+
+        等待空闲进程的时间不计入 ``timeout``。
+        """
+
+        with self._slots:
+            return self._run(name, path, out_dir, timeout)
+
+    def _run(self, name: str, path: str, out_dir: str, timeout: Optional[float]) -> NormalizeResult:
+        crashes = 0
+        for _ in range(4):
+            try:
+                self._ensure_ready()
+            except (BrokenProcessPool, CancelledError):
+                continue  # 进程池在启动期间被结束，重新来过
+            except Exception as e:
+                return NormalizeResult(False, message=str(e))
+            try:
+                fut, epoch = self._submit(_process, name, path, out_dir)
+            except Exception as e:
+                return NormalizeResult(False, message=str(e))
+            try:
+                return fut.result(timeout=timeout)
+            except TimeoutError:
+                logger.warning("normalizing %s timed out; recycling workers", path)
+                self._kill(epoch)
+                return NormalizeResult(False, message=f"timeout after {timeout}s")
+            except (BrokenProcessPool, CancelledError):
+                if epoch in self._killed:
+                    continue  # 被别的超时任务连累，重新提交
+                self._kill(epoch)
+                if crashes >= 1:
+                    break
+                crashes += 1
+            except Exception as e:
+                return NormalizeResult(False, message=str(e))
+        return NormalizeResult(False, message="normalizer worker crashed")
+
+
+_POOL: Optional[NormalizerPool] = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_normalizer_pool() -> NormalizerPool:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = NormalizerPool.from_settings()
+        return _POOL
+
+
+def run_normalizer(name: str, path: str, out_dir: str, timeout: Optional[float] = None) -> NormalizeResult:
+    """在全局进程池中执行插件 ``name`` 的 ``process``。"""
+
+    return get_normalizer_pool().run(name, path, out_dir, timeout)
+
+
+__all__ = ["NormalizerPool", "get_normalizer_pool", "run_normalizer"]
@@ -1,13 +1,17 @@
 from __future__ import annotations
 
-import hashlib
 import json
+import shutil
+import sqlite3
 import sys
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import List
+from typing import Iterable, Iterator, List, Optional, Tuple
 
+from core.catalog import sha256_file
 from core.extractors import extract_text_for_keywords
 from .normalize_base import NormalizerPlugin, NormalizeResult, REGISTRY
 
@@ -41,13 +45,86 @@ def _ensure_plugins() -> None:
         _PLUGINS_READY = True
 
 
-def _calc_fingerprint(p: Path) -> tuple[str, float]:
-    sha256 = hashlib.sha256(p.read_bytes()).hexdigest()
-    mtime = p.stat().st_mtime
-    return sha256, mtime
+def _stat_sig(p: Path) -> dict:
+    st = p.stat()
+    return {"size": st.st_size, "mtime": st.st_mtime, "mtime_ns": st.st_mtime_ns, "inode": st.st_ino}
+
+
+def _same_stat(data: dict, sig: dict) -> bool:
+    """sidecar 记录的 size/mtime(/inode) 与当前文件一致。"""
+    if data.get("size") != sig["size"]:
+        return False
+    if "mtime_ns" in data:
+        if data["mtime_ns"] != sig["mtime_ns"]:
+            return False
+    elif data.get("mtime") != sig["mtime"]:
+        return False
+    return data.get("inode") in (None, sig["inode"])
+
+
+def _dedupe_cfg() -> dict:
+    from core.settings import SETTINGS
+    return SETTINGS.get("normalize", {}).get("dedupe") or {}
+
+
+class _ContentIndex:
+    """``sha256 -> doc_id``，保存在 ``out_root/content_index.db``。"""
+
+    _locks: dict[str, threading.Lock] = {}
+
+    def __init__(self, out_root: Path) -> None:
+        self.db = out_root / "content_index.db"
+        self.lock = self._locks.setdefault(str(self.db), threading.Lock())
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db, timeout=30)
+        conn.execute("CREATE TABLE IF NOT EXISTS content (sha256 TEXT PRIMARY KEY, doc_id TEXT NOT NULL)")
+        return conn
+
+    def get(self, sha256: str) -> Optional[str]:
+        with self.lock:
+            conn = self._conn()
+            try:
+                row = conn.execute("SELECT doc_id FROM content WHERE sha256 = ?", (sha256,)).fetchone()
+            finally:
+                conn.close()
+        return row[0] if row else None
+
+    def put(self, sha256: str, doc_id: str) -> None:
+        with self.lock:
+            conn = self._conn()
+            try:
+                with conn:
+                    conn.execute("INSERT OR REPLACE INTO content (sha256, doc_id) VALUES (?, ?)", (sha256, doc_id))
+            finally:
+                conn.close()
+
+
+def _artifacts(doc_dir: Path) -> tuple[List[str], List[str]]:
+    return [str(x) for x in doc_dir.glob("*.md")], [str(x) for x in doc_dir.glob("*.csv")]
+
+
+def _copy_artifacts(src_dir: Path, doc_dir: Path) -> None:
+    doc_dir.mkdir(parents=True, exist_ok=True)
+    for f in src_dir.iterdir():
+        if f.name == "sidecar.json" or not f.is_file():
+            continue
+        # 不用硬链接：规范化器会原地改写产物，共享 inode 会波及另一份副本
+        shutil.copy2(f, doc_dir / f.name)
+
+
+def _write_sidecar(sidecar_path: Path, meta: dict) -> None:
+    sidecar_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
 
 
 def normalize_file(path: str, out_root: Path, on_unsupported: str = "fallback") -> NormalizeResult:
+    """规范化单个文件。
+
+    变化检测分两级：先比较 sidecar 中的 size/mtime/inode（``dedupe.use_size_mtime``），
+    一致则直接返回 ``cached``；否则流式计算 SHA-256（``dedupe.use_sha256``），内容未变
+    时只更新 sidecar。内容与本目录下另一个文件相同时复用其产物（``dedup``），不再
+    重复转换。
+    """
     _ensure_plugins()
     p = Path(path)
     out_root = Path(out_root)
@@ -55,17 +132,46 @@ def normalize_file(path: str, out_root: Path, on_unsupported: str = "fallback")
     doc_id = uuid.uuid5(uuid.NAMESPACE_URL, str(p.resolve())).hex[:12]
     doc_dir = out_root / doc_id
     sidecar_path = doc_dir / "sidecar.json"
+    dedupe = _dedupe_cfg()
+    sig = _stat_sig(p)
 
-    sha256, mtime = _calc_fingerprint(p)
+    data = None
     if sidecar_path.exists():
         try:
             data = json.loads(sidecar_path.read_text(encoding="utf-8"))
-            if data.get("sha256") == sha256 and data.get("mtime") == mtime:
-                md_paths = [str(x) for x in doc_dir.glob("*.md")]
-                csv_paths = [str(x) for x in doc_dir.glob("*.csv")]
-                return NormalizeResult(True, doc_id, str(doc_dir), md_paths, csv_paths, str(sidecar_path), "cached")
         except Exception:
-            pass
+            data = None
+    if data and dedupe.get("use_size_mtime", True) and _same_stat(data, sig):
+        md_paths, csv_paths = _artifacts(doc_dir)
+        return NormalizeResult(True, doc_id, str(doc_dir), md_paths, csv_paths, str(sidecar_path), "cached")
+
+    sha256 = sha256_file(str(p)) if dedupe.get("use_sha256", True) else None
+    if data and sha256 and data.get("sha256") == sha256:
+        _write_sidecar(sidecar_path, {**data, **sig})
+        md_paths, csv_paths = _artifacts(doc_dir)
+        return NormalizeResult(True, doc_id, str(doc_dir), md_paths, csv_paths, str(sidecar_path), "cached")
+
+    meta = {
+        "doc_id": doc_id,
+        "source_path": str(p),
+        "ext": p.suffix.lstrip("."),
+        **sig,
+        "sha256": sha256,
+        "created_at": datetime.utcnow().isoformat(),
+    }
+    index = _ContentIndex(out_root) if sha256 else None
+    if index is not None:
+        src_id = index.get(sha256)
+        src_dir = out_root / src_id if src_id and src_id != doc_id else None
+        try:
+            src_meta = json.loads((src_dir / "sidecar.json").read_text(encoding="utf-8")) if src_dir else None
+        except Exception:
+            src_meta = None
+        if src_meta and src_meta.get("sha256") == sha256:
+            _copy_artifacts(src_dir, doc_dir)
+            _write_sidecar(sidecar_path, {**meta, "dedup_of": src_id})
+            md_paths, csv_paths = _artifacts(doc_dir)
+            return NormalizeResult(True, doc_id, str(doc_dir), md_paths, csv_paths, str(sidecar_path), "dedup")
 
     for plugin in REGISTRY:  # type: NormalizerPlugin
         try:
@@ -75,17 +181,19 @@ def normalize_file(path: str, out_root: Path, on_unsupported: str = "fallback")
                 res.out_dir = str(doc_dir)
                 if res.ok:
                     doc_dir.mkdir(parents=True, exist_ok=True)
-                    if not res.sidecar:
-                        meta = {
-                            "doc_id": doc_id,
-                            "source_path": str(p),
-                            "ext": p.suffix.lstrip("."),
-                            "mtime": mtime,
-                            "sha256": sha256,
-                            "created_at": datetime.utcnow().isoformat(),
-                        }
-                        sidecar_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
-                        res.sidecar = str(sidecar_path)
+                    # 插件返回的往往是上一次运行留下的 sidecar：合并插件字段，但
+                    # size/mtime/sha256 必须是本次的，否则快速路径与内容去重都会失效
+                    plugin_meta = {}
+                    if res.sidecar:
+                        try:
+                            plugin_meta = json.loads(Path(res.sidecar).read_text(encoding="utf-8"))
+                        except Exception:
+                            plugin_meta = {}
+                    plugin_meta.pop("dedup_of", None)
+                    _write_sidecar(sidecar_path, {**plugin_meta, **meta})
+                    res.sidecar = str(sidecar_path)
+                    if index is not None:
+                        index.put(sha256, doc_id)
                 return res
         except Exception as e:
             return NormalizeResult(False, doc_id, str(doc_dir), [], [], None, str(e))
@@ -94,23 +202,43 @@ def normalize_file(path: str, out_root: Path, on_unsupported: str = "fallback")
     doc_dir.mkdir(parents=True, exist_ok=True)
     if on_unsupported == "skip":
         return NormalizeResult(False, doc_id, str(doc_dir), [], [], None, "unsupported")
-    meta = {
-        "doc_id": doc_id,
-        "source_path": str(p),
-        "ext": p.suffix.lstrip("."),
-        "mtime": mtime,
-        "sha256": sha256,
-        "created_at": datetime.utcnow().isoformat(),
-    }
     md_paths: List[str] = []
     csv_paths: List[str] = []
     if on_unsupported == "ledger":
-        sidecar_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+        _write_sidecar(sidecar_path, meta)
         return NormalizeResult(True, doc_id, str(doc_dir), md_paths, csv_paths, str(sidecar_path), "ledger")
     # fallback
     text = extract_text_for_keywords(str(p))
     md_file = doc_dir / "document.md"
     md_file.write_text(text, encoding="utf-8")
     md_paths = [str(md_file)]
-    sidecar_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+    _write_sidecar(sidecar_path, meta)
+    if index is not None:
+        index.put(sha256, doc_id)
     return NormalizeResult(True, doc_id, str(doc_dir), md_paths, csv_paths, str(sidecar_path), "fallback")
+
+
+def normalize_many(
+    paths: Iterable[str],
+    out_root: Path,
+    on_unsupported: str = "fallback",
+    max_concurrency: Optional[int] = None,
+) -> Iterator[Tuple[str, NormalizeResult | Exception]]:
+    """并发规范化多个文件，按输入顺序产出 ``(path, 结果或异常)``。
+
+    并发数默认取 ``normalize.max_concurrency``；实际转换在
+    :mod:`core.normalize_pool` 的常驻进程中执行。
+    """
+    from core.settings import SETTINGS
+
+    paths = list(paths)
+    workers = max_concurrency or SETTINGS.get("normalize", {}).get("max_concurrency") or 2
+
+    def run(path: str) -> NormalizeResult | Exception:
+        try:
+            return normalize_file(path, out_root, on_unsupported=on_unsupported)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=max(1, min(int(workers), len(paths) or 1))) as ex:
+        yield from zip(paths, ex.map(run, paths))
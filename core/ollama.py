@@ -1,9 +1,20 @@
-import json, urllib.request
-from urllib.parse import urljoin
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+
 from core.config import OLLAMA
 from core.settings import SETTINGS
 
-def call_ollama_keywords(title: str, body: str, max_total_chars: int = 50, seeds: str | None = None) -> str | None:
+
+def _generate(base_url: str, model: str, prompt: str, timeout: int, **extra) -> str:
+    """经共享客户端调用（keep-alive、并发上限、重试与生成缓存）。"""
+    from services.llm_client import get_llm_client
+    return get_llm_client({**OLLAMA, **(SETTINGS.get("ai") or {}), "url": base_url}).generate(
+        prompt, model, timeout=timeout, **extra)
+
+
+def _target() -> tuple[str, int, str] | None:
+    """返回 ``(model, timeout, base_url)``；未启用 Ollama 时返回 ``None``。"""
     ai_cfg = SETTINGS.get("ai", {}) if isinstance(SETTINGS, dict) else {}
     provider = ai_cfg.get("provider") or "ollama"
     if provider not in ("ollama", ""):
@@ -18,6 +29,29 @@ def call_ollama_keywords(title: str, body: str, max_total_chars: int = 50, seeds
     model = ai_cfg.get("model") or OLLAMA.get("model", "llama3.1:latest")
     timeout = int(ai_cfg.get("timeout_sec") or OLLAMA.get("timeout_sec", 30))
     base_url = ai_cfg.get("url") or OLLAMA.get("url") or "http://127.0.0.1:11434"
+    return model, timeout, base_url
+
+
+def _with_seeds(out: str, seeds: str, max_total_chars: int) -> str:
+    """把 seeds 放到关键词最前面并截断到 ``max_total_chars``。"""
+    if seeds:
+        if out:
+            pure = out
+            for tok in [s.strip() for s in seeds.split(";") if s.strip()]:
+                pure = pure.replace(tok, "")
+            out = (seeds + ", " + pure).strip("，, \n")
+        else:
+            out = seeds
+    if len(out) > max_total_chars:
+        out = out[:max_total_chars]
+    return out
+
+
+def call_ollama_keywords(title: str, body: str, max_total_chars: int = 50, seeds: str | None = None) -> str | None:
+    target = _target()
+    if target is None:
+        return None
+    model, timeout, base_url = target
     seeds = (seeds or "").strip()
 
     prompt = (
@@ -30,24 +64,9 @@ def call_ollama_keywords(title: str, body: str, max_total_chars: int = 50, seeds
         "\n输出："
     ).replace("{max_len}", str(max_total_chars))
 
-    data = json.dumps({"model": model, "prompt": prompt, "stream": False}).encode("utf-8")
-    api_url = urljoin(base_url.rstrip('/')+'/', 'api/generate')
-    req = urllib.request.Request(api_url, data=data, headers={"Content-Type":"application/json"})
     try:
-        with urllib.request.urlopen(req, timeout=timeout) as resp:
-            x = json.loads(resp.read().decode("utf-8"))
-            out = (x.get("response") or "").strip().strip("，, \n")
-            if seeds:
-                if out:
-                    pure = out
-                    for tok in [s.strip() for s in seeds.split(";") if s.strip()]:
-                        pure = pure.replace(tok, "")
-                    out = (seeds + ", " + pure).strip("，, \n")
-                else:
-                    out = seeds
-            if len(out) > max_total_chars:
-                out = out[:max_total_chars]
-            return out
+        out = (_generate(base_url, model, prompt, timeout) or "").strip().strip("，, \n")
+        return _with_seeds(out, seeds, max_total_chars)
     except Exception:
         return None
 
@@ -62,20 +81,10 @@ def call_ollama_tags(title: str, body: str, max_labels: int = 5) -> str | None:
     keyword extraction and tag classification.
     """
 
-    ai_cfg = SETTINGS.get("ai", {}) if isinstance(SETTINGS, dict) else {}
-    provider = ai_cfg.get("provider") or "ollama"
-    if provider not in ("ollama", ""):
-        return None
-    enable = ai_cfg.get("enable")
-    if enable is not None:
-        if not enable:
-            return None
-    elif not OLLAMA.get("enable"):
+    target = _target()
+    if target is None:
         return None
-
-    model = ai_cfg.get("model") or OLLAMA.get("model", "llama3.1:latest")
-    timeout = int(ai_cfg.get("timeout_sec") or OLLAMA.get("timeout_sec", 30))
-    base_url = ai_cfg.get("url") or OLLAMA.get("url") or "http://127.0.0.1:11434"
+    model, timeout, base_url = target
 
     prompt = (
         "你是本地文件分类助手。基于‘标题+正文节选’输出若干分类标签，要求："
@@ -86,16 +95,77 @@ def call_ollama_tags(title: str, body: str, max_labels: int = 5) -> str | None:
         "\n输出："
     ).replace("{max_labels}", str(max_labels))
 
-    data = json.dumps({"model": model, "prompt": prompt, "stream": False}).encode("utf-8")
-    api_url = urljoin(base_url.rstrip('/')+'/', 'api/generate')
-    req = urllib.request.Request(api_url, data=data, headers={"Content-Type": "application/json"})
     try:
-        with urllib.request.urlopen(req, timeout=timeout) as resp:
-            x = json.loads(resp.read().decode("utf-8"))
-            tags = (x.get("response") or "").strip().strip("，, \n")
-            return tags
+        tags = (_generate(base_url, model, prompt, timeout) or "").strip().strip("，, \n")
+        return tags
     except Exception:
         return None
 
 
-__all__ = ["call_ollama_keywords", "call_ollama_tags"]
+def _json_list(value) -> list[str] | None:
+    if isinstance(value, str):
+        value = re.split(r"[，,;；、]", value)
+    if not isinstance(value, list):
+        return None
+    return [str(v).strip() for v in value if str(v).strip()]
+
+
+def _parse_combined(raw: str) -> tuple[list[str], list[str]] | None:
+    """解析 ``{"keywords": [...], "tags": [...]}``；容忍代码块和前后多余文字。"""
+    start, end = raw.find("{"), raw.rfind("}")
+    if start < 0 or end <= start:
+        return None
+    try:
+        data = json.loads(raw[start:end + 1])
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    keywords, tags = _json_list(data.get("keywords")), _json_list(data.get("tags"))
+    if not keywords or tags is None:
+        return None
+    return keywords, tags
+
+
+def call_ollama_keywords_and_tags(title: str, body: str, max_total_chars: int = 50,
+                                  seeds: str | None = None, max_labels: int = 5) -> tuple[str | None, str | None]:
+    """一次 JSON 生成同时得到关键词和分类标签，返回 ``(keywords, tags)``。
+
+    返回值格式与 :func:`call_ollama_keywords` / :func:`call_ollama_tags` 相同（逗号
+    分隔的字符串）。模型输出无法解析时，并发执行这两个函数作为回退。
+    """
+
+    target = _target()
+    if target is None:
+        return None, None
+    model, timeout, base_url = target
+    seeds = (seeds or "").strip()
+
+    prompt = (
+        "你是本地文件整理助手。基于“标题+正文节选”同时输出中文关键词和分类标签，要求："
+        "1) 只输出一个 JSON 对象：{\"keywords\": [\"...\"], \"tags\": [\"...\"]}，不要任何解释；"
+        "2) keywords 总长度<={max_len}字，如果提供了“用户指定关键词(seeds)”，必须把 seeds 放在最前面"
+        "（保持原顺序），再补充其他概括性关键词；"
+        "3) tags 不超过 {max_labels} 个，简洁且具有概括性。"
+        f"\nseeds: {seeds if seeds else '(无)'}"
+        f"\n标题: {title[:80]}"
+        f"\n正文节选: {body[:800]}"
+        "\n输出："
+    ).replace("{max_len}", str(max_total_chars)).replace("{max_labels}", str(max_labels))
+
+    try:
+        parsed = _parse_combined(_generate(base_url, model, prompt, timeout, format="json") or "")
+    except Exception:
+        return None, None
+    if parsed is not None:
+        keywords, tags = parsed
+        out = _with_seeds(", ".join(keywords), seeds, max_total_chars)
+        return out, ", ".join(tags[:max_labels])
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        kw = pool.submit(call_ollama_keywords, title, body, max_total_chars, seeds)
+        tags = pool.submit(call_ollama_tags, title, body, max_labels)
+        return kw.result(), tags.result()
+
+
+__all__ = ["call_ollama_keywords", "call_ollama_tags", "call_ollama_keywords_and_tags"]
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""按页流式读取 PDF 文本。
+
+``PyPDF2.PdfReader`` 只在访问某一页时才解析它，但解析过的对象会一直缓存在
+reader 里，逐页读完一本几千页的扫描件同样会把整份文档留在内存中。这里按
+``block_pages`` 页为一块，每块用一个新的 reader 读取后即丢弃：
+
+* :func:`iter_pages` 顺序产出 ``(页码, 文本)``，支持页码范围和字符预算提前
+  结束；
+* :func:`iter_pages_parallel` 把各块分给多个工作进程，按页码顺序产出，同时在途
+  的块数有上限；
+* :func:`write_markdown` 边读边把页面追加到 Markdown 文件。
+
+页码从 1 开始，范围为闭区间。
+"""
+from __future__ import annotations
+
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from collections import deque
+from pathlib import Path
+from typing import Deque, Iterator, List, Optional, Tuple
+
+PageRange = Tuple[int, Optional[int]]
+
+
+def parse_pages(spec: Optional[str]) -> Optional[PageRange]:
+    """解析 ``"3-10"`` / ``"5-"`` / ``"7"`` 形式的页码范围；空值表示全部。"""
+
+    if not spec or not str(spec).strip():
+        return None
+    start, sep, end = str(spec).strip().partition("-")
+    first = int(start) if start.strip() else 1
+    if not sep:
+        return first, first
+    return first, int(end) if end.strip() else None
+
+
+def page_count(path: str) -> int:
+    from PyPDF2 import PdfReader
+
+    return len(PdfReader(path).pages)
+
+
+def _blocks(total: int, pages: Optional[PageRange], block_pages: int) -> List[Tuple[int, int]]:
+    start, end = pages or (1, None)
+    start = max(1, start)
+    end = total if end is None else min(end, total)
+    return [(s, min(s + block_pages - 1, end)) for s in range(start, end + 1, max(1, block_pages))]
+
+
+def _range_pages(path: str, start: int, end: int) -> Iterator[Tuple[int, str]]:
+    """逐页读取 ``start..end``（新的 reader，读完即释放）。"""
+
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(path)
+    for no in range(start, end + 1):
+        try:
+            text = reader.pages[no - 1].extract_text() or ""
+        except Exception:
+            text = ""
+        yield no, text
+
+
+def _extract_range(path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """工作进程任务：一次读完一个页块。"""
+
+    return list(_range_pages(path, start, end))
+
+
+def iter_pages(path: str, pages: Optional[PageRange] = None, max_chars: Optional[int] = None,
+               block_pages: int = 16) -> Iterator[Tuple[int, str]]:
+    """顺序产出 ``(页码, 文本)``；累计文本达到 ``max_chars`` 后停止。"""
+
+    size = 0
+    for start, end in _blocks(page_count(path), pages, block_pages):
+        for no, text in _range_pages(path, start, end):
+            yield no, text
+            size += len(text)
+            if max_chars is not None and size >= max_chars:
+                return
+
+
+def iter_pages_parallel(path: str, workers: Optional[int] = None, pages: Optional[PageRange] = None,
+                        max_chars: Optional[int] = None, block_pages: int = 16) -> Iterator[Tuple[int, str]]:
+    """与 :func:`iter_pages` 相同，但各页块在 ``workers`` 个进程中并行解析。
+
+    同时最多 ``2 * workers`` 个块在途，内存占用与文档页数无关。
+    """
+
+    blocks = deque(_blocks(page_count(path), pages, block_pages))
+    workers = max(1, min(workers or os.cpu_count() or 1, len(blocks)))
+    if workers == 1:
+        yield from iter_pages(path, pages, max_chars, block_pages)
+        return
+    size = 0
+    running: Deque[Future] = deque()
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        while blocks or running:
+            while blocks and len(running) < 2 * workers:
+                running.append(pool.submit(_extract_range, path, *blocks.popleft()))
+            for no, text in running.popleft().result():
+                yield no, text
+                size += len(text)
+                if max_chars is not None and size >= max_chars:
+                    return
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def write_markdown(path: str, out_file: str | Path, pages: Optional[PageRange] = None,
+                   workers: int = 1, max_chars: Optional[int] = None, block_pages: int = 16) -> int:
+    """把 PDF 逐页写成 Markdown（每页一个 ``## 第 N 页`` 小节），返回写出的页数。
+
+    先写临时文件，完成后再替换目标文件；失败时删除临时文件。
+    """
+
+    out_file = Path(out_file)
+    tmp = out_file.with_name(out_file.name + ".part")
+    written = 0
+    source = iter_pages_parallel(path, workers, pages, max_chars, block_pages) if workers > 1 \
+        else iter_pages(path, pages, max_chars, block_pages)
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            for no, text in source:
+                if not text:
+                    continue
+                if written:
+                    f.write("\n")
+                f.write(f"## 第 {no} 页\n\n{text}\n")
+                written += 1
+        os.replace(tmp, out_file)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return written
+
+
+__all__ = ["parse_pages", "page_count", "iter_pages", "iter_pages_parallel", "write_markdown"]
@@ -10,6 +10,11 @@ class ExtractResult(dict):
     Plugins should populate ``text`` with the raw concatenated text, ``meta``
     with any plugin specific metadata and, most importantly, ``chunks`` which
     is a list of :class:`core.chunking.Chunk` objects.
+
+    Plugins that understand document structure may instead implement
+    ``iter_sections(path)`` yielding :class:`core.chunking.Section` objects;
+    :func:`core.extractors.extract_chunks` then chunks them itself and
+    ``chunks`` can stay empty.
     """
 
     text: str
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""扫描会话：后台刷新文件目录，前端用游标流式分页。
+
+首个请求创建会话并在后台线程中执行 :meth:`FileCatalog.refresh`；每个目录提交后
+按遍历顺序登记到 ``scan_dirs``，并累加匹配的文件数作为目前已知的 ``total``。
+后续请求携带游标 ``(会话, 目录序号, 目录内最后路径)`` 继续读取，已完成的目录可
+立即返回，未完成时最多等待 ``wait`` 秒。内存占用只与页大小有关，与目录树大小无关。
+
+开启 SHA256 时哈希在遍历结束后统一计算，遍历期间返回的行 ``sha256`` 可能为空。
+"""
+from __future__ import annotations
+
+import base64
+import json
+import logging
+import threading
+import time
+import uuid
+from dataclasses import asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.catalog import FileCatalog, get_catalog
+from core.utils.iterfiles import to_file_rows
+
+logger = logging.getLogger(__name__)
+
+SESSION_TTL = 600  # 秒；空闲超过该时长的会话被回收
+MAX_SESSIONS = 32
+
+
+class ScanSession:
+    def __init__(self, catalog: FileCatalog, root: str, recursive: bool, with_hash: bool,
+                 category: Optional[str], types: Optional[List[str]]) -> None:
+        self.id = uuid.uuid4().hex
+        self.catalog = catalog
+        self.root = root
+        self.recursive = recursive
+        self.with_hash = with_hash
+        self.category = category
+        self.types = types
+        self.total = 0
+        self.dirs = 0
+        self.done = False
+        self.error: Optional[str] = None
+        self.last_access = time.time()
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=f"scan-{self.id[:8]}", daemon=True)
+
+    def start(self) -> "ScanSession":
+        self._thread.start()
+        return self
+
+    def _on_dir(self, dir_path: str) -> None:
+        n = self.catalog.count_dir(dir_path, self.category, self.types)
+        with self._cond:
+            self.catalog.add_session_dir(self.id, self.dirs, dir_path)
+            self.dirs += 1
+            self.total += n
+            self._cond.notify_all()
+
+    def _run(self) -> None:
+        try:
+            self.catalog.refresh(self.root, self.recursive, self.with_hash, on_dir=self._on_dir)
+        except Exception as e:  # 后台线程：记录错误并结束会话
+            logger.exception("scan session %s failed", self.id)
+            self.error = str(e)
+        with self._cond:
+            self.done = True
+            self._cond.notify_all()
+
+    # 分页 ---------------------------------------------------------------
+    def page(self, seq: int, after: Optional[str], size: int, wait: float) -> Tuple[List[Dict[str, Any]], int, Optional[str]]:
+        """从 ``(seq, after)`` 起读取最多 ``size`` 行，返回 ``(rows, seq, after)``。"""
+
+        self.last_access = time.time()
+        deadline = time.monotonic() + wait
+        rows: List[Dict[str, Any]] = []
+        while len(rows) < size:
+            with self._cond:
+                while seq >= self.dirs and not self.done:
+                    remaining = deadline - time.monotonic()
+                    if rows or remaining <= 0:  # 已有数据就先返回，不等整页
+                        break
+                    self._cond.wait(remaining)
+                if seq >= self.dirs:
+                    break
+            dir_path = self.catalog.session_dir(self.id, seq)
+            batch = self.catalog.dir_rows(dir_path, self.category, self.types, after, size - len(rows))
+            rows.extend(asdict(r) for r in to_file_rows(batch, self.with_hash))
+            if len(rows) < size:
+                seq, after = seq + 1, None
+            else:
+                after = batch[-1]["path"] if batch else after
+        return rows, seq, after
+
+    def finished(self, seq: int) -> bool:
+        return self.done and seq >= self.dirs
+
+    def close(self) -> None:
+        self.catalog.drop_session(self.id)
+
+
+_SESSIONS: Dict[str, ScanSession] = {}
+_LOCK = threading.Lock()
+
+
+def _reap() -> None:
+    now = time.time()
+    idle = sorted(_SESSIONS.values(), key=lambda s: s.last_access)
+    for s in idle:
+        if s.done and (now - s.last_access > SESSION_TTL or len(_SESSIONS) > MAX_SESSIONS):
+            _SESSIONS.pop(s.id, None)
+            s.close()
+
+
+def start_session(root: str, recursive: bool, with_hash: bool, category: Optional[str],
+                  types: Optional[List[str]]) -> ScanSession:
+    with _LOCK:
+        _reap()
+        session = ScanSession(get_catalog(), root, recursive, with_hash, category, types)
+        _SESSIONS[session.id] = session
+    return session.start()
+
+
+def get_session(session_id: str) -> Optional[ScanSession]:
+    with _LOCK:
+        return _SESSIONS.get(session_id)
+
+
+def encode_cursor(session_id: str, seq: int, after: Optional[str]) -> str:
+    raw = json.dumps([session_id, seq, after], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int, Optional[str]]:
+    """解析游标；格式错误时抛出 ``ValueError``。"""
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        session_id, seq, after = json.loads(raw.decode("utf-8"))
+        return str(session_id), int(seq), after
+    except Exception as e:
+        raise ValueError("invalid cursor") from e
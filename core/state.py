@@ -1,3 +1,5 @@
+# 旧版整体读写的 state.json，仅供已停用的 api/routes.py 使用；
+# 关键词现存于 core.keyword_store（首次启动时自动迁移本文件）。
 import json
 from pathlib import Path
 
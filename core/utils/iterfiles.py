@@ -1,10 +1,9 @@
-import os, hashlib, re
-from datetime import datetime
+import os, re
 from pathlib import Path
-from typing import Iterable, Optional
-from dateutil.tz import tzlocal
+from typing import Dict, Iterable, List, Optional
+from core.catalog import detect_category, get_catalog
 from core.config import ALLOWED_ROOTS
-from core.models import CATEGORIES, FileRow
+from core.models import FileRow
 
 def is_under_allowed_roots(path: str) -> bool:
     try:
@@ -19,58 +18,37 @@ def is_under_allowed_roots(path: str) -> bool:
                 return True
     return False
 
-def detect_category(ext: str) -> str:
-    e = (ext or "").lower().lstrip(".")
-    for cat, exts in CATEGORIES.items():
-        if e in exts:
-            return cat
-    return "TEXT"
-
 def iter_files(scan_dir: str, with_hash: bool, cat: Optional[str], types: Optional[list[str]], recursive: bool=True) -> Iterable[FileRow]:
-    tz = tzlocal()
-    allowed_types = set([t.lower() for t in types]) if types else None
+    """增量刷新文件目录后，按路径顺序返回 ``scan_dir`` 下的文件。"""
+    catalog = get_catalog()
+    catalog.refresh(scan_dir, recursive=recursive, with_hash=with_hash)
+    batch = []
+    for row in catalog.iter_rows(scan_dir, recursive, cat, types):
+        batch.append(row)
+        if len(batch) >= 500:
+            yield from to_file_rows(batch, with_hash)
+            batch = []
+    yield from to_file_rows(batch, with_hash)
 
-    if recursive:
-        walker = os.walk(scan_dir)
-        for root, _, files in walker:
-            for fn in files:
-                yield from _yield_row(root, fn, with_hash, cat, allowed_types, tz)
-    else:
-        try:
-            for fn in os.listdir(scan_dir):
-                full = os.path.join(scan_dir, fn)
-                if os.path.isfile(full):
-                    yield from _yield_row(scan_dir, fn, with_hash, cat, allowed_types, tz)
-        except Exception:
-            return
+def to_file_rows(rows, with_hash: bool = False) -> List[FileRow]:
+    """批量转换，关键词一次查询取回。"""
+    from core.keyword_store import get_keyword_store
+    rows = list(rows)
+    kws = get_keyword_store().get_many(r["path"] for r in rows)
+    return [to_file_row(r, with_hash, kws) for r in rows]
 
-def _yield_row(root, fn, with_hash, cat, allowed_types, tz):
-    full = os.path.join(root, fn)
-    try:
-        st = os.stat(full)
-        name, ext = os.path.splitext(fn)
-        ext = (ext or "").lower().lstrip(".")
-        detected = detect_category(ext)
-        if cat and detected != cat:
-            return
-        if allowed_types and ext not in allowed_types:
-            return
-        mtime = datetime.fromtimestamp(st.st_mtime, tz).isoformat(timespec="seconds")
-        sha256 = None
-        if with_hash:
-            h = hashlib.sha256()
-            with open(full, "rb") as f:
-                for chunk in iter(lambda: f.read(1024 * 1024), b""):
-                    h.update(chunk)
-            sha256 = h.hexdigest()
-        from core.state import STATE
-        kw = STATE.get("keywords", {}).get(full)
-        if isinstance(kw, str):
-            kw = [w.strip() for w in re.split(r"[，,;；]", kw) if w.strip()]
-        previewable = detected in ("IMAGE","VIDEO","AUDIO")
-        yield FileRow(
-            full_path=full, dir_path=root, name=name, ext=ext, category=detected,
-            size_bytes=st.st_size, mtime_iso=mtime, sha256=sha256, keywords=kw, previewable=previewable
-        )
-    except (PermissionError, FileNotFoundError, OSError):
-        return
+def to_file_row(row, with_hash: bool = False, keywords: Optional[Dict[str, List[str]]] = None) -> FileRow:
+    """``keywords`` 为预先批量取回的关键词；缺省时按路径单独查询。"""
+    if keywords is None:
+        from core.keyword_store import get_keyword_store
+        kw = get_keyword_store().get(row["path"])
+    else:
+        kw = keywords.get(row["path"])
+    if isinstance(kw, str):
+        kw = [w.strip() for w in re.split(r"[，,;；]", kw) if w.strip()]
+    return FileRow(
+        full_path=row["path"], dir_path=row["dir"], name=row["name"], ext=row["ext"],
+        category=row["category"], size_bytes=row["size"], mtime_iso=row["mtime_iso"],
+        sha256=row["sha256"] if with_hash else None, keywords=kw,
+        previewable=row["category"] in ("IMAGE", "VIDEO", "AUDIO"),
+    )
@@ -0,0 +1,438 @@
+# -*- coding: utf-8 -*-
+"""文件系统监听：文件变化后增量更新检索集合与规范化产物。
+
+后端二选一：
+
+* ``inotify``（Linux）：通过 ctypes 调用 ``inotify_init1`` / ``inotify_add_watch``，
+  对每个目录单独加 watch，新建或移入的目录会被补加并把其中已有文件视为新增；
+  内核队列溢出（``IN_Q_OVERFLOW``）时退化为一次目录刷新。
+* ``poll``：其他平台的纯 Python 兜底，每隔 ``poll_interval_sec`` 对根目录做一次
+  :meth:`FileCatalog.refresh` （``deep=True``），由目录差异得到变化的文件。
+
+事件按路径合并去抖：同一路径在 ``debounce_sec`` 内的多次写入只处理最后一次，
+移动拆成“旧路径删除 + 新路径新增”。静默期结束或积累到 ``batch_size`` 个路径后
+整批交给 :class:`LiveIndexer`：用 :func:`core.extractors.extract_chunks` 重新抽取，
+再经 :func:`core.index_jobs.replace_documents` 删掉这些文件旧的分块并一次性
+``upsert``；可选地对变化文件执行 :func:`core.normalize_runner.normalize_file`。
+
+配置位于 ``config/settings.json`` 的 ``watcher`` 段，``enabled`` 为真时随应用启动。
+"""
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from core.catalog import FileCatalog, get_catalog
+
+logger = logging.getLogger(__name__)
+
+UPSERT = "upsert"
+DELETE = "delete"
+
+# 编辑器/下载器的临时文件，写完后会被改名为正式文件
+_TEMP_SUFFIXES = (".tmp", ".temp", ".part", ".crdownload", ".swp", ".swx", "~")
+_TEMP_PREFIXES = ("~$", ".~lock.", ".#")
+
+# <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+_WATCH_MASK = (
+    IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+)
+_EVENT = struct.Struct("iIII")
+
+
+def is_ignored(path: str) -> bool:
+    name = os.path.basename(path)
+    return name.startswith(_TEMP_PREFIXES) or name.lower().endswith(_TEMP_SUFFIXES)
+
+
+class Debouncer:
+    """按路径合并事件，静默 ``delay`` 秒或攒满 ``batch_size`` 后整批交付。"""
+
+    def __init__(self, sink: Callable[[Dict[str, str]], None], delay: float = 2.0,
+                 batch_size: int = 256) -> None:
+        self.sink = sink
+        self.delay = delay
+        self.batch_size = batch_size
+        self._pending: Dict[str, str] = {}
+        self._last = 0.0
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread: Optional[threading.Thread] = None
+
+    def push(self, kind: str, path: str) -> None:
+        if is_ignored(path):
+            return
+        with self._cond:
+            self._pending[path] = kind  # 以最后一次事件为准
+            self._last = time.monotonic()
+            self._cond.notify()
+
+    def ready(self, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        return bool(self._pending) and (
+            len(self._pending) >= self.batch_size or now - self._last >= self.delay
+        )
+
+    def flush(self) -> Dict[str, str]:
+        """取出当前积累的事件并交给 ``sink``（也供测试/停止时直接调用）。"""
+
+        with self._cond:
+            batch, self._pending = self._pending, {}
+        if batch:
+            try:
+                self.sink(batch)
+            except Exception:  # 单批失败不影响后续监听
+                logger.exception("watcher batch of %d paths failed", len(batch))
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stop and not self.ready():
+                    timeout = None if not self._pending else max(0.05, self._last + self.delay - time.monotonic())
+                    self._cond.wait(timeout)
+                if self._stop:
+                    break
+            self.flush()
+        self.flush()
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="watch-debounce", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+
+
+# 后端 -------------------------------------------------------------------
+class PollingBackend:
+    """定期对根目录做深度刷新，从目录差异中产生事件。"""
+
+    name = "poll"
+
+    def __init__(self, roots: List[str], emit: Callable[[str, str], None], catalog: FileCatalog,
+                 interval: float = 30.0) -> None:
+        self.roots = roots
+        self.emit = emit
+        self.catalog = catalog
+        self.interval = interval
+        self._stop = threading.Event()
+
+    def poll_once(self) -> None:
+        for root in self.roots:
+            self.catalog.refresh(root, recursive=True, deep=True, on_change=self.emit)
+
+    def run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll_once()
+            except Exception:
+                logger.exception("watcher poll failed")
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+class InotifyBackend:
+    """Linux inotify 后端（ctypes，无第三方依赖）。"""
+
+    name = "inotify"
+
+    def __init__(self, roots: List[str], emit: Callable[[str, str], None], catalog: FileCatalog) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.roots = roots
+        self.emit = emit
+        self.catalog = catalog
+        self._wd: Dict[int, str] = {}
+        self._paths: Dict[str, int] = {}
+        self._stop = threading.Event()
+        for root in roots:
+            self._watch_tree(root, announce=False)
+
+    @classmethod
+    def available(cls) -> bool:
+        return sys.platform.startswith("linux")
+
+    def _watch(self, path: str) -> None:
+        wd = self._add_watch(self.fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            logger.warning("inotify_add_watch(%s) failed: %s", path, os.strerror(err))
+            return
+        self._wd[wd] = path
+        self._paths[path] = wd
+
+    def _watch_tree(self, root: str, announce: bool) -> None:
+        """给 ``root`` 及其子目录加 watch；``announce`` 时把已有文件报告为新增。"""
+
+        stack = [root]
+        while stack:
+            d = stack.pop()
+            self._watch(d)
+            try:
+                with os.scandir(d) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                stack.append(entry.path)
+                            elif announce and entry.is_file():
+                                self.emit(UPSERT, entry.path)
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+
+    def _forget_tree(self, root: str) -> None:
+        prefix = root + os.sep
+        for path in [p for p in self._paths if p == root or p.startswith(prefix)]:
+            wd = self._paths.pop(path)
+            self._wd.pop(wd, None)
+            self._rm_watch(self.fd, wd)
+
+    def _removed_tree(self, root: str) -> None:
+        # 目录已不存在，只能从目录表得知其中的文件
+        for row in self.catalog.iter_rows(root, recursive=True):
+            self.emit(DELETE, row["path"])
+        self._forget_tree(root)
+
+    def _handle(self, wd: int, mask: int, name: str) -> None:
+        if mask & IN_Q_OVERFLOW:
+            logger.warning("inotify queue overflow; rescanning watched roots")
+            for root in self.roots:
+                self.catalog.refresh(root, recursive=True, deep=True, on_change=self.emit)
+            return
+        base = self._wd.get(wd)
+        if base is None:
+            return
+        if mask & IN_IGNORED:
+            self._wd.pop(wd, None)
+            if self._paths.get(base) == wd:
+                del self._paths[base]
+            return
+        if not name:  # IN_DELETE_SELF / IN_MOVE_SELF 由父目录的事件处理
+            return
+        path = os.path.join(base, name)
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                self._watch_tree(path, announce=True)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self._removed_tree(path)
+        elif mask & (IN_DELETE | IN_MOVED_FROM):
+            self.emit(DELETE, path)
+        elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE):
+            self.emit(UPSERT, path)
+
+    def read_events(self, timeout: float) -> int:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return 0
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return 0
+        n, pos = 0, 0
+        while pos + _EVENT.size <= len(buf):
+            wd, mask, _cookie, length = _EVENT.unpack_from(buf, pos)
+            pos += _EVENT.size
+            name = os.fsdecode(buf[pos:pos + length].rstrip(b"\0"))
+            pos += length
+            self._handle(wd, mask, name)
+            n += 1
+        return n
+
+    def run(self) -> None:
+        try:
+            while not self._stop.is_set():
+                self.read_events(1.0)
+        finally:
+            os.close(self.fd)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+# 处理 -------------------------------------------------------------------
+class LiveIndexer:
+    """把一批 ``path -> upsert/delete`` 应用到检索集合（以及规范化产物）。"""
+
+    def __init__(self, manager, collection: str = "default", normalize_root: Optional[Path] = None,
+                 on_unsupported: str = "fallback",
+                 extract: Optional[Callable[[str], Iterable[Any]]] = None) -> None:
+        self.manager = manager
+        self.collection = collection
+        self.normalize_root = normalize_root
+        self.on_unsupported = on_unsupported
+        if extract is None:
+            from core.extractors import extract_chunks as extract
+        self.extract = extract
+        self.stats = {"batches": 0, "upserted": 0, "deleted": 0, "errors": 0}
+
+    def __call__(self, batch: Dict[str, str]) -> None:
+        from core.index_jobs import replace_documents
+
+        docs: Dict[str, List[Any]] = {}
+        for path, kind in batch.items():
+            if kind != UPSERT or not os.path.isfile(path):
+                continue
+            try:
+                docs[path] = list(self.extract(path))
+            except Exception:
+                logger.exception("extracting %s failed", path)
+                self.stats["errors"] += 1
+        upserted, deleted = replace_documents(self.manager, self.collection, docs, removed=batch)
+        self.stats["upserted"] += upserted
+        self.stats["deleted"] += deleted
+        self.stats["batches"] += 1
+        if self.normalize_root is not None:
+            from core.normalize_runner import normalize_many
+            for path, res in normalize_many(docs, self.normalize_root, on_unsupported=self.on_unsupported):
+                if isinstance(res, Exception):
+                    logger.error("normalizing %s failed: %s", path, res)
+                    self.stats["errors"] += 1
+
+
+class Watcher:
+    """监听若干根目录，把去抖后的变化交给 ``sink``。"""
+
+    def __init__(self, roots: Iterable[str], sink: Callable[[Dict[str, str]], None],
+                 backend: str = "auto", debounce_sec: float = 2.0, batch_size: int = 256,
+                 poll_interval_sec: float = 30.0, catalog: Optional[FileCatalog] = None) -> None:
+        self.roots = [str(Path(r).resolve()) for r in roots if os.path.isdir(r)]
+        self.catalog = catalog or get_catalog()
+        self.sink = sink
+        self.debouncer = Debouncer(self._deliver, debounce_sec, batch_size)
+        self.backend_name = backend
+        self.poll_interval_sec = poll_interval_sec
+        self.backend = None
+        self.ready = threading.Event()
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def _deliver(self, batch: Dict[str, str]) -> None:
+        if isinstance(self.backend, InotifyBackend):
+            # 轮询后端本身就在刷新目录表；inotify 下顺带更新受影响的目录
+            for d in {os.path.dirname(p) for p in batch}:
+                self.catalog.refresh(d, recursive=False)
+        self.sink(batch)
+
+    def _make_backend(self):
+        if self.backend_name in ("auto", "inotify") and InotifyBackend.available():
+            try:
+                return InotifyBackend(self.roots, self.debouncer.push, self.catalog)
+            except (OSError, AttributeError) as e:
+                if self.backend_name == "inotify":
+                    raise
+                logger.info("inotify unavailable (%s); falling back to polling", e)
+        return PollingBackend(self.roots, self.debouncer.push, self.catalog, self.poll_interval_sec)
+
+    def start(self) -> "Watcher":
+        """在后台线程中同步目录表、建立监听并开始处理事件，立即返回。"""
+
+        self.debouncer.start()
+        self._thread = threading.Thread(target=self._run, name="watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        try:
+            # 先把目录表同步到当前状态，作为轮询后端的比较基线（不产生事件）；
+            # 大目录树上这一步和 inotify 逐目录加 watch 都很慢，因此不在启动线程中做
+            for root in self.roots:
+                if self._stopped.is_set():
+                    return
+                self.catalog.refresh(root, recursive=True)
+            backend = self._make_backend()
+        except Exception:
+            logger.exception("watcher failed to start")
+            return
+        with self._lock:
+            self.backend = backend
+            if self._stopped.is_set():
+                backend.stop()  # run() 会立即返回并释放资源
+        logger.info("watching %d root(s) with %s backend", len(self.roots), backend.name)
+        self.ready.set()
+        backend.run()
+
+    def stop(self) -> None:
+        with self._lock:
+            self._stopped.set()
+            if self.backend is not None:
+                self.backend.stop()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.debouncer.stop()
+
+
+_WATCHER: Optional[Watcher] = None
+
+
+def start_watcher(manager, config: Optional[Dict[str, Any]] = None) -> Optional[Watcher]:
+    """按 ``settings.json`` 的 ``watcher`` 段启动全局监听（未启用时返回 ``None``）。"""
+
+    global _WATCHER
+    from core.config import ALLOWED_ROOTS
+    from core.settings import SETTINGS
+
+    settings = SETTINGS if config is None else config
+    cfg = settings.get("watcher") or {}
+    if not cfg.get("enabled") or _WATCHER is not None:
+        return _WATCHER
+    collection = cfg.get("collection") or "default"
+    normalize_root = None
+    norm_cfg = settings.get("normalize") or {}
+    if cfg.get("normalize") and norm_cfg.get("enabled"):
+        normalize_root = Path(norm_cfg.get("artifact_dir") or "data/normalized") / collection
+    sink = LiveIndexer(manager, collection, normalize_root, norm_cfg.get("on_unsupported", "fallback"))
+    _WATCHER = Watcher(
+        cfg.get("roots") or ALLOWED_ROOTS,
+        sink,
+        backend=cfg.get("backend", "auto"),
+        debounce_sec=float(cfg.get("debounce_sec", 2.0)),
+        batch_size=int(cfg.get("batch_size", 256)),
+        poll_interval_sec=float(cfg.get("poll_interval_sec", 30.0)),
+    ).start()
+    return _WATCHER
+
+
+def get_watcher() -> Optional[Watcher]:
+    return _WATCHER
+
+
+__all__ = [
+    "Debouncer", "PollingBackend", "InotifyBackend", "LiveIndexer", "Watcher",
+    "start_watcher", "get_watcher", "is_ignored",
+]
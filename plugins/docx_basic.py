@@ -1,41 +1,53 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
+import re
 from pathlib import Path
+from typing import Iterator, List, Tuple
 from core.plugin_base import ExtractResult, register
-from core.chunking import Chunk
+from core.chunking import Section, sections_text
+
+# "Heading 2" / "标题 2" / "Title"
+_HEADING_STYLE = re.compile(r"^(?:heading|标题)\s*(\d+)$", re.I)
 
 class DocxBasic:
     name = "docx-basic"
-    version = "0.1.0"
+    version = "0.2.0"
     priority = 70
 
     def can_handle(self, path: str) -> bool:
         return Path(path).suffix.lower() == '.docx'
 
+    def iter_sections(self, path: str) -> Iterator[Section]:
+        """按标题样式切分正文，表格作为单独的 Section 附在最后。"""
+        from docx import Document
+        doc = Document(path)
+        heads: List[Tuple[int, str]] = []
+        buf: List[str] = []
+        for p in doc.paragraphs:
+            text = p.text
+            if not text:
+                continue
+            style = getattr(p.style, 'name', '') or ''
+            m = _HEADING_STYLE.match(style.strip())
+            level = int(m.group(1)) if m else (0 if style.lower() == 'title' else None)
+            if level is not None:
+                if buf:
+                    yield Section("\n".join(buf), tuple(h for _, h in heads))
+                    buf = []
+                heads = [h for h in heads if h[0] < level] + [(level, text.strip())]
+            buf.append(text)
+        if buf:
+            yield Section("\n".join(buf), tuple(h for _, h in heads))
+        for i, table in enumerate(doc.tables, 1):
+            rows = [",".join(cell.text for cell in row.cells) for row in table.rows]
+            if rows:
+                yield Section("\n".join(rows), (f"表格 {i}",))
+
     def extract(self, path: str, max_chars: int = 4000) -> ExtractResult:
-        text = ''
-        chunks = []
         try:
-            from docx import Document
-            doc = Document(path)
-            parts = []
-            for p in doc.paragraphs[:200]:
-                if p.text:
-                    parts.append(p.text)
-                if sum(len(x) for x in parts) >= max_chars:
-                    break
-            text = "\n".join(parts)[:max_chars]
+            text = sections_text(self.iter_sections(path), max_chars)
         except Exception:
             text = ''
-        if text:
-            chunks.append(
-                Chunk(
-                    id=f"{path}#0",
-                    doc_id=path,
-                    text=text,
-                    metadata={'handler': self.name},
-                )
-            )
-        return ExtractResult(text=text, meta={'handler': self.name}, chunks=chunks)
+        return ExtractResult(text=text, meta={'handler': self.name}, chunks=[])
     
 register(DocxBasic())
@@ -1,51 +1,58 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 from pathlib import Path
+from typing import Iterable, Iterator, List
 from core.plugin_base import ExtractResult, register
-from core.chunking import Chunk
+from core.chunking import Section, sections_text
+
+_BLOCK_ROWS = 500  # 每个 Section 的最大行数
+
+def _cell(x) -> str:
+    return str(x) if x is not None else ""
 
 class ExcelBasic:
     name = "excel-basic"
-    version = "0.1.0"
+    version = "0.2.0"
     priority = 70
 
     def can_handle(self, path: str) -> bool:
         return Path(path).suffix.lower() in {'.xlsx', '.xls'}
 
+    @staticmethod
+    def _blocks(sheet: str, rows: Iterable[str]) -> Iterator[Section]:
+        buf: List[str] = []
+        for row in rows:
+            if row.strip(","):
+                buf.append(row)
+            if len(buf) >= _BLOCK_ROWS:
+                yield Section("\n".join(buf), (sheet,))
+                buf = []
+        if buf:
+            yield Section("\n".join(buf), (sheet,))
+
+    def iter_sections(self, path: str) -> Iterator[Section]:
+        """逐个工作表流式读取，每 ``_BLOCK_ROWS`` 行输出一个 Section。"""
+        if Path(path).suffix.lower() == '.xlsx':
+            import openpyxl
+            wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+            try:
+                for ws in wb.worksheets:
+                    rows = (",".join(_cell(x) for x in row) for row in ws.iter_rows(values_only=True))
+                    yield from self._blocks(ws.title, rows)
+            finally:
+                wb.close()
+        else:
+            import xlrd
+            wb = xlrd.open_workbook(path, on_demand=True)
+            for sh in wb.sheets():
+                rows = (",".join(_cell(sh.cell_value(i, j)) for j in range(sh.ncols)) for i in range(sh.nrows))
+                yield from self._blocks(sh.name, rows)
+
     def extract(self, path: str, max_chars: int = 4000) -> ExtractResult:
-        text = ''
-        chunks = []
         try:
-            ext = Path(path).suffix.lower()
-            rows = []
-            if ext == '.xlsx':
-                import openpyxl
-                wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
-                ws = wb.active
-                for i, row in enumerate(ws.iter_rows(values_only=True)):
-                    rows.append(",".join([str(x) if x is not None else "" for x in row]))
-                    if i >= 30: break
-            else:
-                try:
-                    import xlrd
-                    wb = xlrd.open_workbook(path)
-                    sh = wb.sheet_by_index(0)
-                    for i in range(min(30, sh.nrows)):
-                        rows.append(",".join([str(sh.cell_value(i, j)) for j in range(sh.ncols)]))
-                except Exception:
-                    pass
-            text = "\n".join(rows)[:max_chars]
+            text = sections_text(self.iter_sections(path), max_chars)
         except Exception:
             text = ''
-        if text:
-            chunks.append(
-                Chunk(
-                    id=f"{path}#0",
-                    doc_id=path,
-                    text=text,
-                    metadata={'handler': self.name},
-                )
-            )
-        return ExtractResult(text=text, meta={'handler': self.name}, chunks=chunks)
+        return ExtractResult(text=text, meta={'handler': self.name}, chunks=[])
     
 register(ExcelBasic())
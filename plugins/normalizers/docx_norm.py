@@ -2,14 +2,12 @@ from __future__ import annotations
 
 import argparse
 import csv
-import os
-import subprocess
-import sys
 from pathlib import Path
 
 from docx import Document as DocxDocument
 
 from core.normalize_base import NormalizeResult, register
+from core.normalize_pool import run_normalizer
 from core.settings import SETTINGS
 
 TIMEOUT = SETTINGS.get("normalize", {}).get("timeouts", {}).get("docx", 1800)
@@ -50,22 +48,17 @@ class DocxNormalizer:
     def can_handle(self, path: str) -> bool:
         return path.lower().endswith(".docx")
 
-    def normalize(self, path: str, out_root: str) -> NormalizeResult:
-        cmd = [sys.executable, str(Path(__file__).resolve()), "--input", path, "--out", out_root]
-        env = os.environ.copy()
-        env.setdefault("PYTHONPATH", str(Path(__file__).resolve().parents[2]))
-        try:
-            proc = subprocess.run(cmd, capture_output=True, text=True, timeout=TIMEOUT, env=env)
-        except Exception as e:
-            return NormalizeResult(False, message=str(e))
-        if proc.returncode != 0:
-            msg = (proc.stderr or proc.stdout or "")[-800:]
-            return NormalizeResult(False, message=msg)
+    def process(self, path: str, out_root: str) -> NormalizeResult:
+        """在当前进程内转换（由 :mod:`core.normalize_pool` 的工作进程调用）。"""
+        process_docx(path, Path(out_root))
         md_paths = [str(p) for p in Path(out_root).glob("*.md")]
         csv_paths = [str(p) for p in Path(out_root).glob("*.csv")]
         sidecar = str(Path(out_root) / "sidecar.json") if (Path(out_root) / "sidecar.json").exists() else None
         return NormalizeResult(True, md_paths=md_paths, csv_paths=csv_paths, sidecar=sidecar)
 
+    def normalize(self, path: str, out_root: str) -> NormalizeResult:
+        return run_normalizer(self.name, path, out_root, TIMEOUT)
+
 
 register(DocxNormalizer())
 
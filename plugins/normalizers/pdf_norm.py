@@ -2,35 +2,37 @@ from __future__ import annotations
 
 import argparse
 import os
-import subprocess
-import sys
 from pathlib import Path
 
-from PyPDF2 import PdfReader
-
 from core.normalize_base import NormalizeResult, register
+from core.normalize_pool import run_normalizer
+from core.pdf_stream import PageRange, page_count, parse_pages, write_markdown
 from core.settings import SETTINGS
 
 TIMEOUT = SETTINGS.get("normalize", {}).get("timeouts", {}).get("pdf", 7200)
+PDF_CFG = SETTINGS.get("normalize", {}).get("pdf", {})
 
 
-def process_pdf(in_path: str, out_dir: Path) -> None:
-    reader = PdfReader(in_path)
+def process_pdf(in_path: str, out_dir: Path, pages: PageRange | None = None, workers: int | None = None) -> int:
+    """逐页写出 document.md；未指定 ``workers`` 且页数达到 ``parallel_min_pages`` 时
+    按页块多进程解析（命令行入口）。"""
     out_dir.mkdir(parents=True, exist_ok=True)
-    md_lines = []
-    for i, page in enumerate(reader.pages, start=1):
-        text = page.extract_text() or ""
-        if text:
-            md_lines.append(f"## 第 {i} 页\n\n{text}\n")
-    (out_dir / "document.md").write_text("\n".join(md_lines), encoding="utf-8")
+    block = int(PDF_CFG.get("block_pages", 16))
+    if workers is None:
+        workers = PDF_CFG.get("workers") or min(4, os.cpu_count() or 1)
+        if page_count(in_path) < int(PDF_CFG.get("parallel_min_pages", 64)):
+            workers = 1
+    return write_markdown(in_path, out_dir / "document.md", pages=pages, workers=workers, block_pages=block)
 
 
 def cli() -> int:
     ap = argparse.ArgumentParser()
     ap.add_argument("--input", required=True)
     ap.add_argument("--out", required=True)
+    ap.add_argument("--pages", help="页码范围，如 1-50")
+    ap.add_argument("--workers", type=int)
     args = ap.parse_args()
-    process_pdf(args.input, Path(args.out))
+    process_pdf(args.input, Path(args.out), parse_pages(args.pages), args.workers)
     return 0
 
 
@@ -42,22 +44,21 @@ class PdfNormalizer:
     def can_handle(self, path: str) -> bool:
         return path.lower().endswith(".pdf")
 
-    def normalize(self, path: str, out_root: str) -> NormalizeResult:
-        cmd = [sys.executable, str(Path(__file__).resolve()), "--input", path, "--out", out_root]
-        env = os.environ.copy()
-        env.setdefault("PYTHONPATH", str(Path(__file__).resolve().parents[2]))
-        try:
-            proc = subprocess.run(cmd, capture_output=True, text=True, timeout=TIMEOUT, env=env)
-        except Exception as e:
-            return NormalizeResult(False, message=str(e))
-        if proc.returncode != 0:
-            msg = (proc.stderr or proc.stdout or "")[-800:]
-            return NormalizeResult(False, message=msg)
+    def process(self, path: str, out_root: str) -> NormalizeResult:
+        """在当前进程内转换（由 :mod:`core.normalize_pool` 的工作进程调用）。
+
+        工作进程本身已按 ``max_concurrency`` 并行，这里不再另起页块进程池，
+        以免进程数相乘，也免得超时重建进程池时留下孤儿进程。
+        """
+        process_pdf(path, Path(out_root), workers=1)
         md_paths = [str(p) for p in Path(out_root).glob("*.md")]
         csv_paths = [str(p) for p in Path(out_root).glob("*.csv")]
         sidecar = str(Path(out_root) / "sidecar.json") if (Path(out_root) / "sidecar.json").exists() else None
         return NormalizeResult(True, md_paths=md_paths, csv_paths=csv_paths, sidecar=sidecar)
 
+    def normalize(self, path: str, out_root: str) -> NormalizeResult:
+        return run_normalizer(self.name, path, out_root, TIMEOUT)
+
 
 register(PdfNormalizer())
 
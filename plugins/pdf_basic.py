@@ -1,46 +1,40 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
+from typing import Iterable, Iterator, Tuple
 from core.plugin_base import ExtractResult, register
-from core.chunking import Chunk
+from core.chunking import Section, sections_text
+from core.pdf_stream import iter_pages
 
 class PdfBasic:
     name = "pdf-basic"
-    version = "0.1.0"
+    version = "0.2.0"
     priority = 60
 
     def can_handle(self, path: str) -> bool:
         return path.lower().endswith('.pdf')
 
+    def iter_sections(self, path: str) -> Iterator[Section]:
+        """逐页输出全部页面（页面按需解析，见 :mod:`core.pdf_stream`）。"""
+        return self._page_sections(iter_pages(path))
+
+    @staticmethod
+    def _page_sections(pages: Iterable[Tuple[int, str]]) -> Iterator[Section]:
+        for idx, ptxt in pages:
+            if ptxt.strip():
+                yield Section(ptxt, (), page=idx)
+
     def extract(self, path: str, max_chars: int = 4000) -> ExtractResult:
-        text = ''
-        chunks = []
+        pages_scanned = 0
         try:
-            from PyPDF2 import PdfReader
-            reader = PdfReader(path)
-            for idx, page in enumerate(reader.pages[:30], 1):
-                try:
-                    ptxt = (page.extract_text() or '')
-                except Exception:
-                    ptxt = ''
-                if ptxt:
-                    ptxt = ptxt[:max_chars]
-                    chunks.append(
-                        Chunk(
-                            id=f"{path}#p{idx}",
-                            doc_id=path,
-                            text=ptxt,
-                            page=idx,
-                            metadata={'handler': self.name},
-                        )
-                    )
-                    text += ptxt + "\n"
-                    if len(text) >= max_chars:
-                        break
-            text = text[:max_chars]
-            pages_scanned = min(len(getattr(reader,'pages',[])), 30)
+            def counted():
+                # 实际读过的页数（含空白页），字符预算用完后提前结束
+                nonlocal pages_scanned
+                for page in iter_pages(path):
+                    pages_scanned += 1
+                    yield page
+            text = sections_text(self._page_sections(counted()), max_chars)
         except Exception:
             text = ''
-            pages_scanned = 0
-        return ExtractResult(text=text, meta={'pages_scanned': pages_scanned, 'handler': self.name}, chunks=chunks)
+        return ExtractResult(text=text, meta={'pages_scanned': pages_scanned, 'handler': self.name}, chunks=[])
 
 register(PdfBasic())
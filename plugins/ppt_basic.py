@@ -1,82 +1,61 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
+import shutil
+import tempfile
 from pathlib import Path
+from typing import Iterator
 from core.plugin_base import ExtractResult, register
-from core.chunking import Chunk
+from core.chunking import Section, sections_text
+
+def _ppt_to_pptx(path: Path, tmpdir: str) -> str:
+    """借助 PowerPoint (win32com) 把 .ppt 另存为 .pptx。"""
+    import win32com.client
+    out = str(Path(tmpdir) / (path.stem + ".pptx"))
+    powerpoint = win32com.client.Dispatch("PowerPoint.Application")
+    powerpoint.Visible = 0
+    pres = powerpoint.Presentations.Open(str(path), WithWindow=False)
+    pres.SaveAs(out, 24)
+    pres.Close()
+    powerpoint.Quit()
+    return out
 
 class PptBasic:
     name = "ppt-basic"
-    version = "0.1.0"
+    version = "0.2.0"
     priority = 65
 
     def can_handle(self, path: str) -> bool:
         return Path(path).suffix.lower() in {'.pptx', '.ppt'}
 
-    def extract(self, path: str, max_chars: int = 4000) -> ExtractResult:
-        text = ''
-        chunks = []
+    @staticmethod
+    def _slides(path: str) -> Iterator[Section]:
+        from pptx import Presentation
+        prs = Presentation(path)
+        for i, slide in enumerate(prs.slides, 1):
+            slide_text = [shape.text for shape in slide.shapes if getattr(shape, "text", None)]
+            if not slide_text:
+                continue
+            title = slide.shapes.title
+            heading = (title.text.strip() if title is not None and title.text else '') or f"第 {i} 页"
+            yield Section("\n".join(slide_text), (heading,), page=i)
+
+    def iter_sections(self, path: str) -> Iterator[Section]:
+        """每张幻灯片一个 Section，以幻灯片标题作为 ``section_path``。"""
         p = Path(path)
+        if p.suffix.lower() == '.pptx':
+            yield from self._slides(path)
+            return
+        tmpdir = tempfile.mkdtemp(prefix="ppt2pptx_plug_")
+        try:
+            yield from self._slides(_ppt_to_pptx(p, tmpdir))
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def extract(self, path: str, max_chars: int = 4000) -> ExtractResult:
         try:
-            if p.suffix.lower() == '.pptx':
-                from pptx import Presentation
-                prs = Presentation(path)
-                parts = []
-                for i, slide in enumerate(prs.slides[:50]):
-                    slide_text = []
-                    for shape in slide.shapes:
-                        if hasattr(shape, "text") and shape.text:
-                            slide_text.append(shape.text)
-                    if slide_text:
-                        stxt = "\n".join(slide_text)[:max_chars]
-                        chunks.append(
-                            Chunk(
-                                id=f"{path}#s{i+1}",
-                                doc_id=path,
-                                text=stxt,
-                                page=i+1,
-                                metadata={'handler': self.name},
-                            )
-                        )
-                        parts.append(stxt)
-                    if sum(len(x) for x in parts) >= max_chars:
-                        break
-                text = "\n".join(parts)[:max_chars]
-            else:
-                try:
-                    import tempfile, win32com.client
-                    tmpdir = tempfile.mkdtemp(prefix="ppt2pptx_plug_")
-                    out = str(Path(tmpdir) / (p.stem + ".pptx"))
-                    powerpoint = win32com.client.Dispatch("PowerPoint.Application")
-                    powerpoint.Visible = 0
-                    pres = powerpoint.Presentations.Open(str(p), WithWindow=False)
-                    pres.SaveAs(out, 24)
-                    pres.Close()
-                    powerpoint.Quit()
-                    from pptx import Presentation
-                    prs = Presentation(out)
-                    parts = []
-                    for i, slide in enumerate(prs.slides[:50]):
-                        slide_text = []
-                        for shape in slide.shapes:
-                            if hasattr(shape, "text") and shape.text:
-                                slide_text.append(shape.text)
-                        if slide_text:
-                            stxt = "\n".join(slide_text)[:max_chars]
-                            chunks.append(
-                                Chunk(
-                                    id=f"{path}#s{i+1}",
-                                    doc_id=path,
-                                    text=stxt,
-                                    page=i+1,
-                                    metadata={'handler': self.name},
-                                )
-                            )
-                            parts.append(stxt)
-                    text = "\n".join(parts)[:max_chars]
-                except Exception:
-                    text = ''
+            text = sections_text(self.iter_sections(path), max_chars)
         except Exception:
             text = ''
-        return ExtractResult(text=text, meta={'handler': self.name}, chunks=chunks)
+        return ExtractResult(text=text, meta={'handler': self.name}, chunks=[])
 
 register(PptBasic())
@@ -1,29 +1,48 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
+import re
 from pathlib import Path
+from typing import Iterator, List, Tuple
 from core.plugin_base import ExtractResult, register
-from core.chunking import Chunk
+from core.chunking import Section, sections_text
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+_BLOCK_CHARS = 64 * 1024  # 单个 Section 的最大字符数，超出后按行切开继续输出
 
 class TextBasic:
     name = "text-basic"
-    version = "0.1.0"
+    version = "0.2.0"
     priority = 50
 
     def can_handle(self, path: str) -> bool:
         return Path(path).suffix.lower().lstrip('.') in {'txt','md','rtf','log','json','yaml','yml'}
 
+    def iter_sections(self, path: str) -> Iterator[Section]:
+        """逐行读取；Markdown 按标题层级切分，其它文本按块输出。"""
+        markdown = Path(path).suffix.lower() == '.md'
+        heads: List[Tuple[int, str]] = []
+        buf: List[str] = []
+        size = 0
+        with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+            for line in f:
+                m = _HEADING.match(line) if markdown else None
+                if m or size >= _BLOCK_CHARS:
+                    if buf:
+                        yield Section("".join(buf).rstrip("\n"), tuple(h for _, h in heads))
+                    buf, size = [], 0
+                if m:
+                    level = len(m.group(1))
+                    heads = [h for h in heads if h[0] < level] + [(level, m.group(2))]
+                buf.append(line)
+                size += len(line)
+        if buf:
+            yield Section("".join(buf).rstrip("\n"), tuple(h for _, h in heads))
+
     def extract(self, path: str, max_chars: int = 4000) -> ExtractResult:
         try:
-            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
-                txt = f.read(max_chars)
+            txt = sections_text(self.iter_sections(path), max_chars)
         except Exception:
             txt = ''
-        chunk = Chunk(
-            id=f"{path}#0",
-            doc_id=path,
-            text=txt,
-            metadata={'handler': self.name},
-        )
-        return ExtractResult(text=txt, meta={'handler': self.name}, chunks=[chunk])
+        return ExtractResult(text=txt, meta={'handler': self.name}, chunks=[])
 
 register(TextBasic())
@@ -1,13 +1,55 @@
 # -*- coding: utf-8 -*-
 import json
-import requests
 import re
 import logging
-from typing import List, Dict, Optional, Any
+import math
+from contextlib import closing
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import List, Dict, Optional, Any, Iterator, Tuple
+from core.chunking import Section, chunk_sections, count_tokens
 from core.config import CFG
+from services.llm_client import get_llm_client
 
 logger = logging.getLogger(__name__)
 
+
+@dataclass
+class KeywordPlan:
+    """How a document will be sent to the model.
+
+    ``chunks`` are packed so that each map prompt stays within
+    ``num_ctx`` minus the reserved output tokens; a single chunk is answered
+    by its map call alone, without a reduce step. Map results are reduced as
+    a tree: groups of up to ``reduce_fanout`` results are reduced in
+    parallel, level by level, for at most ``reduce_max_depth`` levels.
+    """
+    chunks: List[str]
+    chunk_budget: int  # estimated model tokens available for chunk text
+    prompt_tokens: List[int]  # estimated model tokens of each map prompt
+    reduce_fanout: int = 8
+    reduce_max_depth: int = 4
+
+    @property
+    def map_calls(self) -> int:
+        return len(self.chunks)
+
+    @property
+    def reduce_calls(self) -> int:
+        # groups of one are passed up without a call; the estimate ignores
+        # groups split early because their results exceed the context
+        n, calls, level = len(self.chunks), 0, 1
+        while n > self.reduce_fanout and level < self.reduce_max_depth:
+            groups = math.ceil(n / self.reduce_fanout)
+            calls += groups - (1 if n % self.reduce_fanout == 1 else 0)
+            n, level = groups, level + 1
+        return calls + (1 if n > 1 else 0)
+
+    @property
+    def planned_calls(self) -> int:
+        return self.map_calls + self.reduce_calls
+
+
 class AIKeywordService:
     def __init__(self):
         pass
@@ -28,29 +70,6 @@ class AIKeywordService:
             return "去除口头语、寒暄；保留人名/组织名/关键决策/行动项（含动词短语）。"
         return "优先考虑标题/小标题/结论段/列表项中的名词短语；避免空词。"
 
-    def _split_text(self, s: str, chunk_chars: int) -> List[str]:
-        s = s or ""
-        chunk_chars = max(500, int(chunk_chars or 2000))
-        out, buf = [], []
-        acc = 0
-        for line in s.splitlines():
-            L = len(line) + 1
-            if acc + L > chunk_chars and acc > 0:
-                out.append("\n".join(buf))
-                buf, acc = [line], L
-            else:
-                buf.append(line); acc += L
-        if buf:
-            out.append("\n".join(buf))
-        
-        final = []
-        for seg in out:
-            if len(seg) <= chunk_chars:
-                final.append(seg); continue
-            for i in range(0, len(seg), chunk_chars):
-                final.append(seg[i:i+chunk_chars])
-        return final
-
     def _json_from_text(self, text: str) -> Optional[Dict]:
         text = text.strip()
         try:
@@ -65,8 +84,7 @@ class AIKeywordService:
                 return None
         return None
 
-    def _ollama_generate(self, prompt: str) -> str:
-        ai = self._ai_config
+    def _check_provider(self, ai: dict) -> None:
         if ai.get("provider") != "ollama":
             # For now, simplistic fallback or error
             if ai.get("provider") in ("chatgpt", "deepseek"):
@@ -74,84 +92,176 @@ class AIKeywordService:
                logger.warning("Remote providers not fully implemented in backend service yet.")
             raise RuntimeError(f"Current backend implementation only supports 'ollama' or has partial support. Provider set to: {ai.get('provider')}")
 
-        url = (ai.get("url") or "http://localhost:11434").rstrip("/")
-        model = ai.get("model") or "qwen2:7b"
-        options = {
-            "num_ctx": int(ai.get("num_ctx", 8192)),
-            "temperature": float(ai.get("temperature", 0.3)),
-            "top_p": float(ai.get("top_p", 0.9)),
-            "repeat_penalty": float(ai.get("repeat_penalty", 1.1))
-        }
-        payload = {
-            "model": model,
-            "prompt": prompt,
-            "options": options,
-            "stream": False
+    def _generation_args(self, ai: dict) -> dict:
+        return {
+            "model": ai.get("model") or "qwen2:7b",
+            "options": {
+                "num_ctx": int(ai.get("num_ctx", 8192)),
+                "temperature": float(ai.get("temperature", 0.3)),
+                "top_p": float(ai.get("top_p", 0.9)),
+                "repeat_penalty": float(ai.get("repeat_penalty", 1.1))
+            },
+            "timeout": int(ai.get("timeout_sec", 120)),
         }
+
+    def _ollama_submit(self, prompt: str) -> Future:
+        """Queue one generation on the shared client (bounded by ``ai.max_in_flight``)."""
+        ai = self._ai_config
+        self._check_provider(ai)
+        return get_llm_client(ai).submit(prompt, **self._generation_args(ai))
+
+    def _ollama_generate(self, prompt: str) -> str:
         try:
-            resp = requests.post(f"{url}/api/generate", json=payload, timeout=int(ai.get("timeout_sec", 120)))
-            resp.raise_for_status()
-            data = resp.json()
-            return data.get("response", "")
+            return self._ollama_submit(prompt).result()
         except Exception as e:
             logger.error(f"Ollama call failed: {e}")
             raise
 
-    def map_reduce_keywords(self, title: str, body: str, doc_type: str, seeds: str = "", max_len: int = 50) -> dict:
+    def _json_result(self, fut: Future, what: str) -> dict:
+        try:
+            return self._json_from_text(fut.result()) or {}
+        except Exception as e:
+            logger.warning(f"{what} failed: {e}")
+            return {}
+
+    def _estimate_tokens(self, text: str) -> int:
+        # count_tokens counts words / CJK characters; real tokenizers split
+        # words further and also count punctuation, hence the ratio
+        return math.ceil(count_tokens(text) * float(self._ai_config.get("token_ratio", 1.3)))
+
+    def _map_prompt(self, title: str, doc_type: str, chunk_text: str) -> str:
         ai = self._ai_config
         prompts = CFG.get("prompts", {}) or {}
-        language = ai.get("language", "zh")
-        chunk_chars = int(ai.get("map_chunk_chars", 2000))
-        top_n = int(ai.get("reduce_top_n", 16))
-        top_pn = int(ai.get("reduce_top_pn", 8))
+        map_prompt_tpl = prompts.get("map") or "Extract keywords as JSON from:\n\"\"\"\n{{chunk_text}}\n\"\"\""
+        prompt = (map_prompt_tpl
+            .replace("{{filename}}", title or "")
+            .replace("{{path}}", "")
+            .replace("{{doc_type}}", doc_type or "TEXT")
+            .replace("{{language}}", ai.get("language", "zh"))
+            .replace("{{chunk_text}}", chunk_text)
+        )
+        return prompt.replace("{{doc_type_hints}}", self._doc_type_hints(doc_type))
 
-        if not body:
-            return {"title": title, "language": language, "keywords": [], "keyphrases": [], "summary": ""}
+    def plan(self, title: str, body: str, doc_type: str) -> KeywordPlan:
+        """Pack ``body`` into as few map prompts as fit the context window.
 
-        chunks = self._split_text(body, chunk_chars)
-        map_prompt_tpl = prompts.get("map") or "Extract keywords as JSON from:\n\"\"\"\n{{chunk_text}}\n\"\"\""
-        map_results = []
-
-        for idx, ck in enumerate(chunks, 1):
-            prompt = (map_prompt_tpl
-                .replace("{{filename}}", title or "")
-                .replace("{{path}}", "")
-                .replace("{{doc_type}}", doc_type or "TEXT")
-                .replace("{{language}}", language)
-                .replace("{{chunk_text}}", ck)
-            )
-            hint = self._doc_type_hints(doc_type)
-            prompt = prompt.replace("{{doc_type_hints}}", hint)
-            
+        The budget per chunk is ``num_ctx`` minus ``reserve_tokens`` (room for
+        the JSON answer) minus the prompt template itself. Chunks follow line
+        and sentence boundaries (see :func:`core.chunking.chunk_sections`).
+        """
+        ai = self._ai_config
+        ratio = float(ai.get("token_ratio", 1.3))
+        overhead = self._estimate_tokens(self._map_prompt(title, doc_type, ""))
+        budget = max(64, int(ai.get("num_ctx", 8192)) - int(ai.get("reserve_tokens", 1024)) - overhead)
+        chunks = [c.text for c in chunk_sections(title or "doc", [Section(body or "")],
+                                                 max_tokens=max(1, int(budget / ratio)), overlap_tokens=0)]
+        return KeywordPlan(chunks, budget, [overhead + self._estimate_tokens(c) for c in chunks],
+                           max(2, int(ai.get("reduce_fanout", 8))), max(1, int(ai.get("reduce_max_depth", 4))))
+
+    def _submit_maps(self, prompts: List[str]) -> List[Optional[Future]]:
+        # all map calls are queued at once; the shared client runs them concurrently
+        futures = []
+        for prompt in prompts:
             try:
-                text = self._ollama_generate(prompt)
-                obj = self._json_from_text(text) or {}
+                futures.append(self._ollama_submit(prompt))
             except Exception as e:
-                logger.warning(f"Map step failed for chunk {idx}: {e}")
-                obj = {}
-            
-            if "keywords" not in obj:
-                obj = {
-                    "language": language,
-                    "keywords": [{"term": w.strip(), "weight": 0.5, "type": "主题"} for w in (seeds or title or "").split() if w.strip()],
-                    "keyphrases": [],
-                    "summary": ""
-                }
-            map_results.append(obj)
+                futures.append(None)
+                logger.warning(f"Map step failed: {e}")
+        return futures
+
+    def _map_result(self, fut: Optional[Future], idx: int, title: str, seeds: str) -> dict:
+        obj = self._json_result(fut, f"Map step for chunk {idx}") if fut is not None else {}
+        return self._map_fallback(obj, title, seeds)
+
+    def _map_fallback(self, obj: dict, title: str, seeds: str) -> dict:
+        if "keywords" not in obj:
+            obj = {
+                "language": self._ai_config.get("language", "zh"),
+                "keywords": [{"term": w.strip(), "weight": 0.5, "type": "主题"} for w in (seeds or title or "").split() if w.strip()],
+                "keyphrases": [],
+                "summary": ""
+            }
+        return obj
 
+    def _reduce_prompt(self, map_results: List[dict]) -> str:
+        ai = self._ai_config
+        prompts = CFG.get("prompts", {}) or {}
         reduce_tpl = prompts.get("reduce") or "Merge keyword JSON array:\n{{map_results_json}}"
-        reduce_prompt = (reduce_tpl
-            .replace("{{top_n}}", str(top_n))
-            .replace("{{top_pn}}", str(top_pn))
+        return (reduce_tpl
+            .replace("{{top_n}}", str(int(ai.get("reduce_top_n", 16))))
+            .replace("{{top_pn}}", str(int(ai.get("reduce_top_pn", 8))))
             .replace("{{map_results_json}}", json.dumps(map_results, ensure_ascii=False))
         )
-        try:
-            red_text = self._ollama_generate(reduce_prompt)
-            red_obj = self._json_from_text(red_text) or {}
-        except Exception as e:
-            logger.error(f"Reduce step failed: {e}")
-            red_obj = {}
 
+    def _reduce_groups(self, items: List[dict], fanout: int) -> List[List[dict]]:
+        """Consecutive groups of at most ``fanout`` items whose reduce prompt fits the context."""
+        ai = self._ai_config
+        budget = (int(ai.get("num_ctx", 8192)) - int(ai.get("reserve_tokens", 1024))
+                  - self._estimate_tokens(self._reduce_prompt([])))
+        groups: List[List[dict]] = []
+        cur: List[dict] = []
+        used = 0
+        for item in items:
+            size = self._estimate_tokens(json.dumps(item, ensure_ascii=False))
+            if cur and (len(cur) >= fanout or used + size > budget):
+                groups.append(cur)
+                cur, used = [], 0
+            cur.append(item)
+            used += size
+        if cur:
+            groups.append(cur)
+        return groups
+
+    def _group_result(self, fut: Optional[Future], group: List[dict], level: int) -> dict:
+        if len(group) == 1:
+            return group[0]
+        obj = self._json_result(fut, f"Reduce step (level {level})") if fut is not None else {}
+        if "keywords" in obj:
+            return obj
+        # keep the group's candidates instead of losing them
+        ai = self._ai_config
+        return {
+            "keywords": [k for r in group for k in r.get("keywords") or []][:int(ai.get("reduce_top_n", 16))],
+            "keyphrases": [k for r in group for k in r.get("keyphrases") or []][:int(ai.get("reduce_top_pn", 8))],
+            "summary": " ".join(r.get("summary") or "" for r in group).strip()[:120],
+        }
+
+    def _tree_levels(self, items: List[dict], plan: KeywordPlan, out: List[Tuple[List[dict], int]]) -> Iterator[Tuple[str, Any]]:
+        """Reduce ``items`` in parallel groups until one reduce call can take the rest.
+
+        Yields ``("reduce", {"level", "groups"})`` after each level and appends
+        ``(remaining_items, calls_made)`` to ``out``.
+        """
+        made, level = 0, 1
+        while level < plan.reduce_max_depth:
+            groups = self._reduce_groups(items, plan.reduce_fanout)
+            if len(groups) <= 1:
+                break
+            futures: List[Optional[Future]] = []
+            try:
+                for group in groups:
+                    fut = None
+                    if len(group) > 1:
+                        try:
+                            fut = self._ollama_submit(self._reduce_prompt(group))
+                            made += 1
+                        except Exception as e:
+                            logger.warning(f"Reduce step (level {level}) failed: {e}")
+                    futures.append(fut)
+                items = [self._group_result(fut, group, level) for fut, group in zip(futures, groups)]
+            finally:
+                for fut in futures:
+                    if fut is not None:
+                        fut.cancel()
+            yield "reduce", {"level": level, "groups": len(groups)}
+            level += 1
+        else:
+            if len(self._reduce_groups(items, plan.reduce_fanout)) > 1:
+                logger.warning(f"reduce_max_depth={plan.reduce_max_depth} reached; "
+                               f"reducing {len(items)} results in one call")
+        out.append((items, made))
+
+    def _reduce_result(self, red_obj: dict, title: str, max_len: int) -> dict:
         kws = red_obj.get("keywords") or []
         seen, flat = set(), []
         for item in kws:
@@ -165,9 +275,126 @@ class AIKeywordService:
 
         return {
             "title": red_obj.get("title") or title or "",
-            "language": red_obj.get("language") or language,
+            "language": red_obj.get("language") or self._ai_config.get("language", "zh"),
             "keywords": kws,
             "keyphrases": red_obj.get("keyphrases") or [],
             "summary": red_obj.get("summary") or "",
             "flat_terms": flat
         }
+
+    def _empty_result(self, title: str) -> dict:
+        return {"title": title, "language": self._ai_config.get("language", "zh"), "keywords": [],
+                "keyphrases": [], "summary": ""}
+
+    def _report(self, title: str, result: dict, plan: KeywordPlan, made: int) -> dict:
+        result["llm_calls"] = {"planned": plan.planned_calls, "made": made}
+        logger.info(f"Keywords for {title!r}: planned {plan.planned_calls} LLM calls "
+                    f"({plan.map_calls} map, {plan.reduce_calls} reduce), made {made}")
+        return result
+
+    def map_reduce_keywords(self, title: str, body: str, doc_type: str, seeds: str = "", max_len: int = 50) -> dict:
+        if not body:
+            return self._empty_result(title)
+
+        plan = self.plan(title, body, doc_type)
+        futures = self._submit_maps([self._map_prompt(title, doc_type, ck) for ck in plan.chunks])
+        made = sum(1 for fut in futures if fut is not None)
+        map_results = [self._map_result(fut, idx, title, seeds) for idx, fut in enumerate(futures, 1)]
+        if not plan.reduce_calls:
+            # the whole body fit in one prompt: its map answer is the result
+            return self._report(title, self._reduce_result(map_results[0], title, max_len), plan, made)
+        tree: List[Tuple[List[dict], int]] = []
+        for _ in self._tree_levels(map_results, plan, tree):
+            pass
+        items, tree_made = tree[0]
+        made += tree_made
+        try:
+            fut = self._ollama_submit(self._reduce_prompt(items))
+            made += 1
+            red_obj = self._json_result(fut, "Reduce step")
+        except Exception as e:
+            logger.error(f"Reduce step failed: {e}")
+            red_obj = {}
+        return self._report(title, self._reduce_result(red_obj, title, max_len), plan, made)
+
+    def _stream_json(self, prompt: str, what: str, out: List[dict]) -> Iterator[Tuple[str, Any]]:
+        """Stream one generation as ``("token", text)``; appends the parsed JSON to ``out``."""
+        ai = self._ai_config
+        self._check_provider(ai)
+        parts = []
+        try:
+            with closing(get_llm_client(ai).stream(prompt, **self._generation_args(ai))) as pieces:
+                for piece in pieces:
+                    parts.append(piece)
+                    yield "token", piece
+        except Exception as e:
+            logger.error(f"{what} failed: {e}")
+        out.append(self._json_from_text("".join(parts)) or {})
+
+    def map_reduce_stream(self, title: str, body: str, doc_type: str, seeds: str = "",
+                          max_len: int = 50) -> Iterator[Tuple[str, Any]]:
+        """Streaming variant of :meth:`map_reduce_keywords`.
+
+        Yields ``("map", {"chunk", "total", "result"})`` as each map call
+        finishes, ``("reduce", {"level", "groups"})`` after each intermediate
+        tree-reduce level, ``("token", text)`` for every piece of the streamed
+        final reduce output and finally ``("result", dict)``. A body that fits one prompt
+        streams its single map call instead. Closing the generator early
+        cancels queued map calls and aborts the running stream.
+        """
+        if not body:
+            yield "result", self._empty_result(title)
+            return
+
+        plan = self.plan(title, body, doc_type)
+        prompts = [self._map_prompt(title, doc_type, ck) for ck in plan.chunks]
+        out: List[dict] = []
+        if not plan.reduce_calls:
+            yield from self._stream_json(prompts[0], "Map step for chunk 1", out)
+            result = self._reduce_result(self._map_fallback(out[0], title, seeds), title, max_len)
+            yield "result", self._report(title, result, plan, 1)
+            return
+
+        futures = self._submit_maps(prompts)
+        index = {fut: idx for idx, fut in enumerate(futures, 1) if fut is not None}
+        map_results: List[Optional[dict]] = [None] * len(futures)
+        try:
+            for idx, fut in enumerate(futures, 1):
+                if fut is None:
+                    map_results[idx - 1] = self._map_result(None, idx, title, seeds)
+            for fut in as_completed(index):
+                idx = index[fut]
+                map_results[idx - 1] = self._map_result(fut, idx, title, seeds)
+                yield "map", {"chunk": idx, "total": len(futures), "result": map_results[idx - 1]}
+        finally:
+            for fut in index:
+                fut.cancel()
+
+        tree: List[Tuple[List[dict], int]] = []
+        yield from self._tree_levels(map_results, plan, tree)
+        items, tree_made = tree[0]
+        yield from self._stream_json(self._reduce_prompt(items), "Reduce step", out)
+        result = self._reduce_result(out[0], title, max_len)
+        yield "result", self._report(title, result, plan, len(index) + tree_made + 1)
+
+    def map_reduce_many(self, docs: Dict[str, Tuple[str, str, str]], seeds: str = "",
+                        max_len: int = 50) -> Iterator[Tuple[str, Any]]:
+        """Run :meth:`map_reduce_keywords` for ``{key: (title, body, doc_type)}``.
+
+        Documents are processed concurrently, so their map and reduce calls
+        interleave in the shared client's queue. Yields ``(key, result)`` in
+        completion order; ``result`` is the exception if a document failed.
+        """
+        if not docs:
+            return
+        workers = min(len(docs), 4 * get_llm_client(self._ai_config).max_in_flight)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="keywords") as ex:
+            futs = {
+                ex.submit(self.map_reduce_keywords, title, body, doc_type, seeds, max_len): key
+                for key, (title, body, doc_type) in docs.items()
+            }
+            for fut in as_completed(futs):
+                try:
+                    yield futs[fut], fut.result()
+                except Exception as e:
+                    yield futs[fut], e
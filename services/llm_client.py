@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""共享的 Ollama 生成客户端与调度器。
+
+所有生成请求经同一个 :class:`OllamaClient`：
+
+* 一个 ``requests.Session``（keep-alive 连接池），不再每次新建连接；
+* 固定大小的线程池执行请求，同时在途的请求数不超过 ``ai.max_in_flight``
+  （应与 Ollama 服务端的 ``OLLAMA_NUM_PARALLEL`` 一致；未配置时读取同名环境
+  变量，默认 4）。多个文档提交的请求在同一个先进先出队列中交错执行；
+* 连接错误、超时和 429/5xx 按指数退避重试 ``ai.retries`` 次；
+* 结果经 :mod:`core.generation_cache` 缓存，相同模型、参数与提示词不再重复生成。
+
+:meth:`OllamaClient.submit` 返回 ``Future``，调用方可以先提交一批请求再统一
+等待结果；:meth:`OllamaClient.stream` 以 ``stream: true`` 读取 Ollama 的 NDJSON
+输出，逐段产出文本，关闭生成器即断开连接、终止服务端生成。
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from core.generation_cache import generation_key, get_generation_cache
+
+logger = logging.getLogger(__name__)
+
+_RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class OllamaClient:
+    def __init__(
+        self,
+        url: str = "http://localhost:11434",
+        max_in_flight: int = 4,
+        retries: int = 3,
+        backoff_sec: float = 1.0,
+        timeout_sec: float = 120.0,
+    ) -> None:
+        self.url = (url or "http://localhost:11434").rstrip("/")
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.retries = max(0, int(retries))
+        self.backoff_sec = backoff_sec
+        self.timeout_sec = timeout_sec
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_in_flight)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="llm")
+        self.stats = {"requests": 0, "retries": 0, "failures": 0}
+        self._stats_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, ai: Dict[str, Any]) -> "OllamaClient":
+        in_flight = ai.get("max_in_flight") or os.environ.get("OLLAMA_NUM_PARALLEL") or 4
+        return cls(
+            url=ai.get("url") or "http://localhost:11434",
+            max_in_flight=int(in_flight),
+            retries=int(ai.get("retries", 3)),
+            backoff_sec=float(ai.get("retry_backoff_sec", 1.0)),
+            timeout_sec=float(ai.get("timeout_sec", 120)),
+        )
+
+    def _count(self, key: str) -> None:
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def generate(self, prompt: str, model: str, options: Optional[Dict[str, Any]] = None,
+                 timeout: Optional[float] = None, cache: bool = True, **extra: Any) -> str:
+        """同步调用 ``/api/generate``（在调用线程中执行，含重试与缓存）。"""
+
+        store = get_generation_cache() if cache else None
+        key = generation_key("ollama", model, options, prompt, **extra) if store is not None else ""
+        if store is not None:
+            hit = self._cache_get(store, key)
+            if hit is not None:
+                return hit
+        out = self._post(prompt, model, options, timeout, **extra)
+        if store is not None and out:
+            self._cache_put(store, key, out)
+        return out
+
+    @staticmethod
+    def _cache_get(store, key: str) -> Optional[str]:
+        try:
+            return store.get(key)
+        except sqlite3.Error:
+            logger.warning("generation cache read failed", exc_info=True)
+            return None
+
+    @staticmethod
+    def _cache_put(store, key: str, value: str) -> None:
+        try:
+            store.put(key, value)
+        except sqlite3.Error:
+            logger.warning("generation cache write failed", exc_info=True)
+
+    def _post(self, prompt: str, model: str, options: Optional[Dict[str, Any]],
+              timeout: Optional[float], **extra: Any) -> str:
+        payload = {"model": model, "prompt": prompt, "stream": False, **extra}
+        if options:
+            payload["options"] = options
+        return self._request(payload, timeout).json().get("response", "")
+
+    def _request(self, payload: Dict[str, Any], timeout: Optional[float], stream: bool = False) -> requests.Response:
+        """发送请求；连接错误、超时与可重试状态码按指数退避重试。"""
+
+        attempt = 0
+        while True:
+            self._count("requests")
+            try:
+                resp = self.session.post(f"{self.url}/api/generate", json=payload, stream=stream,
+                                         timeout=timeout or self.timeout_sec)
+                if resp.status_code in _RETRY_STATUS and attempt < self.retries:
+                    resp.close()
+                    raise requests.HTTPError(f"HTTP {resp.status_code}", response=resp)
+                resp.raise_for_status()
+                return resp
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+                status = getattr(getattr(e, "response", None), "status_code", None)
+                if attempt >= self.retries or (status is not None and status not in _RETRY_STATUS):
+                    self._count("failures")
+                    raise
+                delay = self.backoff_sec * (2 ** attempt)
+                logger.warning("ollama request failed (%s); retrying in %.1fs", e, delay)
+                self._count("retries")
+                attempt += 1
+                time.sleep(delay)
+
+    def stream(self, prompt: str, model: str, options: Optional[Dict[str, Any]] = None,
+               timeout: Optional[float] = None, cache: bool = True, **extra: Any) -> Iterator[str]:
+        """流式调用 ``/api/generate``，逐段产出模型输出。
+
+        只在收到第一段输出之前重试；命中缓存时一次产出完整结果。调用方提前关闭
+        生成器（例如浏览器断开）时关闭响应连接，Ollama 随即停止生成。
+        """
+
+        store = get_generation_cache() if cache else None
+        key = generation_key("ollama", model, options, prompt, **extra) if store is not None else ""
+        if store is not None:
+            hit = self._cache_get(store, key)
+            if hit is not None:
+                yield hit
+                return
+        payload = {"model": model, "prompt": prompt, **extra, "stream": True}
+        if options:
+            payload["options"] = options
+        resp = self._request(payload, timeout, stream=True)
+        parts = []
+        try:
+            for line in resp.iter_lines():
+                if not line:
+                    continue
+                msg = json.loads(line)
+                if msg.get("error"):
+                    raise RuntimeError(msg["error"])
+                piece = msg.get("response") or ""
+                if piece:
+                    parts.append(piece)
+                    yield piece
+                if msg.get("done"):
+                    break
+            else:
+                return  # 连接提前结束，不缓存不完整的输出
+        finally:
+            resp.close()
+        if store is not None and parts:
+            self._cache_put(store, key, "".join(parts))
+
+    def submit(self, prompt: str, model: str, options: Optional[Dict[str, Any]] = None,
+               timeout: Optional[float] = None, cache: bool = True, **extra: Any) -> Future:
+        """排队执行 :meth:`generate`，受 ``max_in_flight`` 限制。"""
+
+        return self._executor.submit(self.generate, prompt, model, options, timeout, cache, **extra)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+
+_CLIENTS: Dict[tuple, OllamaClient] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_llm_client(ai: Optional[Dict[str, Any]] = None) -> OllamaClient:
+    """按 ``ai`` 配置（默认 ``CFG.AI_CONFIG``）共享客户端；配置变化时新建。"""
+
+    if ai is None:
+        from core.config import CFG
+        ai = CFG.AI_CONFIG
+    key = (ai.get("url"), ai.get("max_in_flight"), ai.get("retries"), ai.get("retry_backoff_sec"),
+           ai.get("timeout_sec"))
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            client = _CLIENTS[key] = OllamaClient.from_config(ai)
+        return client
+
+
+__all__ = ["OllamaClient", "get_llm_client"]
@@ -0,0 +1,302 @@
+"""Approximate nearest-neighbour index (IVF with optional PQ).
+
+:class:`IVFIndex` partitions vectors with k-means into ``nlist`` inverted
+lists.  A query scores the ``nlist`` centroids first and only scans the rows
+of the ``nprobe`` closest lists, so search cost drops roughly by a factor of
+``nlist / nprobe`` at the price of some recall.  ``nprobe`` is the
+recall/latency knob and can be overridden per search.
+
+With ``pq_m > 0`` the residuals (vector minus its list centroid) are
+product-quantised into ``pq_m`` one-byte codes after training and the raw
+``float32`` vectors are dropped, cutting memory from ``4 * dim`` to
+``pq_m`` bytes per vector.  Inner products are then estimated with
+asymmetric distance tables.
+
+Until ``train_min`` vectors have been inserted the index behaves exactly
+like :class:`~services.retrieval.vector_index.FlatIndex`; training happens
+automatically once that threshold is crossed (or explicitly via
+:meth:`IVFIndex.train`).  Later inserts are assigned to the nearest
+existing centroid, so insertion stays incremental.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Tuple
+
+from .vector_index import FlatIndex, np
+
+_ASSIGN_BATCH = 65536
+
+
+def _nearest(x: "np.ndarray", centroids: "np.ndarray") -> "np.ndarray":
+    """Index of the closest (L2) centroid for every row of ``x``."""
+
+    c_sq = (centroids * centroids).sum(axis=1)
+    out = np.empty(len(x), dtype=np.int32)
+    for start in range(0, len(x), _ASSIGN_BATCH):
+        part = x[start:start + _ASSIGN_BATCH]
+        out[start:start + len(part)] = np.argmin(c_sq[None, :] - 2.0 * part @ centroids.T, axis=1)
+    return out
+
+
+def kmeans(x: "np.ndarray", k: int, iters: int = 20, seed: int = 0) -> "np.ndarray":
+    """Plain Lloyd k-means; empty clusters are re-seeded from random points."""
+
+    rng = np.random.default_rng(seed)
+    x = np.asarray(x, dtype=np.float32)
+    k = max(1, min(k, len(x)))
+    centroids = x[rng.choice(len(x), size=k, replace=False)].copy()
+    for _ in range(iters):
+        assign = _nearest(x, centroids)
+        counts = np.bincount(assign, minlength=k)
+        empty = counts == 0
+        order = np.argsort(assign, kind="stable")
+        starts = (np.cumsum(counts) - counts)[~empty]
+        sums = np.add.reduceat(x[order], starts, axis=0)
+        centroids[~empty] = sums / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = x[rng.choice(len(x), size=int(empty.sum()), replace=False)]
+    return centroids
+
+
+class IVFIndex(FlatIndex):
+    """Inverted-file index with k-means coarse quantisation."""
+
+    kind = "ivf"
+
+    def __init__(
+        self,
+        dim: int | None = None,
+        metric: str = "cosine",
+        nlist: int = 256,
+        nprobe: int = 8,
+        pq_m: int = 0,
+        train_min: int | None = None,
+        capacity: int = 1024,
+        kmeans_iters: int = 20,
+        seed: int = 0,
+    ) -> None:
+        super().__init__(dim=dim, metric=metric, capacity=capacity)
+        self.nlist = int(nlist)
+        self.nprobe = int(nprobe)
+        self.pq_m = int(pq_m)
+        self.train_min = int(train_min) if train_min else self.nlist * 39
+        self.kmeans_iters = kmeans_iters
+        self.seed = seed
+        self._centroids = None  # (nlist, dim)
+        self._codebooks = None  # (pq_m, ksub, dim // pq_m)
+        self._codes = None  # (capacity, pq_m) uint8
+        self._assign = np.zeros(0, dtype=np.int32)
+        # inverted lists: frozen CSR part plus rows appended since
+        self._list_offsets = None
+        self._list_rows = None
+        self._list_extra: Dict[int, List[int]] = {}
+
+    @property
+    def is_trained(self) -> bool:
+        return self._centroids is not None
+
+    # Storage hooks -------------------------------------------------------
+    def _grow_arrays(self, new_cap: int) -> None:
+        if self._mat is None and self._codes is not None:
+            self._alive = self._grown(self._alive, new_cap, self._n)
+        else:
+            super()._grow_arrays(new_cap)
+        self._assign = self._grown(self._assign, new_cap, self._n, fill=-1)
+        if self._codes is not None:
+            self._codes = self._grown(self._codes, new_cap, self._n)
+
+    def _ensure_writable(self) -> None:
+        if not self._assign.flags.writeable or (self._codes is not None and not self._codes.flags.writeable):
+            self._reserve(max(self._n, 1), force=True)
+        super()._ensure_writable()
+
+    def _write_rows(self, rows: "np.ndarray", arr: "np.ndarray") -> None:
+        if not self.is_trained:
+            super()._write_rows(rows, arr)
+            self._assign[rows] = -1
+            return
+        lists = _nearest(arr, self._centroids)
+        # a live row overwritten into the list it already sits in is listed
+        # already; anything else gets a new entry (stale ones are skipped at
+        # search time and dropped by the next _rebuild_lists)
+        listed = np.asarray(self._alive[rows]) & (np.asarray(self._assign[rows]) == lists)
+        self._assign[rows] = lists
+        for row, lst, skip in zip(rows.tolist(), lists.tolist(), listed.tolist()):
+            if not skip:
+                self._list_extra.setdefault(lst, []).append(row)
+        if self._codes is not None:
+            self._codes[rows] = self._encode(arr - self._centroids[lists])
+        else:
+            super()._write_rows(rows, arr)
+
+    def add(self, ids, vectors) -> int:
+        n = super().add(ids, vectors)
+        if not self.is_trained and self._count >= self.train_min:
+            self.train()
+        return n
+
+    # Training ------------------------------------------------------------
+    def _sample(self, rows: "np.ndarray", size: int) -> "np.ndarray":
+        if len(rows) > size:
+            rows = np.sort(np.random.default_rng(self.seed).choice(rows, size=size, replace=False))
+        return np.asarray(self._mat[rows], dtype=np.float32)
+
+    def train(self) -> None:
+        """Run k-means over the live vectors and build the inverted lists."""
+
+        if self.dim is None or not self._count:
+            return
+        self._ensure_maps()
+        self._ensure_writable()
+        rows = np.flatnonzero(self._alive[: self._n])
+        if self._mat is None:
+            # PQ-trained: the raw vectors are gone, retrain from their reconstruction
+            mat = np.zeros((self._capacity(), self.dim), dtype=np.float32)
+            mat[rows] = self._decode(rows)
+            self._mat = mat
+        sample = self._sample(rows, self.nlist * 256)
+        self._centroids = kmeans(sample, self.nlist, self.kmeans_iters, self.seed)
+        vecs = np.asarray(self._mat[rows], dtype=np.float32)
+        lists = _nearest(vecs, self._centroids)
+        self._assign[: self._n] = -1
+        self._assign[rows] = lists
+        self._rebuild_lists()
+        if self.pq_m:
+            if self.dim % self.pq_m:
+                raise ValueError(f"pq_m={self.pq_m} must divide dim={self.dim}")
+            residuals = vecs - self._centroids[lists]
+            sub = self.dim // self.pq_m
+            res_sample = residuals if len(residuals) <= 16384 else residuals[
+                np.random.default_rng(self.seed).choice(len(residuals), 16384, replace=False)
+            ]
+            self._codebooks = np.stack([
+                kmeans(res_sample[:, m * sub:(m + 1) * sub], 256, self.kmeans_iters, self.seed + m)
+                for m in range(self.pq_m)
+            ])
+            codes = np.zeros((self._capacity(), self.pq_m), dtype=np.uint8)
+            codes[rows] = self._encode(residuals)
+            self._codes = codes
+            self._mat = None
+
+    def _rebuild_lists(self) -> None:
+        n = self._n
+        assign = np.asarray(self._assign[:n])
+        live = np.flatnonzero(np.asarray(self._alive[:n]) & (assign >= 0))
+        order = live[np.argsort(assign[live], kind="stable")]
+        counts = np.bincount(assign[order], minlength=len(self._centroids))
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(counts)
+        self._list_offsets, self._list_rows = offsets, order.astype(np.int64)
+        self._list_extra = {}
+
+    def _encode(self, residuals: "np.ndarray") -> "np.ndarray":
+        sub = self.dim // self.pq_m
+        codes = np.empty((len(residuals), self.pq_m), dtype=np.uint8)
+        for m in range(self.pq_m):
+            codes[:, m] = _nearest(residuals[:, m * sub:(m + 1) * sub], self._codebooks[m])
+        return codes
+
+    def _decode(self, rows: "np.ndarray") -> "np.ndarray":
+        """Approximate vectors of PQ-coded ``rows`` (centroid plus decoded residual)."""
+
+        codes = np.asarray(self._codes[rows])
+        residuals = np.concatenate([self._codebooks[m][codes[:, m]] for m in range(self.pq_m)], axis=1)
+        return self._centroids[np.asarray(self._assign[rows])] + residuals
+
+    # Search --------------------------------------------------------------
+    def _probe_rows(self, lists: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray"]:
+        parts, labels = [], []
+        for lst in lists.tolist():
+            seg = self._list_rows[self._list_offsets[lst]:self._list_offsets[lst + 1]]
+            extra = self._list_extra.get(lst)
+            if extra:
+                seg = np.concatenate([seg, np.asarray(extra, dtype=np.int64)])
+            parts.append(seg)
+            labels.append(np.full(len(seg), lst, dtype=np.int32))
+        if not parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32)
+        return np.concatenate(parts), np.concatenate(labels)
+
+    def search(self, queries, k: int = 10, mask=None, nprobe: int | None = None, **params: Any):
+        """Approximate top-``k`` search probing ``nprobe`` inverted lists."""
+
+        if not self.is_trained:
+            return super().search(queries, k, mask=mask)
+        if self.dim is None or not self._count or k <= 0:
+            return [[] for _ in range(len(queries))]
+        q = self._prepare(queries)
+        nprobe = max(1, min(int(nprobe or self.nprobe), len(self._centroids)))
+        c_sq = (self._centroids * self._centroids).sum(axis=1)
+        coarse_ip = q @ self._centroids.T
+        coarse_dist = c_sq[None, :] - 2.0 * coarse_ip
+        valid = self._valid_rows(mask)
+        assign = self._assign
+        out = []
+        for qi in range(q.shape[0]):
+            if nprobe < len(self._centroids):
+                lists = np.argpartition(coarse_dist[qi], nprobe - 1)[:nprobe]
+            else:
+                lists = np.arange(len(self._centroids))
+            rows, labels = self._probe_rows(lists)
+            # drop tombstones, filtered rows and stale entries of reused rows
+            keep = valid[rows] & (assign[rows] == labels)
+            rows, labels = rows[keep], labels[keep]
+            # a row re-added to its list (or a reused row) can be listed twice
+            rows, first = np.unique(rows, return_index=True)
+            labels = labels[first]
+            if self._codes is not None:
+                sub = self.dim // self.pq_m
+                qs = q[qi].reshape(self.pq_m, sub)
+                tables = np.einsum("mkd,md->mk", self._codebooks, qs)
+                codes = np.asarray(self._codes[rows])
+                scores = coarse_ip[qi, labels] + tables[np.arange(self.pq_m), codes].sum(axis=1)
+            else:
+                scores = np.asarray(self._mat[rows]) @ q[qi]
+            out.append(self._select(rows, scores, k))
+        return out
+
+    # Persistence ---------------------------------------------------------
+    def _meta(self) -> Dict[str, Any]:
+        meta = super()._meta()
+        meta.update(
+            nlist=self.nlist, nprobe=self.nprobe, pq_m=self.pq_m,
+            train_min=self.train_min, trained=self.is_trained,
+        )
+        return meta
+
+    def _arrays(self) -> Dict[str, Any]:
+        arrays = super()._arrays()
+        arrays["assign"] = np.asarray(self._assign[: self._n])
+        if self.is_trained:
+            self._rebuild_lists()
+            arrays["centroids"] = self._centroids
+            arrays["list_offsets"] = self._list_offsets
+            arrays["list_rows"] = self._list_rows
+        if self._codes is not None:
+            arrays["codes"] = np.asarray(self._codes[: self._n])
+            arrays["codebooks"] = self._codebooks
+        return arrays
+
+    def _restore(self, meta: Dict[str, Any], arrays: Dict[str, Any]) -> None:
+        super()._restore(meta, arrays)
+        self._assign = arrays["assign"]
+        if meta.get("trained"):
+            self._centroids = np.asarray(arrays["centroids"])
+            self._list_offsets = arrays["list_offsets"]
+            self._list_rows = arrays["list_rows"]
+        self._codes = arrays.get("codes")
+        if self._codes is not None:
+            self._codebooks = np.asarray(arrays["codebooks"])
+
+    @classmethod
+    def from_arrays(cls, meta: Dict[str, Any], arrays: Dict[str, Any]) -> "IVFIndex":
+        idx = cls(
+            dim=meta.get("dim"), metric=meta.get("metric", "cosine"),
+            nlist=meta.get("nlist", 256), nprobe=meta.get("nprobe", 8),
+            pq_m=meta.get("pq_m", 0), train_min=meta.get("train_min"),
+        )
+        idx._restore(meta, arrays)
+        return idx
+
+
+__all__ = ["IVFIndex", "kmeans"]
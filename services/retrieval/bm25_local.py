@@ -1,27 +1,115 @@
-"""Very small in-memory keyword matcher.
+"""BM25 keyword retriever backed by an inverted index.
 
-The implementation is *not* a full BM25 algorithm; it merely counts term
-frequency for the supplied query terms.  The goal is to provide a zero
-dependency baseline that mirrors the API of a more sophisticated backend.
+Every upserted chunk is tokenised once (see :mod:`.tokenizer`) and its term
+frequencies are written into per-term postings lists.  A query only visits
+the postings of its own terms, so the cost grows with the length of those
+postings rather than with the size of the corpus.  Scores follow the
+classic Okapi BM25 formula with document-length normalisation.
+
+Postings live in two layers:
+
+* an in-memory **delta** (plain dictionaries) receiving all upserts, and
+* an optional read-only **base** checkpoint attached from
+  ``postings.index`` (see :mod:`.store`).  The base is a CSR layout keyed by
+  64-bit term hashes whose arrays are memory-mapped, so opening a large
+  collection does not load its postings into RAM.  Base rows refer to rows of
+  the collection's :class:`~services.retrieval.store.ChunkStore`; deleted or
+  overwritten rows are tombstoned there.
 """
 from __future__ import annotations
 
-import re
-from typing import Dict, Any, Iterable, List
+import heapq
+import itertools
+import math
+from collections import Counter
+from typing import Dict, Any, Iterable, Iterator, List, Sequence, Tuple
 
 from .retriever import Hit, Retriever
-from .filters import build_where, build_where_document
+from .filter_index import FilterIndex
+from .tokenizer import tokenize
+from .vector_index import np
+
+# ranking key: ("b", base row) or ("d", chunk id)
+_Key = Tuple[str, Any]
 
 
 class BM25Local(Retriever):
-    def __init__(self) -> None:
-        self._docs: Dict[str, Dict[str, Any]] = {}
+    def __init__(
+        self,
+        k1: float = 1.2,
+        b: float = 0.75,
+        docs: Dict[str, Dict[str, Any]] | None = None,
+        filters: FilterIndex | None = None,
+    ) -> None:
+        self.k1 = k1
+        self.b = b
+        # chunk id -> chunk; may be a ChunkStore shared with other backends
+        self._docs: Dict[str, Dict[str, Any]] = docs if docs is not None else {}
+        self.filters = filters if filters is not None else FilterIndex(self._docs)
+        # term -> {chunk id -> term frequency}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        # chunk id -> distinct terms, needed to unlink postings on delete
+        self._doc_terms: Dict[str, Tuple[str, ...]] = {}
+        self._doc_len: Dict[str, int] = {}
+        self._total_len = 0
+        self._base: Dict[str, Any] | None = None
+
+    # Index maintenance ---------------------------------------------------
+    def attach(self, meta: Dict[str, Any], arrays: Dict[str, Any]) -> None:
+        """Attach a postings checkpoint written by :meth:`export`."""
+
+        self._base = arrays
+        self._total_len += int(meta.get("total_len", 0))
+
+    def _unlink(self, doc_id: str) -> None:
+        self.filters.discard(doc_id)
+        if doc_id in self._doc_terms:
+            for term in self._doc_terms.pop(doc_id):
+                plist = self._postings.get(term)
+                if plist is None:
+                    continue
+                plist.pop(doc_id, None)
+                if not plist:
+                    del self._postings[term]
+            self._total_len -= self._doc_len.pop(doc_id, 0)
+        elif self._base is not None:
+            row = self._docs.base_row(doc_id)
+            if row is not None:
+                self._total_len -= int(self._base["doc_len"][row])
+        self._docs.pop(doc_id, None)
+
+    def _idf(self, df: int) -> float:
+        n = len(self._docs)
+        return math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+
+    def _base_postings(self, term: str):
+        from .storage import hash64
+
+        base = self._base
+        hashes = base["term_hash"]
+        h = np.uint64(hash64(term))
+        i = int(np.searchsorted(hashes, h))
+        if i >= len(hashes) or hashes[i] != h:
+            return None
+        start, end = int(base["offsets"][i]), int(base["offsets"][i + 1])
+        return base["rows"][start:end], base["tfs"][start:end]
 
     # Retriever interface -------------------------------------------------
     def upsert(self, chunks: Iterable[Dict[str, Any]]) -> int:
         count = 0
         for ch in chunks:
-            self._docs[ch["id"]] = ch
+            doc_id = ch["id"]
+            if doc_id in self._docs:
+                self._unlink(doc_id)
+            tf = Counter(tokenize(ch.get("text", "")))
+            for term, freq in tf.items():
+                self._postings.setdefault(term, {})[doc_id] = freq
+            self._doc_terms[doc_id] = tuple(tf)
+            length = sum(tf.values())
+            self._doc_len[doc_id] = length
+            self._total_len += length
+            self._docs[doc_id] = ch
+            self.filters.add(doc_id, ch)
             count += 1
         return count
 
@@ -29,10 +117,119 @@ class BM25Local(Retriever):
         removed = 0
         for i in ids:
             if i in self._docs:
-                del self._docs[i]
+                self._unlink(i)
                 removed += 1
         return removed
 
+    def _term_scores(self, term: str, avgdl: float, dead):
+        """BM25 contribution of ``term`` to every chunk containing it.
+
+        Returns ``(base_rows, base_scores, delta)`` or ``None`` if no live
+        chunk contains the term.  The contribution does not depend on the
+        rest of the query, so batches score each distinct term only once.
+        """
+
+        k1, b = self.k1, self.b
+        plist = self._postings.get(term) or {}
+        rows = tfs = None
+        if self._base is not None:
+            base = self._base_postings(term)
+            if base is not None:
+                rows, tfs = np.asarray(base[0], dtype=np.int64), np.asarray(base[1], dtype=np.float32)
+                if len(dead):
+                    # tombstoned rows must not count towards df either
+                    keep = ~np.isin(rows, dead)
+                    rows, tfs = rows[keep], tfs[keep]
+        df = len(plist) + (len(rows) if rows is not None else 0)
+        if not df:
+            return None
+        idf = self._idf(df)
+        doc_len = self._doc_len
+        delta = {
+            doc_id: idf * tf * (k1 + 1.0) / (tf + k1 * (1.0 - b + b * doc_len[doc_id] / avgdl))
+            for doc_id, tf in plist.items()
+        }
+        base_scores = None
+        if rows is not None and len(rows):
+            dl = np.asarray(self._base["doc_len"][rows], dtype=np.float32)
+            base_scores = idf * tfs * (k1 + 1.0) / (tfs + k1 * (1.0 - b + b * dl / avgdl))
+        else:
+            rows = None
+        return rows, base_scores, delta
+
+    def score_batch(self, query_texts: Sequence[str]) -> List[Tuple[Any, Any, Dict[str, float]]]:
+        """Score every chunk against each of ``query_texts``.
+
+        Each result is ``(base_rows, base_scores, delta)`` where the first two
+        are parallel arrays for checkpointed rows (``None`` without a base)
+        and ``delta`` maps in-memory chunk ids to their score.  Postings of a
+        term shared by several queries are read and scored once.
+        """
+
+        if not len(self._docs):
+            return [(None, None, {}) for _ in query_texts]
+        avgdl = (self._total_len / len(self._docs)) or 1.0
+        dead = self._docs.dead_rows() if self._base is not None else None
+        terms_of = [set(tokenize(text)) for text in query_texts]
+        cache: Dict[str, Any] = {}
+        for term in set().union(*terms_of):
+            cache[term] = self._term_scores(term, avgdl, dead)
+        out = []
+        for terms in terms_of:
+            delta: Dict[str, float] = {}
+            base_rows, base_scores = [], []
+            for term in terms:
+                part = cache[term]
+                if part is None:
+                    continue
+                for doc_id, sc in part[2].items():
+                    delta[doc_id] = delta.get(doc_id, 0.0) + sc
+                if part[0] is not None:
+                    base_rows.append(part[0])
+                    base_scores.append(part[1])
+            if not base_rows:
+                out.append((None, None, delta))
+                continue
+            uniq, inv = np.unique(np.concatenate(base_rows), return_inverse=True)
+            out.append((uniq, np.bincount(inv, weights=np.concatenate(base_scores)), delta))
+        return out
+
+    def score(self, query_text: str):
+        """Score every chunk matching ``query_text`` (see :meth:`score_batch`)."""
+
+        return self.score_batch([query_text])[0]
+
+    def _ranked(self, base_rows, base_scores, delta: Dict[str, float], limit: int | None) -> Iterator[Tuple[float, _Key]]:
+        """Yield ``(score, key)`` pairs in descending score order."""
+
+        streams = []
+        if base_rows is not None and len(base_rows):
+            if limit is not None and limit < len(base_rows):
+                part = np.argpartition(-base_scores, limit - 1)[:limit]
+            else:
+                part = np.arange(len(base_rows))
+            order = part[np.argsort(-base_scores[part], kind="stable")]
+            streams.append((float(base_scores[i]), ("b", int(base_rows[i]))) for i in order)
+        if delta:
+            items = heapq.nlargest(limit, delta.items(), key=lambda x: x[1]) if limit else \
+                sorted(delta.items(), key=lambda x: x[1], reverse=True)
+            streams.append((score, ("d", doc_id)) for doc_id, score in items)
+        return heapq.merge(*streams, key=lambda x: -x[0])
+
+    def _allowed_rows(self, allowed: Iterable[str]):
+        rows = (self._docs.base_row(i) for i in allowed)
+        return np.fromiter((r for r in rows if r is not None), dtype=np.int64)
+
+    def _chunk(self, key: _Key) -> Dict[str, Any]:
+        kind, ref = key
+        return self._docs.base_chunk(ref) if kind == "b" else self._docs[ref]
+
+    def candidates(self, query_text: str, limit: int) -> List[Dict[str, Any]]:
+        """Return up to ``limit`` best-scoring chunks sharing a term with the query."""
+
+        ranked = self._ranked(*self.score(query_text), limit=limit)
+        return [self._chunk(key) for _, key in itertools.islice(ranked, limit)]
+
     def query(
         self,
         query_texts: List[str],
@@ -40,32 +237,103 @@ class BM25Local(Retriever):
         where: Dict[str, Any] | None = None,
         where_document: Dict[str, Any] | None = None,
         search_type: str = "keyword",
+        query_embeddings: List[Sequence[float]] | None = None,
     ) -> List[Hit]:
+        batch = self.query_batch(query_texts[:1], k, where, where_document)
+        return batch[0] if batch else []
+
+    def query_batch(
+        self,
+        query_texts: List[str],
+        k: int = 10,
+        where: Dict[str, Any] | None = None,
+        where_document: Dict[str, Any] | None = None,
+        search_type: str = "keyword",
+        query_embeddings: List[Sequence[float]] | None = None,
+    ) -> List[List[Hit]]:
+        """Top-``k`` hits for every query text; the filter is evaluated once."""
+
         if not query_texts:
             return []
-        patterns = [re.compile(t, re.IGNORECASE) for t in query_texts[0].split()]
-        meta_pred = build_where(where)
-        doc_pred = build_where_document(where_document)
-        scores = []
-        for ch in self._docs.values():
-            if not meta_pred(ch.get("metadata", {})):
-                continue
-            text = ch.get("text", "")
-            if not doc_pred(text):
-                continue
-            score = sum(len(p.findall(text)) for p in patterns)
-            if score:
-                scores.append((score, ch))
-        scores.sort(key=lambda x: x[0], reverse=True)
-        hits: List[Hit] = []
-        for score, ch in scores[:k]:
-            hits.append(
-                Hit(
-                    id=ch["id"],
-                    document=ch.get("text", ""),
-                    metadata=ch.get("metadata", {}),
-                    score=float(score),
-                    chunk=ch.get("chunk", {}),
+        allowed = self.filters.select(where, where_document)
+        if allowed is not None and not allowed:
+            return [[] for _ in query_texts]
+        allowed_rows = None
+        if allowed is not None and self._base is not None:
+            allowed_rows = self._allowed_rows(allowed)
+
+        results: List[List[Hit]] = []
+        for base_rows, base_scores, delta in self.score_batch(query_texts):
+            if allowed is not None:
+                delta = {i: s for i, s in delta.items() if i in allowed}
+                if base_rows is not None:
+                    keep = np.isin(base_rows, allowed_rows)
+                    base_rows, base_scores = base_rows[keep], base_scores[keep]
+            hits: List[Hit] = []
+            ranked = self._ranked(base_rows, base_scores, delta, limit=k)
+            for score, key in itertools.islice(ranked, k):
+                ch = self._chunk(key)
+                hits.append(
+                    Hit(
+                        id=ch["id"],
+                        document=ch.get("text", ""),
+                        metadata=ch.get("metadata", {}),
+                        score=float(score),
+                        chunk=ch.get("chunk", {}),
+                    )
                 )
-            )
-        return hits
+            results.append(hits)
+        return results
+
+    # Persistence ---------------------------------------------------------
+    def export(self, base_map, delta_map: Dict[str, int], rows: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Build a postings checkpoint for a freshly written chunk store.
+
+        ``base_map`` maps old base rows to new rows (``-1`` for dropped rows)
+        and ``delta_map`` maps in-memory chunk ids to their new rows.
+        """
+
+        from .storage import hash64
+
+        row_dtype = np.int32 if rows < 2 ** 31 else np.int64
+        hashes, post_rows, tfs = [], [], []
+        doc_len = np.zeros(rows, dtype=np.int32)
+        base = self._base
+        if base is not None and len(base["rows"]):
+            counts = np.diff(np.asarray(base["offsets"]))
+            mapped = np.asarray(base_map)[np.asarray(base["rows"])]
+            keep = mapped >= 0
+            hashes.append(np.repeat(np.asarray(base["term_hash"]), counts)[keep])
+            post_rows.append(mapped[keep])
+            tfs.append(np.asarray(base["tfs"])[keep])
+        if base is not None and len(base_map):
+            old = np.flatnonzero(np.asarray(base_map) >= 0)
+            doc_len[np.asarray(base_map)[old]] = np.asarray(base["doc_len"])[old]
+        for term, plist in self._postings.items():
+            h = hash64(term)
+            hashes.append(np.full(len(plist), h, dtype=np.uint64))
+            post_rows.append(np.fromiter((delta_map[i] for i in plist), dtype=np.int64, count=len(plist)))
+            tfs.append(np.fromiter(plist.values(), dtype=np.int32, count=len(plist)))
+        for doc_id, length in self._doc_len.items():
+            doc_len[delta_map[doc_id]] = length
+
+        if hashes:
+            all_hashes = np.concatenate(hashes).astype(np.uint64)
+            all_rows = np.concatenate(post_rows).astype(row_dtype)
+            all_tfs = np.concatenate(tfs).astype(np.int32)
+            order = np.lexsort((all_rows, all_hashes))
+            all_hashes, all_rows, all_tfs = all_hashes[order], all_rows[order], all_tfs[order]
+            term_hash, counts = np.unique(all_hashes, return_counts=True)
+        else:
+            term_hash = np.zeros(0, dtype=np.uint64)
+            counts = np.zeros(0, dtype=np.int64)
+            all_rows = np.zeros(0, dtype=row_dtype)
+            all_tfs = np.zeros(0, dtype=np.int32)
+        offsets = np.zeros(len(term_hash) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(counts)
+        meta = {"rows": rows, "total_len": int(doc_len.sum()), "k1": self.k1, "b": self.b}
+        arrays = {
+            "term_hash": term_hash, "offsets": offsets, "rows": all_rows,
+            "tfs": all_tfs, "doc_len": doc_len,
+        }
+        return meta, arrays
@@ -4,27 +4,42 @@ from __future__ import annotations
 
 This module reads the ``collections`` configuration from
 ``config/settings.json`` and exposes a :class:`CollectionManager` that
-creates individual :class:`~services.retrieval.hybrid.HybridRetriever`
-instances per collection.  It also provides snapshot export and rollback
-helpers which operate on the on-disk structure::
+creates one :class:`~services.retrieval.store.PersistentRetriever` per
+collection.  It also provides snapshot export and rollback helpers which
+operate on the on-disk structure::
 
     data/collections/<name>/
-        chunks.parquet
-        vec.index
-        idmap.parquet
+        manifest.json
+        wal.jsonl
+        gen-000001/
+            chunks.jsonl
+            idmap.index
+            postings.index
+            vec.index
         snapshots/
 
-The storage files are only placeholders in this lightweight
-implementation but the functions mirror how a real backend would manage
-on-disk indices.
+See :mod:`services.retrieval.store` for the file formats.
+
+Each entry of ``collections`` is either a directory path or a dictionary
+``{"path": ..., "index": {...}, "persist": true}`` whose ``index`` spec
+selects the vector index type, e.g. ``{"type": "ivf", "nlist": 1024,
+"nprobe": 16}`` for approximate search on large collections (see
+:func:`~services.retrieval.vector_index.create_index`).  A global default can
+be set under ``retrieval.index``.  Hybrid queries are merged according to
+``retrieval.fusion`` (or a per-collection ``fusion`` entry), e.g.
+``{"method": "weighted", "weights": {"vector": 0.7, "keyword": 0.3}}``; see
+:mod:`services.retrieval.fusion`.  ``"persist": false`` keeps a collection
+purely in memory.
 """
 
 from pathlib import Path
-from typing import Dict, Any, Iterable, List
+from typing import Dict, Any, Iterable, List, Sequence
 import datetime as _dt
+import shutil
 import zipfile
 
 from .hybrid import HybridRetriever
+from .store import PersistentRetriever
 from .retriever import Hit
 from core.settings import SETTINGS
 
@@ -34,16 +49,35 @@ class CollectionManager:
 
     def __init__(self, config: Dict[str, Any] | None = None) -> None:
         cfg = config or SETTINGS
-        self.paths: Dict[str, Path] = {
-            name: Path(path) for name, path in cfg.get("collections", {}).items()
-        }
+        self.default_index = (cfg.get("retrieval") or {}).get("index")
+        self.default_fusion = (cfg.get("retrieval") or {}).get("fusion")
+        self.fusion_specs: Dict[str, Any] = {}
+        self.paths: Dict[str, Path] = {}
+        self.index_specs: Dict[str, Any] = {}
+        self.volatile: set[str] = set()
+        for name, entry in cfg.get("collections", {}).items():
+            if isinstance(entry, dict):
+                self.paths[name] = Path(entry.get("path") or f"data/collections/{name}")
+                if entry.get("index"):
+                    self.index_specs[name] = entry["index"]
+                if entry.get("fusion"):
+                    self.fusion_specs[name] = entry["fusion"]
+                if entry.get("persist") is False:
+                    self.volatile.add(name)
+            else:
+                self.paths[name] = Path(entry)
         self._retrievers: Dict[str, HybridRetriever] = {}
 
     # ------------------------------------------------------------------
     def _ensure_collection(self, name: str) -> HybridRetriever:
         if name not in self._retrievers:
             self.paths.setdefault(name, Path(f"data/collections/{name}"))
-            self._retrievers[name] = HybridRetriever()
+            spec = self.index_specs.get(name, self.default_index)
+            fusion = self.fusion_specs.get(name, self.default_fusion)
+            if name in self.volatile:
+                self._retrievers[name] = HybridRetriever(index=spec, fusion=fusion)
+            else:
+                self._retrievers[name] = PersistentRetriever(self.paths[name], index=spec, fusion=fusion)
         return self._retrievers[name]
 
     # Public API -------------------------------------------------------
@@ -60,10 +94,50 @@ class CollectionManager:
         where: Dict[str, Any] | None = None,
         where_document: Dict[str, Any] | None = None,
         search_type: str = "hybrid",
+        query_embeddings: List[Sequence[float]] | None = None,
+        fusion: Dict[str, Any] | str | None = None,
     ) -> List[Hit]:
         """Query the specified collection."""
         retriever = self._ensure_collection(collection)
-        return retriever.query(query_texts, k, where, where_document, search_type)
+        return retriever.query(
+            query_texts, k, where, where_document, search_type,
+            query_embeddings=query_embeddings, fusion=fusion,
+        )
+
+    def query_batch(
+        self,
+        collection: str,
+        query_texts: List[str],
+        k: int = 10,
+        where: Dict[str, Any] | None = None,
+        where_document: Dict[str, Any] | None = None,
+        search_type: str = "hybrid",
+        query_embeddings: List[Sequence[float]] | None = None,
+        fusion: Dict[str, Any] | str | None = None,
+    ) -> List[List[Hit]]:
+        """Query the specified collection with many queries at once."""
+        retriever = self._ensure_collection(collection)
+        return retriever.query_batch(
+            query_texts, k, where, where_document, search_type,
+            query_embeddings=query_embeddings, fusion=fusion,
+        )
+
+    def delete(self, collection: str, ids: List[str]) -> int:
+        """Remove chunks from the specified collection."""
+        retriever = self._ensure_collection(collection)
+        return retriever.delete(ids)
+
+    def ids_where(self, collection: str, where: Dict[str, Any]) -> List[str]:
+        """Ids of chunks whose metadata matches ``where``."""
+        retriever = self._ensure_collection(collection)
+        return sorted(retriever.filters.select(where, None) or ())
+
+    def checkpoint(self, collection: str) -> Path | None:
+        """Fold the collection's write-ahead log into a new on-disk generation."""
+        retriever = self._ensure_collection(collection)
+        if isinstance(retriever, PersistentRetriever):
+            return retriever.checkpoint()
+        return None
 
     # Snapshot helpers -------------------------------------------------
     def export_snapshot(self, collection: str, name: str | None = None) -> Path:
@@ -75,15 +149,22 @@ class CollectionManager:
         if not name:
             name = _dt.datetime.now().strftime("%Y%m%d%H%M%S") + ".zip"
         out = snap_dir / name
+        retriever = self._ensure_collection(collection)
+        files = retriever.files if isinstance(retriever, PersistentRetriever) else []
         with zipfile.ZipFile(out, "w") as zf:
-            for fname in ["chunks.parquet", "vec.index", "idmap.parquet"]:
-                p = base / fname
-                if p.exists():
-                    zf.write(p, arcname=fname)
+            for p in files:
+                zf.write(p, arcname=p.relative_to(base).as_posix())
         return out
 
     def rollback_snapshot(self, collection: str, snapshot_file: str | Path) -> None:
         """Restore index files from a snapshot zip."""
         base = self.paths.get(collection, Path(f"data/collections/{collection}"))
+        # release memory maps of the current generation before replacing it
+        self._retrievers.pop(collection, None)
+        for stale in base.glob("gen-*"):
+            shutil.rmtree(stale, ignore_errors=True)
+        wal = base / "wal.jsonl"
+        if wal.exists():
+            wal.unlink()
         with zipfile.ZipFile(snapshot_file, "r") as zf:
             zf.extractall(base)
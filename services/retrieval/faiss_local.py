@@ -1,40 +1,136 @@
-"""Toy vector retriever based on token overlap.
+"""Local vector retriever.
 
-This module mimics the interface of a FAISS-backed retriever but does not
-require external dependencies.  It computes a simple Jaccard similarity over
-word tokens which is sufficient for small demos and unit tests.
+Two scoring modes are supported:
+
+* **vector** – chunks carrying an embedding (``embedding`` key or the
+  ``clip_vector`` metadata produced by :mod:`plugins.image_basic`) are stored
+  in a vector index and searched with ``query_embeddings``.  The index type
+  comes from the ``index`` spec: exact
+  :class:`~services.retrieval.vector_index.FlatIndex` (default) or the
+  approximate :class:`~services.retrieval.ann.IVFIndex` for large
+  collections.
+* **token overlap** – when no query embedding is supplied the retriever falls
+  back to Jaccard similarity over word tokens, which is sufficient for small
+  demos and unit tests and needs no external dependency.  Given a
+  ``candidates`` callable (the BM25 backend inside
+  :class:`~services.retrieval.hybrid.HybridRetriever`) only that candidate
+  pool is re-ranked instead of the whole corpus.
+
+The chunk mapping may be shared with another backend via ``docs``; the
+retriever then only maintains its vector index and leaves the mapping to
+its owner.
 """
 from __future__ import annotations
 
-from typing import Dict, Any, Iterable, List
+from pathlib import Path
+from typing import Dict, Any, Callable, Iterable, List, Sequence
 
 from .retriever import Hit, Retriever
-from .filters import build_where, build_where_document
+from .filter_index import FilterIndex
+from .vector_index import create_index, load_index, np
+
+
+def _embedding_of(ch: Dict[str, Any]):
+    vec = ch.get("embedding")
+    if vec is None:
+        vec = (ch.get("metadata") or {}).get("clip_vector")
+    return vec if vec is not None and len(vec) else None
+
+
+def without_embedding(ch: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of ``ch`` minus the top-level ``embedding`` (kept in the index instead).
+
+    ``metadata["clip_vector"]`` stays: it is part of the hit metadata returned
+    by ``/search``.
+    """
+
+    if "embedding" not in ch:
+        return ch
+    return {k: v for k, v in ch.items() if k != "embedding"}
 
 
 class FaissLocal(Retriever):
-    def __init__(self) -> None:
-        self._docs: Dict[str, Dict[str, Any]] = {}
+    def __init__(
+        self,
+        metric: str = "cosine",
+        index: Dict[str, Any] | str | None = None,
+        docs: Dict[str, Dict[str, Any]] | None = None,
+        candidates: Callable[[str, int], List[Dict[str, Any]]] | None = None,
+        filters: FilterIndex | None = None,
+    ) -> None:
+        self._owns_docs = docs is None
+        self._docs: Dict[str, Dict[str, Any]] = {} if docs is None else docs
+        self._candidates = candidates
+        # a shared filter index is maintained by whoever owns the chunk mapping
+        self._owns_filters = filters is None
+        self.filters = FilterIndex(self._docs) if filters is None else filters
+        spec = {"type": index} if isinstance(index, str) else dict(index or {})
+        spec.setdefault("metric", metric)
+        self._index = create_index(spec) if np is not None else None
 
     def _tokenise(self, text: str) -> set[str]:
         return set(text.split())
 
+    def _hit(self, ch: Dict[str, Any], score: float) -> Hit:
+        return Hit(
+            id=ch["id"],
+            document=ch.get("text", ""),
+            metadata=ch.get("metadata", {}),
+            score=float(score),
+            chunk=ch.get("chunk", {}),
+        )
+
+    # Persistence ---------------------------------------------------------
+    def save_vectors(self, path: str | Path) -> Path | None:
+        """Write the vector index to ``path`` (usually ``vec.index``)."""
+
+        if self._index is None:
+            return None
+        return self._index.save(path)
+
+    def load_vectors(self, path: str | Path, mmap: bool = True) -> None:
+        """Replace the vector index with the one stored at ``path``."""
+
+        if np is not None:
+            self._index = load_index(path, mmap=mmap)
+
     # Retriever interface -------------------------------------------------
     def upsert(self, chunks: Iterable[Dict[str, Any]]) -> int:
         count = 0
+        vec_ids: List[str] = []
+        vecs: List[Sequence[float]] = []
         for ch in chunks:
-            ch = dict(ch)
-            ch["_tokens"] = self._tokenise(ch.get("text", ""))
-            self._docs[ch["id"]] = ch
+            vec = _embedding_of(ch) if self._index is not None else None
+            if vec is not None:
+                # the matrix owns the floats; a top-level embedding list is dropped
+                vec_ids.append(ch["id"])
+                vecs.append(vec)
+            elif self._index is not None and ch["id"] in self._index:
+                self._index.remove([ch["id"]])
+            if self._owns_filters:
+                self.filters.discard(ch["id"])
+            if self._owns_docs:
+                ch = dict(without_embedding(ch) if vec is not None else ch)
+                ch["_tokens"] = self._tokenise(ch.get("text", ""))
+                self._docs[ch["id"]] = ch
+            if self._owns_filters:
+                self.filters.add(ch["id"], ch)
             count += 1
+        if vec_ids:
+            self._index.add(vec_ids, vecs)
         return count
 
     def delete(self, ids: List[str]) -> int:
         removed = 0
         for i in ids:
             if i in self._docs:
-                del self._docs[i]
+                if self._owns_filters:
+                    self.filters.discard(i)
+                if self._owns_docs:
+                    del self._docs[i]
                 removed += 1
+        if self._index is not None:
+            self._index.remove(ids)
         return removed
 
     def query(
@@ -44,34 +140,70 @@ class FaissLocal(Retriever):
         where: Dict[str, Any] | None = None,
         where_document: Dict[str, Any] | None = None,
         search_type: str = "vector",
+        query_embeddings: List[Sequence[float]] | None = None,
     ) -> List[Hit]:
-        if not query_texts:
-            return []
-        q_tokens = self._tokenise(query_texts[0])
-        meta_pred = build_where(where)
-        doc_pred = build_where_document(where_document)
+        batch = self.query_batch(
+            query_texts[:1], k, where, where_document,
+            query_embeddings=query_embeddings[:1] if query_embeddings is not None else None,
+        )
+        return batch[0] if batch else []
+
+    def query_batch(
+        self,
+        query_texts: List[str],
+        k: int = 10,
+        where: Dict[str, Any] | None = None,
+        where_document: Dict[str, Any] | None = None,
+        search_type: str = "vector",
+        query_embeddings: List[Sequence[float]] | None = None,
+    ) -> List[List[Hit]]:
+        """Top-``k`` hits per query; embeddings are searched in one matmul."""
+
+        allowed = self.filters.select(where, where_document)
+        if query_embeddings is not None and len(query_embeddings) and self._index is not None:
+            return self._query_vectors(query_embeddings, k, allowed)
+        return [self._query_tokens(text, k, allowed) for text in query_texts]
+
+    def _query_tokens(self, text: str, k: int, allowed) -> List[Hit]:
+        q_tokens = self._tokenise(text)
+        size = max(k * 10, 100)
+        if allowed is not None and (self._candidates is None or len(allowed) <= size):
+            # selective filter: score every match instead of a candidate pool
+            pool = (self._docs[i] for i in allowed)
+        elif self._candidates is not None:
+            pool = self._candidates(text, size)
+        else:
+            pool = self._docs.values()
         scores = []
-        for ch in self._docs.values():
-            if not meta_pred(ch.get("metadata", {})):
-                continue
-            if not doc_pred(ch.get("text", "")):
+        for ch in pool:
+            if allowed is not None and ch["id"] not in allowed:
                 continue
-            t = ch.get("_tokens", set())
+            t = ch.get("_tokens")
+            if t is None:
+                t = self._tokenise(ch.get("text", ""))
             if not t:
                 continue
             score = len(q_tokens & t) / len(q_tokens | t)
             if score:
                 scores.append((score, ch))
         scores.sort(key=lambda x: x[0], reverse=True)
-        hits: List[Hit] = []
-        for score, ch in scores[:k]:
-            hits.append(
-                Hit(
-                    id=ch["id"],
-                    document=ch.get("text", ""),
-                    metadata=ch.get("metadata", {}),
-                    score=float(score),
-                    chunk=ch.get("chunk", {}),
-                )
-            )
-        return hits
+        return [self._hit(ch, score) for score, ch in scores[:k]]
+
+    def _query_vectors(self, embeddings: List[Sequence[float]], k: int, allowed) -> List[List[Hit]]:
+        index = self._index
+        mask = None
+        if allowed is not None:
+            mask = np.zeros(index.rows, dtype=bool)
+            for id_ in allowed:
+                row = index.row_of(id_)
+                if row is not None:
+                    mask[row] = True
+        out = []
+        for results in index.search(embeddings, k, mask=mask):
+            hits = []
+            for id_, score in results:
+                ch = self._docs.get(id_)
+                if ch is not None:
+                    hits.append(self._hit(ch, score))
+            out.append(hits)
+        return out
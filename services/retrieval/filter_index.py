@@ -0,0 +1,324 @@
+"""Secondary indexes used to plan ``where`` / ``where_document`` filters.
+
+:class:`FilterIndex` turns a filter tree into a set of candidate chunk ids
+before any scoring happens:
+
+* a **hash index** per metadata field (``value -> ids``) answers equality
+  and ``$in``;
+* the distinct keys of each field are kept as **sorted lists** (numbers and
+  strings separately) so ``$gt``/``$gte``/``$lt``/``$lte`` become two
+  bisections;
+* a **trigram index** over chunk text prefilters ``$contains`` and the
+  literal parts of ``$regex`` in ``where_document``.  Metadata
+  ``$contains``/``$regex`` scan the distinct values of the field instead of
+  every chunk.
+
+Candidates are always re-checked with the exact predicates from
+:mod:`.filters`, so the indexes only have to produce a superset.  Anything
+the planner cannot narrow (``None`` equality, unhashable values, short
+substrings) simply falls back to checking every chunk, as before.
+
+The indexes are built lazily on the first filtered query and then kept up to
+date by the retriever that owns the chunk mapping.  Mappings that decode
+their records from disk on access (``disk_backed = True``, e.g.
+:class:`~services.retrieval.store.ChunkStore`) get no trigram index, which
+would hold every chunk's text in memory: ``where_document`` is then checked
+on the metadata candidates only, or by streaming over the chunks.
+"""
+from __future__ import annotations
+
+import bisect
+import json
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Iterable, List, Mapping, Set, Tuple
+
+from .filters import build_where, build_where_document, compile_regex
+
+try:  # Python 3.11+
+    from re import _parser as _sre_parse
+except ImportError:  # pragma: no cover - older interpreters
+    import sre_parse as _sre_parse  # type: ignore[no-redef]
+
+_RANGE_OPS = {"$gt", "$gte", "$lt", "$lte"}
+_CACHE_SIZE = 32
+
+
+def _hashable(value: Any) -> bool:
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+def _sort_class(value: Any) -> str | None:
+    if isinstance(value, (int, float)):
+        return "num"
+    if isinstance(value, str):
+        return "str"
+    return None
+
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def regex_literals(pattern: str) -> List[str]:
+    """Literal runs every match of ``pattern`` must contain.
+
+    Only top-level literal sequences are used; alternations, classes and
+    repeats just break the runs.  Case-insensitive patterns yield nothing.
+    """
+
+    try:
+        parsed = _sre_parse.parse(pattern)
+    except re.error:
+        return []
+    if parsed.state.flags & re.IGNORECASE:
+        return []
+    runs, cur = [], []
+    for op, arg in parsed.data:
+        if op is _sre_parse.LITERAL:
+            cur.append(chr(arg))
+        else:
+            if cur:
+                runs.append("".join(cur))
+            cur = []
+    if cur:
+        runs.append("".join(cur))
+    return runs
+
+
+def _intersect(a: Set[str] | None, b: Set[str] | None) -> Set[str] | None:
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return a & b if len(a) <= len(b) else b & a
+
+
+class FilterIndex:
+    """Metadata and text indexes over an ``id -> chunk`` mapping."""
+
+    def __init__(self, docs: Mapping[str, Dict[str, Any]]) -> None:
+        self._docs = docs
+        self._text_index = not getattr(docs, "disk_backed", False)
+        self._lock = threading.RLock()
+        self._built = False
+        self._text_built = False
+        # field -> value -> ids
+        self._hash: Dict[str, Dict[Any, Set[str]]] = {}
+        # field -> ids whose value is unhashable (always candidates)
+        self._other: Dict[str, Set[str]] = {}
+        # field -> {"num": sorted keys, "str": sorted keys}
+        self._sorted: Dict[str, Dict[str, List[Any]]] = {}
+        self._grams: Dict[str, Set[str]] = {}
+        self._version = 0
+        self._cache: OrderedDict[Tuple[str, int], FrozenSet[str]] = OrderedDict()
+
+    # Maintenance ---------------------------------------------------------
+    def _ensure(self, text: bool) -> None:
+        if self._built and (self._text_built or not text):
+            return
+        with self._lock:
+            if not self._built:
+                for id_, ch in self._docs.items():
+                    self._add_meta(id_, ch.get("metadata") or {})
+                self._built = True
+            if text and self._text_index and not self._text_built:
+                for id_, ch in self._docs.items():
+                    self._add_text(id_, ch.get("text", ""))
+                self._text_built = True
+
+    def _add_meta(self, id_: str, meta: Mapping[str, Any]) -> None:
+        for field, value in meta.items():
+            if not _hashable(value):
+                self._other.setdefault(field, set()).add(id_)
+                continue
+            bucket = self._hash.setdefault(field, {})
+            if value not in bucket:
+                bucket[value] = set()
+                self._sorted.pop(field, None)
+            bucket[value].add(id_)
+
+    def _add_text(self, id_: str, text: str) -> None:
+        for g in _trigrams(text):
+            self._grams.setdefault(g, set()).add(id_)
+
+    def add(self, id_: str, chunk: Dict[str, Any]) -> None:
+        """Index a chunk that was just stored under ``id_``."""
+
+        with self._lock:
+            self._version += 1
+            if self._built:
+                self._add_meta(id_, chunk.get("metadata") or {})
+            if self._text_built:
+                self._add_text(id_, chunk.get("text", ""))
+
+    def discard(self, id_: str) -> None:
+        """Unindex ``id_``; must run before the chunk leaves the mapping."""
+
+        with self._lock:
+            self._version += 1
+            if not self._built:
+                return
+            ch = self._docs.get(id_)
+            if ch is None:
+                return
+            for field, value in (ch.get("metadata") or {}).items():
+                if not _hashable(value):
+                    self._other.get(field, set()).discard(id_)
+                    continue
+                bucket = self._hash.get(field, {})
+                ids = bucket.get(value)
+                if ids is not None:
+                    ids.discard(id_)
+                    if not ids:
+                        del bucket[value]
+                        self._sorted.pop(field, None)
+            if self._text_built:
+                for g in _trigrams(ch.get("text", "")):
+                    ids = self._grams.get(g)
+                    if ids is not None:
+                        ids.discard(id_)
+                        if not ids:
+                            del self._grams[g]
+
+    # Planning ------------------------------------------------------------
+    def _keys(self, field: str, cls: str) -> List[Any]:
+        keys = self._sorted.get(field)
+        if keys is None:
+            bucket = self._hash.get(field, {})
+            keys = {"num": [], "str": []}
+            for v in bucket:
+                c = _sort_class(v)
+                if c is not None:
+                    keys[c].append(v)
+            for c in keys:
+                keys[c].sort()
+            self._sorted[field] = keys
+        return keys[cls]
+
+    def _union(self, field: str, values: Iterable[Any]) -> Set[str]:
+        bucket = self._hash.get(field, {})
+        out = set(self._other.get(field, ()))
+        for v in values:
+            out |= bucket.get(v, set())
+        return out
+
+    def _range(self, field: str, op: str, cond: Any) -> Set[str] | None:
+        cls = _sort_class(cond)
+        if cls is None:
+            return None
+        keys = self._keys(field, cls)
+        if op == "$gt":
+            sel = keys[bisect.bisect_right(keys, cond):]
+        elif op == "$gte":
+            sel = keys[bisect.bisect_left(keys, cond):]
+        elif op == "$lt":
+            sel = keys[:bisect.bisect_left(keys, cond)]
+        else:
+            sel = keys[:bisect.bisect_right(keys, cond)]
+        return self._union(field, sel)
+
+    def _field(self, field: str, expr: Any) -> Set[str] | None:
+        if not isinstance(expr, dict):
+            if expr is None or not _hashable(expr):
+                return None  # missing fields compare equal to None
+            return self._union(field, [expr])
+        out: Set[str] | None = None
+        for op, cond in expr.items():
+            if op == "$in":
+                values = list(cond)
+                if any(v is None or not _hashable(v) for v in values):
+                    part = None
+                else:
+                    part = self._union(field, values)
+            elif op in _RANGE_OPS:
+                part = self._range(field, op, cond)
+            elif op in ("$contains", "$regex"):
+                if op == "$regex":
+                    search = compile_regex(str(cond)).search
+                    match = lambda v: search(str(v)) is not None  # noqa: E731
+                else:
+                    match = lambda v, c=str(cond): c in str(v)  # noqa: E731
+                part = self._union(field, [v for v in self._hash.get(field, {}) if match(v)])
+            else:  # unknown operators never match
+                return set()
+            out = _intersect(out, part)
+        return out
+
+    def _plan(self, where: Dict[str, Any] | None) -> Set[str] | None:
+        if not where:
+            return None
+        if "$and" in where:
+            out: Set[str] | None = None
+            for w in where["$and"]:
+                out = _intersect(out, self._plan(w))
+            return out
+        if "$or" in where:
+            parts = [self._plan(w) for w in where["$or"]]
+            if any(p is None for p in parts):
+                return None
+            return set().union(*parts)
+        out = None
+        for field, expr in where.items():
+            if not field.startswith("$"):
+                out = _intersect(out, self._field(field, expr))
+        return out
+
+    def _text(self, needle: str) -> Set[str] | None:
+        grams = _trigrams(needle)
+        if not grams:
+            return None
+        out: Set[str] | None = None
+        for g in sorted(grams, key=lambda g: len(self._grams.get(g, ()))):
+            out = _intersect(out, self._grams.get(g, set()))
+            if not out:
+                return set()
+        return set(out)
+
+    def _plan_document(self, where_doc: Dict[str, Any] | None) -> Set[str] | None:
+        if not isinstance(where_doc, dict) or not self._text_index:
+            return None
+        out: Set[str] | None = None
+        for op, cond in where_doc.items():
+            if op == "$contains":
+                out = _intersect(out, self._text(str(cond)))
+            elif op == "$regex":
+                for lit in regex_literals(str(cond)):
+                    out = _intersect(out, self._text(lit))
+        return out
+
+    def select(
+        self, where: Dict[str, Any] | None, where_document: Dict[str, Any] | None
+    ) -> FrozenSet[str] | None:
+        """Ids of chunks matching both filters, or ``None`` if unfiltered."""
+
+        if not where and not where_document:
+            return None
+        key = json.dumps([where, where_document], sort_keys=True, default=str)
+        with self._lock:
+            hit = self._cache.get((key, self._version))
+            if hit is not None:
+                self._cache.move_to_end((key, self._version))
+                return hit
+            self._ensure(text=bool(where_document))
+            cand = _intersect(self._plan(where), self._plan_document(where_document))
+            meta_pred = build_where(where)
+            doc_pred = build_where_document(where_document)
+            out = frozenset(
+                id_ for id_, ch in (
+                    self._docs.items() if cand is None else ((i, self._docs.get(i)) for i in cand)
+                )
+                if ch is not None and meta_pred(ch.get("metadata", {})) and doc_pred(ch.get("text", ""))
+            )
+            self._cache[(key, self._version)] = out
+            while len(self._cache) > _CACHE_SIZE:
+                self._cache.popitem(last=False)
+            return out
+
+
+__all__ = ["FilterIndex", "regex_literals"]
@@ -2,44 +2,60 @@
 
 The implementation is intentionally tiny and supports only the operators
 required by the project: ``$and``, ``$or``, ``$in``, ``$gte``, ``$lte``,
-``$gt``, ``$lt``, ``$regex`` and ``$contains``.
+``$gt``, ``$lt``, ``$regex`` and ``$contains``.  Expressions are compiled
+once per query into flat closures; regular expressions are compiled and
+cached.  :mod:`.filter_index` uses secondary indexes to narrow the set of
+chunks these predicates have to be evaluated on.
 """
 from __future__ import annotations
 
 import re
-from typing import Any, Dict, Callable
+from functools import lru_cache
+from typing import Any, Dict, Callable, List
+
+
+_OPS = {
+    "$in": lambda value, cond: value in cond,
+    "$gt": lambda value, cond: value > cond,
+    "$gte": lambda value, cond: value >= cond,
+    "$lt": lambda value, cond: value < cond,
+    "$lte": lambda value, cond: value <= cond,
+}
+
+
+@lru_cache(maxsize=256)
+def compile_regex(pattern: str) -> re.Pattern:
+    """Compiled ``$regex`` pattern, cached across queries."""
+
+    return re.compile(pattern)
+
+
+def _compile_expr(expr: Any) -> Callable[[Any], bool]:
+    """Compile the expression of a single field into a value predicate."""
+
+    if not isinstance(expr, dict):
+        return lambda value: value == expr
+
+    tests: List[Callable[[Any], bool]] = []
+    for op, cond in expr.items():
+        if op == "$regex":
+            search = compile_regex(str(cond)).search
+            tests.append(lambda value, search=search: search(str(value)) is not None)
+        elif op == "$contains":
+            tests.append(lambda value, cond=str(cond): cond in str(value))
+        elif op in _OPS:
+            tests.append(lambda value, fn=_OPS[op], cond=cond: fn(value, cond))
+        else:  # unknown operator
+            return lambda value: False
+    if len(tests) == 1:
+        return tests[0]
+    return lambda value: all(t(value) for t in tests)
 
 
 def _match_expr(value: Any, expr: Any) -> bool:
     """Match a single field against an expression."""
 
-    if isinstance(expr, dict):
-        for op, cond in expr.items():
-            if op == "$in":
-                if value not in cond:
-                    return False
-            elif op == "$gt":
-                if not (value > cond):
-                    return False
-            elif op == "$gte":
-                if not (value >= cond):
-                    return False
-            elif op == "$lt":
-                if not (value < cond):
-                    return False
-            elif op == "$lte":
-                if not (value <= cond):
-                    return False
-            elif op == "$regex":
-                if not re.search(str(cond), str(value)):
-                    return False
-            elif op == "$contains":
-                if str(cond) not in str(value):
-                    return False
-            else:  # unknown operator
-                return False
-        return True
-    return value == expr
+    return _compile_expr(expr)(value)
 
 
 def _build(where: Dict[str, Any] | None) -> Callable[[Dict[str, Any]], bool]:
@@ -56,17 +72,13 @@ def _build(where: Dict[str, Any] | None) -> Callable[[Dict[str, Any]], bool]:
         preds = [_build(w) for w in where["$or"]]
         return lambda obj: any(p(obj) for p in preds)
 
-    tests = []
-    for field, expr in where.items():
-        if field.startswith("$"):
-            continue
-
-        def test(obj: Dict[str, Any], field=field, expr=expr) -> bool:
-            return _match_expr(obj.get(field), expr)
-
-        tests.append(test)
-
-    return lambda obj: all(t(obj) for t in tests)
+    tests = [
+        (field, _compile_expr(expr)) for field, expr in where.items() if not field.startswith("$")
+    ]
+    if len(tests) == 1:
+        (field, test), = tests
+        return lambda obj: test(obj.get(field))
+    return lambda obj: all(t(obj.get(f)) for f, t in tests)
 
 
 def build_where(where: Dict[str, Any] | None) -> Callable[[Dict[str, Any]], bool]:
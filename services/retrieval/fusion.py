@@ -0,0 +1,128 @@
+"""Rank fusion for hybrid retrieval.
+
+Vector and keyword backends produce scores on unrelated scales (cosine or
+Jaccard similarity versus unbounded BM25), so their raw values cannot be
+compared directly.  Two fusion strategies are provided:
+
+* :func:`rrf` – reciprocal-rank fusion, ``sum(w / (rrf_k + rank))``.  Only
+  ranks are used, which makes it robust to any score distribution.
+* :func:`weighted` – scores of every list are first normalised
+  (``"minmax"`` to ``[0, 1]`` or ``"zscore"``) and then combined as a
+  weighted sum; documents missing from a list contribute nothing for it.
+
+Both take a mapping ``backend name -> ranked hits`` and return fused hits
+sorted by the new score.
+"""
+from __future__ import annotations
+
+import math
+from typing import Any, Dict, List, Mapping
+
+from .retriever import Hit
+
+DEFAULT_FUSION: Dict[str, Any] = {
+    "method": "rrf",
+    "rrf_k": 60,
+    "weights": {},
+    "normalize": "minmax",
+    # results fetched per backend: max(k * overfetch, min_depth) unless
+    # ``depth`` pins it ({"vector": 100, "keyword": 50} or a single int)
+    "overfetch": 4,
+    "min_depth": 20,
+    "depth": None,
+}
+
+
+def fusion_spec(spec: Mapping[str, Any] | str | None) -> Dict[str, Any]:
+    """Merge ``spec`` (a method name or partial dict) into the defaults."""
+
+    merged = dict(DEFAULT_FUSION)
+    if isinstance(spec, str):
+        merged["method"] = spec
+    elif isinstance(spec, Mapping):
+        merged.update(spec)
+    elif spec is not None:
+        raise ValueError(f"fusion must be a method name or an object, not {type(spec).__name__}")
+    if merged["method"] not in ("rrf", "weighted"):
+        raise ValueError(f"unknown fusion method: {merged['method']}")
+    if merged["normalize"] not in ("minmax", "zscore"):
+        raise ValueError(f"unknown fusion normalize: {merged['normalize']}")
+    if not isinstance(merged["weights"] or {}, Mapping):
+        raise ValueError("fusion weights must be an object")
+    try:
+        float(merged["rrf_k"])
+        [float(w) for w in (merged["weights"] or {}).values()]
+    except (TypeError, ValueError):
+        raise ValueError("fusion rrf_k and weights must be numbers") from None
+    return merged
+
+
+def fetch_depth(spec: Mapping[str, Any], backend: str, k: int) -> int:
+    """Number of hits to request from ``backend`` for a final top-``k``."""
+
+    depth = spec.get("depth")
+    if isinstance(depth, Mapping):
+        depth = depth.get(backend)
+    if depth:
+        return max(int(depth), k)
+    return max(k * int(spec.get("overfetch", 1)), int(spec.get("min_depth", 0)), k)
+
+
+def _merge(ranked: Mapping[str, List[Hit]], scores: Dict[str, float], k: int) -> List[Hit]:
+    first: Dict[str, Hit] = {}
+    for hits in ranked.values():
+        for h in hits:
+            first.setdefault(h["id"], h)
+    order = sorted(scores, key=lambda i: scores[i], reverse=True)[:k]
+    return [Hit(**{**first[i], "score": float(scores[i])}) for i in order]
+
+
+def rrf(ranked: Mapping[str, List[Hit]], k: int, rrf_k: int = 60,
+        weights: Mapping[str, float] | None = None) -> List[Hit]:
+    """Reciprocal-rank fusion of several ranked hit lists."""
+
+    weights = weights or {}
+    scores: Dict[str, float] = {}
+    for name, hits in ranked.items():
+        w = float(weights.get(name, 1.0))
+        for rank, h in enumerate(hits, 1):
+            scores[h["id"]] = scores.get(h["id"], 0.0) + w / (rrf_k + rank)
+    return _merge(ranked, scores, k)
+
+
+def _normalised(values: List[float], method: str) -> List[float]:
+    if not values:
+        return []
+    if method == "zscore":
+        mean = sum(values) / len(values)
+        std = math.sqrt(sum((v - mean) ** 2 for v in values) / len(values))
+        return [(v - mean) / std if std else 0.0 for v in values]
+    lo, hi = min(values), max(values)
+    if hi == lo:
+        return [1.0] * len(values)
+    return [(v - lo) / (hi - lo) for v in values]
+
+
+def weighted(ranked: Mapping[str, List[Hit]], k: int, weights: Mapping[str, float] | None = None,
+             normalize: str = "minmax") -> List[Hit]:
+    """Weighted sum of per-list normalised scores."""
+
+    weights = weights or {}
+    scores: Dict[str, float] = {}
+    for name, hits in ranked.items():
+        w = float(weights.get(name, 1.0))
+        norm = _normalised([float(h["score"]) for h in hits], normalize)
+        for h, s in zip(hits, norm):
+            scores[h["id"]] = scores.get(h["id"], 0.0) + w * s
+    return _merge(ranked, scores, k)
+
+
+def fuse(ranked: Mapping[str, List[Hit]], k: int, spec: Mapping[str, Any]) -> List[Hit]:
+    """Dispatch to :func:`rrf` or :func:`weighted` according to ``spec``."""
+
+    if spec["method"] == "weighted":
+        return weighted(ranked, k, spec.get("weights"), spec.get("normalize", "minmax"))
+    return rrf(ranked, k, int(spec.get("rrf_k", 60)), spec.get("weights"))
+
+
+__all__ = ["DEFAULT_FUSION", "fusion_spec", "fetch_depth", "rrf", "weighted", "fuse"]
@@ -1,24 +1,55 @@
-"""Hybrid retrieval combining simple vector and keyword search."""
+"""Hybrid retrieval combining simple vector and keyword search.
+
+Hybrid queries over-fetch from both backends concurrently and merge the two
+rankings with :mod:`.fusion` (reciprocal-rank fusion by default), so the
+latency is that of the slower backend rather than the sum of both.
+"""
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import tarfile
-from typing import Dict, Any, Iterable, List
+import threading
+from typing import Dict, Any, Iterable, List, Sequence
 
 from .retriever import Hit, Retriever
-from .faiss_local import FaissLocal
+from .faiss_local import FaissLocal, without_embedding
 from .bm25_local import BM25Local
+from .filter_index import FilterIndex
+from .fusion import fetch_depth, fuse, fusion_spec
+
+_POOL: ThreadPoolExecutor | None = None
+_POOL_LOCK = threading.Lock()
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="hybrid")
+        return _POOL
 
 
 class HybridRetriever(Retriever):
-    def __init__(self) -> None:
-        self.vector = FaissLocal()
-        self.keyword = BM25Local()
+    def __init__(
+        self,
+        index: Dict[str, Any] | str | None = None,
+        docs: Dict[str, Dict[str, Any]] | None = None,
+        fusion: Dict[str, Any] | str | None = None,
+    ) -> None:
+        self.fusion = fusion_spec(fusion)
+        # both backends share one chunk mapping, owned by the keyword side
+        self.docs: Dict[str, Dict[str, Any]] = {} if docs is None else docs
+        self.filters = FilterIndex(self.docs)
+        self.keyword = BM25Local(docs=self.docs, filters=self.filters)
+        self.vector = FaissLocal(
+            index=index, docs=self.docs, candidates=self.keyword.candidates, filters=self.filters
+        )
 
     def upsert(self, chunks: Iterable[Dict[str, Any]]) -> int:
         data = list(chunks)
         self.vector.upsert(data)
-        self.keyword.upsert(data)
+        self.keyword.upsert([without_embedding(ch) for ch in data])
         return len(data)
 
     def delete(self, ids: List[str]) -> int:
@@ -33,22 +64,59 @@ class HybridRetriever(Retriever):
         where: Dict[str, Any] | None = None,
         where_document: Dict[str, Any] | None = None,
         search_type: str = "hybrid",
+        query_embeddings: List[Sequence[float]] | None = None,
+        fusion: Dict[str, Any] | str | None = None,
     ) -> List[Hit]:
+        batch = self.query_batch(
+            query_texts[:1], k, where, where_document, search_type,
+            query_embeddings=query_embeddings[:1] if query_embeddings is not None else None,
+            fusion=fusion,
+        )
+        return batch[0] if batch else []
+
+    def query_batch(
+        self,
+        query_texts: List[str],
+        k: int = 10,
+        where: Dict[str, Any] | None = None,
+        where_document: Dict[str, Any] | None = None,
+        search_type: str = "hybrid",
+        query_embeddings: List[Sequence[float]] | None = None,
+        fusion: Dict[str, Any] | str | None = None,
+    ) -> List[List[Hit]]:
+        """Run many queries at once; returns one hit list per query.
+
+        ``query_embeddings``, when given, must be parallel to
+        ``query_texts``.  The filter is evaluated once for the whole batch.
+        """
+
+        if query_embeddings is not None and len(query_embeddings):
+            if not query_texts:
+                query_texts = [""] * len(query_embeddings)
+            if len(query_embeddings) != len(query_texts):
+                raise ValueError("query_embeddings must have one entry per query text")
         if search_type == "vector":
-            return self.vector.query(query_texts, k, where, where_document)
+            return self.vector.query_batch(
+                query_texts, k, where, where_document, query_embeddings=query_embeddings
+            )
         if search_type == "keyword":
-            return self.keyword.query(query_texts, k, where, where_document)
-
-        hits: Dict[str, Hit] = {}
-        for h in self.vector.query(query_texts, k, where, where_document):
-            hits[h["id"]] = h
-        for h in self.keyword.query(query_texts, k, where, where_document):
-            if h["id"] in hits:
-                # favour higher score, keep combined metadata
-                hits[h["id"]]["score"] = max(hits[h["id"]]["score"], h["score"])
-            else:
-                hits[h["id"]] = h
-        return sorted(hits.values(), key=lambda x: x["score"], reverse=True)[:k]
+            return self.keyword.query_batch(query_texts, k, where, where_document)
+
+        spec = self.fusion
+        if fusion is not None:
+            override = {"method": fusion} if isinstance(fusion, str) else fusion
+            if not isinstance(override, dict):
+                raise ValueError(f"fusion must be a method name or an object, not {type(fusion).__name__}")
+            spec = fusion_spec({**self.fusion, **override})
+        vec_future = _pool().submit(
+            self.vector.query_batch, query_texts, fetch_depth(spec, "vector", k), where, where_document,
+            query_embeddings=query_embeddings,
+        )
+        kw_batch = self.keyword.query_batch(query_texts, fetch_depth(spec, "keyword", k), where, where_document)
+        return [
+            fuse({"vector": vec_hits, "keyword": kw_hits}, k, spec)
+            for vec_hits, kw_hits in zip(vec_future.result(), kw_batch)
+        ]
 
 
 def snapshot(collection_name: str, base_dir: str = "collections", out_dir: str = "snapshots") -> Path:
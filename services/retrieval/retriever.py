@@ -6,7 +6,7 @@ API so that future backends can drop in with minimal changes.
 """
 from __future__ import annotations
 
-from typing import Protocol, TypedDict, Iterable, List, Dict, Any
+from typing import Protocol, TypedDict, Iterable, List, Dict, Any, Sequence
 
 
 class Hit(TypedDict):
@@ -62,12 +62,32 @@ class Retriever(Protocol):
         where: Dict[str, Any] | None = None,
         where_document: Dict[str, Any] | None = None,
         search_type: str = "hybrid",
+        query_embeddings: List[Sequence[float]] | None = None,
     ) -> List[Hit]:
         """Query the index.
 
-        Parameters mirror the Chroma API.  The default implementation
+        Parameters mirror the Chroma API; ``query_embeddings`` is only used by
+        vector backends and ignored elsewhere.  The default implementation
         returns an empty list so that callers can gracefully degrade when a
         more sophisticated backend is not available.
         """
 
         ...
+
+    def query_batch(
+        self,
+        query_texts: List[str],
+        k: int = 10,
+        where: Dict[str, Any] | None = None,
+        where_document: Dict[str, Any] | None = None,
+        search_type: str = "hybrid",
+        query_embeddings: List[Sequence[float]] | None = None,
+    ) -> List[List[Hit]]:
+        """Query the index with every entry of ``query_texts`` at once.
+
+        Returns one hit list per query, in input order.  Backends score the
+        whole batch in one pass and evaluate the filters only once;
+        :meth:`query` is the single-query special case.
+        """
+
+        ...
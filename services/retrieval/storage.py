@@ -0,0 +1,122 @@
+"""Tiny binary container for NumPy arrays.
+
+Index files (``vec.index`` and friends) are written as::
+
+    b"SGIDX1\\0\\0" | uint64 header length | JSON header | 64-byte aligned arrays
+
+The JSON header holds free-form ``meta`` plus the dtype, shape and offset of
+every array, so readers can :func:`numpy.memmap` each array straight from
+disk without decoding anything up front.  Files are written to a temporary
+sibling and atomically renamed into place.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import struct
+from pathlib import Path
+from typing import Any, Dict, Sequence, Tuple
+
+from .vector_index import np
+
+MAGIC = b"SGIDX1\x00\x00"
+_ALIGN = 64
+
+
+def is_array_file(path: str | Path) -> bool:
+    """Return ``True`` if ``path`` exists and starts with the container magic."""
+
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def write_arrays(path: str | Path, arrays: Dict[str, Any], meta: Dict[str, Any] | None = None) -> Path:
+    """Atomically write ``arrays`` and ``meta`` to ``path``."""
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    arrs = {name: np.ascontiguousarray(a) for name, a in arrays.items()}
+    specs: Dict[str, Dict[str, Any]] = {}
+    offset = 0
+    for name, a in arrs.items():
+        offset = -(-offset // _ALIGN) * _ALIGN
+        specs[name] = {"dtype": a.dtype.str, "shape": list(a.shape), "offset": offset}
+        offset += a.nbytes
+    header = json.dumps({"meta": meta or {}, "arrays": specs}).encode("utf-8")
+    base = -(-(len(MAGIC) + 8 + len(header)) // _ALIGN) * _ALIGN
+
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        for name, a in arrs.items():
+            f.seek(base + specs[name]["offset"])
+            f.write(a.tobytes())
+        f.truncate(base + offset)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return path
+
+
+def read_arrays(path: str | Path, mmap: bool = True) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Return ``(meta, arrays)`` from a container written by :func:`write_arrays`.
+
+    With ``mmap`` the arrays are read-only memory maps; pages are only
+    faulted in when touched.
+    """
+
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"not an index container: {path}")
+        (hlen,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(hlen).decode("utf-8"))
+    base = -(-(len(MAGIC) + 8 + hlen) // _ALIGN) * _ALIGN
+    arrays: Dict[str, Any] = {}
+    for name, spec in header.get("arrays", {}).items():
+        dtype = np.dtype(spec["dtype"])
+        shape = tuple(spec["shape"])
+        count = int(np.prod(shape)) if shape else 1
+        if count == 0:
+            arrays[name] = np.empty(shape, dtype=dtype)
+        elif mmap:
+            arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=base + spec["offset"], shape=shape)
+        else:
+            with open(path, "rb") as f:
+                f.seek(base + spec["offset"])
+                arrays[name] = np.frombuffer(f.read(count * dtype.itemsize), dtype=dtype).reshape(shape).copy()
+    return header.get("meta", {}), arrays
+
+
+def encode_strings(values: Sequence[str]) -> Tuple[Any, Any]:
+    """Pack strings into a UTF-8 blob plus an ``int64`` offsets array."""
+
+    encoded = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+    blob = np.frombuffer(b"".join(encoded), dtype=np.uint8) if encoded else np.zeros(0, dtype=np.uint8)
+    return blob, offsets
+
+
+def decode_string(blob, offsets, i: int) -> str:
+    """Decode the ``i``-th string of a blob produced by :func:`encode_strings`."""
+
+    return bytes(blob[int(offsets[i]):int(offsets[i + 1])]).decode("utf-8")
+
+
+def hash64(value: str) -> int:
+    """Stable 64-bit hash used for on-disk term and id lookup tables."""
+
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+__all__ = [
+    "MAGIC", "is_array_file", "write_arrays", "read_arrays",
+    "encode_strings", "decode_string", "hash64",
+]
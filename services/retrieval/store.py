@@ -0,0 +1,398 @@
+"""On-disk persistence for retrieval collections.
+
+A persistent collection directory looks like::
+
+    data/collections/<name>/
+        manifest.json        # current checkpoint generation
+        wal.jsonl            # upserts/deletes applied since that checkpoint
+        gen-000003/
+            chunks.jsonl     # chunk records, one JSON object per line
+            idmap.index      # chunk id -> row/byte offset (memory-mapped)
+            postings.index   # BM25 postings in CSR form (memory-mapped)
+            vec.index        # vector index (memory-mapped)
+        snapshots/
+
+Opening a collection only reads ``manifest.json`` and the small headers of
+the ``*.index`` containers; arrays are memory-mapped and chunk records are
+decoded one at a time when a hit needs them, so startup time and RSS do not
+depend on collection size.  New upserts are appended to ``wal.jsonl`` before
+they are applied in memory and replayed on the next start.  Once the log
+grows past ``wal_max_bytes`` everything is folded into a new generation
+directory and ``manifest.json`` is switched atomically; files of older
+generations are never modified in place, which also keeps memory-mapped
+readers valid on Windows.
+"""
+from __future__ import annotations
+
+import datetime as _dt
+import json
+import logging
+import os
+import shutil
+import threading
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from .hybrid import HybridRetriever
+from .storage import decode_string, encode_strings, hash64, is_array_file, read_arrays, write_arrays
+from .vector_index import np
+
+logger = logging.getLogger(__name__)
+
+
+def _json_default(value: Any) -> Any:
+    """JSON fallback for NumPy arrays and scalars in chunk records."""
+
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class ChunkStore(MutableMapping):
+    """``id -> chunk`` mapping layered over a lazily decoded on-disk base.
+
+    Writes go to an in-memory overlay; base rows that are overwritten or
+    deleted are only tombstoned until the next checkpoint.
+    """
+
+    # records are decoded on access; FilterIndex keeps no text index over them
+    disk_backed = True
+
+    def __init__(self) -> None:
+        self._overlay: Dict[str, Dict[str, Any]] = {}
+        self._rows = 0
+        self._data = None
+        self._offsets = None
+        self._ids_blob = None
+        self._ids_offsets = None
+        self._id_hash = None
+        self._id_order = None
+        self._dead: set[int] = set()
+        self._dead_arr = None
+
+    @classmethod
+    def open(cls, directory: Path) -> "ChunkStore":
+        store = cls()
+        idmap, data = directory / "idmap.index", directory / "chunks.jsonl"
+        if not (is_array_file(idmap) and data.exists()):
+            return store
+        meta, arrays = read_arrays(idmap)
+        store._rows = int(meta.get("rows", 0))
+        if store._rows:
+            store._data = np.memmap(data, dtype=np.uint8, mode="r")
+            store._offsets = arrays["offsets"]
+            store._ids_blob, store._ids_offsets = arrays["ids_blob"], arrays["ids_offsets"]
+            store._id_hash, store._id_order = arrays["id_hash"], arrays["id_order"]
+        return store
+
+    # Base access ---------------------------------------------------------
+    @property
+    def base_rows(self) -> int:
+        return self._rows
+
+    def base_row(self, id_: str) -> int | None:
+        """Live base row holding ``id_`` or ``None``."""
+
+        if not self._rows:
+            return None
+        h = np.uint64(hash64(id_))
+        i = int(np.searchsorted(self._id_hash, h))
+        while i < self._rows and self._id_hash[i] == h:
+            row = int(self._id_order[i])
+            if row not in self._dead and decode_string(self._ids_blob, self._ids_offsets, row) == id_:
+                return row
+            i += 1
+        return None
+
+    def base_chunk(self, row: int) -> Dict[str, Any]:
+        raw = bytes(self._data[int(self._offsets[row]):int(self._offsets[row + 1])])
+        return json.loads(raw.decode("utf-8"))
+
+    def dead_rows(self):
+        """Sorted array of tombstoned base rows."""
+
+        if self._dead_arr is None:
+            self._dead_arr = np.fromiter(sorted(self._dead), dtype=np.int64, count=len(self._dead))
+        return self._dead_arr
+
+    def _kill(self, row: int) -> None:
+        self._dead.add(row)
+        self._dead_arr = None
+
+    # Mapping interface ---------------------------------------------------
+    def __getitem__(self, id_: str) -> Dict[str, Any]:
+        ch = self._overlay.get(id_)
+        if ch is not None:
+            return ch
+        row = self.base_row(id_)
+        if row is None:
+            raise KeyError(id_)
+        return self.base_chunk(row)
+
+    def __setitem__(self, id_: str, chunk: Dict[str, Any]) -> None:
+        if id_ not in self._overlay:
+            row = self.base_row(id_)
+            if row is not None:
+                self._kill(row)
+        self._overlay[id_] = chunk
+
+    def __delitem__(self, id_: str) -> None:
+        if id_ in self._overlay:
+            del self._overlay[id_]
+            return
+        row = self.base_row(id_)
+        if row is None:
+            raise KeyError(id_)
+        self._kill(row)
+
+    def __contains__(self, id_: object) -> bool:
+        return id_ in self._overlay or (isinstance(id_, str) and self.base_row(id_) is not None)
+
+    def __len__(self) -> int:
+        return len(self._overlay) + self._rows - len(self._dead)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from list(self._overlay)
+        for row in range(self._rows):
+            if row not in self._dead:
+                yield decode_string(self._ids_blob, self._ids_offsets, row)
+
+    # Checkpoint ----------------------------------------------------------
+    def write(self, directory: Path) -> Tuple[Any, Dict[str, int], int]:
+        """Write live chunks to ``directory``.
+
+        Returns ``(base_map, overlay_map, rows)``: the new row of every old
+        base row (``-1`` if dropped), the new row of every overlay id and the
+        total number of rows written.
+        """
+
+        directory.mkdir(parents=True, exist_ok=True)
+        base_map = np.full(self._rows, -1, dtype=np.int64)
+        overlay_map: Dict[str, int] = {}
+        ids: List[str] = []
+        offsets = [0]
+        with open(directory / "chunks.jsonl", "wb") as f:
+            for row in range(self._rows):
+                if row in self._dead:
+                    continue
+                raw = bytes(self._data[int(self._offsets[row]):int(self._offsets[row + 1])])
+                base_map[row] = len(ids)
+                ids.append(decode_string(self._ids_blob, self._ids_offsets, row))
+                f.write(raw)
+                offsets.append(offsets[-1] + len(raw))
+            for id_, ch in self._overlay.items():
+                raw = (json.dumps(ch, ensure_ascii=False, default=_json_default) + "\n").encode("utf-8")
+                overlay_map[id_] = len(ids)
+                ids.append(id_)
+                f.write(raw)
+                offsets.append(offsets[-1] + len(raw))
+            f.flush()
+            os.fsync(f.fileno())
+        blob, id_offsets = encode_strings(ids)
+        hashes = np.fromiter((hash64(i) for i in ids), dtype=np.uint64, count=len(ids))
+        order = np.argsort(hashes, kind="stable")
+        write_arrays(
+            directory / "idmap.index",
+            {
+                "offsets": np.asarray(offsets, dtype=np.int64),
+                "ids_blob": blob,
+                "ids_offsets": id_offsets,
+                "id_hash": hashes[order],
+                "id_order": order.astype(np.int64),
+            },
+            {"rows": len(ids)},
+        )
+        return base_map, overlay_map, len(ids)
+
+
+class WriteAheadLog:
+    """Append-only JSON lines log of collection mutations."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+
+    def append(self, op: str, payload: Any) -> None:
+        line = json.dumps({"op": op, "data": payload}, ensure_ascii=False, default=_json_default)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def replay(self) -> Iterator[Tuple[str, Any]]:
+        if not self.path.exists():
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:  # torn write at the tail
+                    logger.warning("skipping corrupt WAL record in %s", self.path)
+                    continue
+                yield rec.get("op"), rec.get("data")
+
+    def size(self) -> int:
+        try:
+            return self.path.stat().st_size
+        except OSError:
+            return 0
+
+    def truncate(self) -> None:
+        with open(self.path, "w", encoding="utf-8"):
+            pass
+
+
+class PersistentRetriever(HybridRetriever):
+    """:class:`HybridRetriever` that survives restarts (see module docs).
+
+    The backends of the open generation live in one :class:`HybridRetriever`
+    (``_live``).  A checkpoint builds the next generation into a fresh one and
+    swaps it in with a single assignment, so a concurrent query sees either
+    the old or the new generation, never a half-loaded one.  Directories of
+    older generations are removed once the queries still using them finish.
+    """
+
+    def __init__(
+        self,
+        base: str | Path,
+        index: Dict[str, Any] | str | None = None,
+        wal_max_bytes: int = 64 * 1024 * 1024,
+        fusion: Dict[str, Any] | str | None = None,
+    ) -> None:
+        self.base = Path(base)
+        self.base.mkdir(parents=True, exist_ok=True)
+        self.index_spec = index
+        self.fusion_spec = fusion
+        self.wal_max_bytes = wal_max_bytes
+        self.wal = WriteAheadLog(self.base / "wal.jsonl")
+        self._lock = threading.RLock()
+        self._readers: Dict[int, int] = {}  # generation -> running queries
+        self._readers_cv = threading.Condition()
+        self.generation = int(self._read_manifest().get("generation", 0))
+        self._live = self._open_generation(self.generation)
+        for op, data in self.wal.replay():
+            if op == "upsert":
+                self._live.upsert(data)
+            elif op == "delete":
+                self._live.delete(data)
+
+    # backends of the open generation
+    docs = property(lambda self: self._live.docs)
+    filters = property(lambda self: self._live.filters)
+    keyword = property(lambda self: self._live.keyword)
+    vector = property(lambda self: self._live.vector)
+    fusion = property(lambda self: self._live.fusion)
+
+    # ------------------------------------------------------------------
+    def _gen_dir(self, generation: int) -> Path:
+        return self.base / f"gen-{generation:06d}"
+
+    def _read_manifest(self) -> Dict[str, Any]:
+        try:
+            return json.loads((self.base / "manifest.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def _open_generation(self, generation: int) -> HybridRetriever:
+        gdir = self._gen_dir(generation)
+        docs = ChunkStore.open(gdir) if generation else ChunkStore()
+        live = HybridRetriever(index=self.index_spec, docs=docs, fusion=self.fusion_spec)
+        if not generation:
+            return live
+        if is_array_file(gdir / "vec.index"):
+            live.vector.load_vectors(gdir / "vec.index")
+        if is_array_file(gdir / "postings.index"):
+            meta, arrays = read_arrays(gdir / "postings.index")
+            if int(meta.get("rows", -1)) == docs.base_rows:
+                live.keyword.attach(meta, arrays)
+            else:  # pragma: no cover - only after manual tampering
+                logger.warning("postings of %s do not match its chunks; re-indexing", gdir)
+                live.keyword.upsert([docs.base_chunk(r) for r in range(docs.base_rows)])
+        return live
+
+    @property
+    def files(self) -> List[Path]:
+        """Files making up the current checkpoint (for snapshots)."""
+
+        out = [self.base / "manifest.json", self.base / "wal.jsonl"]
+        if self.generation:
+            out += sorted(self._gen_dir(self.generation).iterdir())
+        return [p for p in out if p.exists()]
+
+    # Retriever interface -------------------------------------------------
+    def upsert(self, chunks: Iterable[Dict[str, Any]]) -> int:
+        data = list(chunks)
+        with self._lock:
+            self.wal.append("upsert", data)
+            n = self._live.upsert(data)
+            self._maybe_checkpoint()
+        return n
+
+    def delete(self, ids: List[str]) -> int:
+        with self._lock:
+            self.wal.append("delete", list(ids))
+            n = self._live.delete(ids)
+            self._maybe_checkpoint()
+        return n
+
+    def query_batch(self, *args: Any, **kwargs: Any) -> List[List[Any]]:
+        with self._readers_cv:
+            live, gen = self._live, self.generation
+            self._readers[gen] = self._readers.get(gen, 0) + 1
+        try:
+            return live.query_batch(*args, **kwargs)
+        finally:
+            with self._readers_cv:
+                self._readers[gen] -= 1
+                if not self._readers[gen]:
+                    del self._readers[gen]
+                    self._readers_cv.notify_all()
+
+    def _maybe_checkpoint(self) -> None:
+        if self.wal.size() >= self.wal_max_bytes:
+            self.checkpoint()
+
+    def checkpoint(self, drain_timeout: float = 60.0) -> Path:
+        """Fold the WAL into a new generation and reopen it memory-mapped."""
+
+        with self._lock:
+            gen = self.generation + 1
+            gdir = self._gen_dir(gen)
+            if gdir.exists():
+                shutil.rmtree(gdir)
+            base_map, overlay_map, rows = self.docs.write(gdir)
+            meta, arrays = self.keyword.export(base_map, overlay_map, rows)
+            write_arrays(gdir / "postings.index", arrays, meta)
+            self.vector.save_vectors(gdir / "vec.index")
+            manifest = {
+                "generation": gen,
+                "rows": rows,
+                "created_at": _dt.datetime.now().isoformat(timespec="seconds"),
+            }
+            tmp = self.base / "manifest.json.tmp"
+            tmp.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+            os.replace(tmp, self.base / "manifest.json")
+            self.wal.truncate()
+            live = self._open_generation(gen)
+            with self._readers_cv:
+                self._live, self.generation = live, gen
+        # drain outside the writer lock: a slow query must not block upserts
+        with self._readers_cv:
+            drained = self._readers_cv.wait_for(
+                lambda: all(g >= gen for g in self._readers), timeout=drain_timeout
+            )
+        if not drained:
+            # removed by a later checkpoint once those queries are gone
+            logger.warning("queries still running on older generations of %s", self.base)
+            return gdir
+        for stale in self.base.glob("gen-*"):
+            try:
+                older = int(stale.name[4:]) < gen
+            except ValueError:
+                continue
+            if older:  # newer ones may belong to a checkpoint that ran meanwhile
+                shutil.rmtree(stale, ignore_errors=True)
+        return gdir
+
+
+__all__ = ["ChunkStore", "WriteAheadLog", "PersistentRetriever"]
@@ -0,0 +1,33 @@
+"""Tokenizer shared by the local retrieval backends.
+
+Latin/digit runs are lower-cased and emitted as whole words.  CJK text has no
+word boundaries, so runs of CJK characters are emitted as overlapping
+bigrams plus the individual characters.  This mirrors the classic CJK
+analyzer used by full-text engines and keeps recall reasonable for short
+queries such as ``"数据"`` without requiring a segmentation dictionary.
+"""
+from __future__ import annotations
+
+import re
+from typing import List
+
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+_TOKEN_RE = re.compile(rf"[{_CJK}]+|[^\W_{_CJK}]+")
+_CJK_RE = re.compile(rf"[{_CJK}]")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split ``text`` into index terms."""
+
+    out: List[str] = []
+    for m in _TOKEN_RE.finditer(text or ""):
+        tok = m.group(0)
+        if not _CJK_RE.match(tok):
+            out.append(tok.lower())
+            continue
+        out.extend(tok)
+        out.extend(tok[i:i + 2] for i in range(len(tok) - 1))
+    return out
+
+
+__all__ = ["tokenize"]
@@ -0,0 +1,304 @@
+"""Dense vector index kept in a contiguous NumPy matrix.
+
+:class:`FlatIndex` stores embeddings row-wise in a single ``float32`` matrix
+together with an id <-> row map.  The matrix grows geometrically so that
+appends are amortised O(1); deletes only flip a tombstone bit and the freed
+row is reused by the next insert.  Search is exact: one batched matmul
+followed by :func:`numpy.argpartition` to select the top-k rows.
+
+Approximate indexes (see :mod:`.ann`) subclass :class:`FlatIndex` and share
+its row bookkeeping and on-disk format; :func:`create_index` and
+:func:`load_index` pick the implementation from a small spec dictionary.
+
+NumPy is an optional dependency; callers should check :data:`np` before
+instantiating an index.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Dict, List, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None  # type: ignore
+
+METRICS = ("cosine", "ip")
+
+
+class FlatIndex:
+    """Exact inner-product / cosine index over a growable matrix."""
+
+    kind = "flat"
+
+    def __init__(self, dim: int | None = None, metric: str = "cosine", capacity: int = 1024) -> None:
+        if np is None:
+            raise RuntimeError("numpy is required for vector indexes")
+        if metric not in METRICS:
+            raise ValueError(f"unknown metric: {metric}")
+        self.metric = metric
+        self.dim = dim
+        self._initial = max(int(capacity), 1)
+        self._mat = None  # (capacity, dim) float32
+        self._alive = np.zeros(0, dtype=bool)
+        self._n = 0  # high-water mark of used rows
+        self._count = 0
+        self._row_of: Dict[str, int] | None = {}
+        self._id_of: List[str | None] | None = []
+        self._free: List[int] = []
+        # packed ids of an index opened from disk, decoded on demand
+        self._ids_blob = None
+        self._ids_offsets = None
+
+    # Row bookkeeping -----------------------------------------------------
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, id_: str) -> bool:
+        return self.row_of(id_) is not None
+
+    @property
+    def rows(self) -> int:
+        """Number of matrix rows in use, including tombstones."""
+        return self._n
+
+    def _ensure_maps(self) -> None:
+        if self._row_of is not None:
+            return
+        from .storage import decode_string
+
+        self._id_of = []
+        self._row_of = {}
+        for row in range(self._n):
+            id_ = decode_string(self._ids_blob, self._ids_offsets, row) if self._alive[row] else None
+            self._id_of.append(id_)
+            if id_ is None:
+                self._free.append(row)
+            else:
+                self._row_of[id_] = row
+        self._ids_blob = self._ids_offsets = None
+
+    def row_of(self, id_: str) -> int | None:
+        self._ensure_maps()
+        return self._row_of.get(id_)
+
+    def id_of(self, row: int) -> str | None:
+        if not 0 <= row < self._n or not self._alive[row]:
+            return None
+        if self._id_of is None:
+            from .storage import decode_string
+
+            return decode_string(self._ids_blob, self._ids_offsets, row)
+        return self._id_of[row]
+
+    def _prepare(self, vectors) -> "np.ndarray":
+        arr = np.asarray(vectors, dtype=np.float32)
+        if arr.ndim == 1:
+            arr = arr[None, :]
+        if self.dim is None:
+            self.dim = int(arr.shape[1])
+        if arr.shape[1] != self.dim:
+            raise ValueError(f"vector dimension {arr.shape[1]} != index dimension {self.dim}")
+        if self.metric == "cosine":
+            norms = np.linalg.norm(arr, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            arr = arr / norms
+        return np.ascontiguousarray(arr, dtype=np.float32)
+
+    @staticmethod
+    def _grown(arr, new_cap: int, used: int, fill=0):
+        out = np.full((new_cap,) + arr.shape[1:], fill, dtype=arr.dtype)
+        out[:used] = arr[:used]
+        return out
+
+    def _capacity(self) -> int:
+        return len(self._alive)
+
+    def _grow_arrays(self, new_cap: int) -> None:
+        if self._mat is None:
+            self._mat = np.zeros((new_cap, self.dim), dtype=np.float32)
+        else:
+            self._mat = self._grown(self._mat, new_cap, self._n)
+        self._alive = self._grown(self._alive, new_cap, self._n)
+
+    def _reserve(self, rows: int, force: bool = False) -> None:
+        cap = self._capacity()
+        if rows <= cap and not force:
+            return
+        new_cap = max(self._initial, cap)
+        while new_cap < rows:
+            new_cap *= 2
+        self._grow_arrays(new_cap)
+
+    def _ensure_writable(self) -> None:
+        # arrays opened with mmap are read-only; copy them on first write
+        if not self._alive.flags.writeable or (self._mat is not None and not self._mat.flags.writeable):
+            self._reserve(max(self._n, 1), force=True)
+
+    def _write_rows(self, rows: "np.ndarray", arr: "np.ndarray") -> None:
+        self._mat[rows] = arr
+
+    # Public API ----------------------------------------------------------
+    def add(self, ids: Sequence[str], vectors) -> int:
+        """Insert or overwrite vectors for ``ids``."""
+
+        if not len(ids):
+            return 0
+        arr = self._prepare(vectors)
+        if arr.shape[0] != len(ids):
+            raise ValueError("ids and vectors length mismatch")
+        self._ensure_maps()
+        self._ensure_writable()
+        new = sum(1 for i in set(ids) if i not in self._row_of)
+        self._reserve(self._n + max(new - len(self._free), 0))
+        rows = []
+        for id_ in ids:
+            row = self._row_of.get(id_)
+            if row is None:
+                if self._free:
+                    row = self._free.pop()
+                else:
+                    row = self._n
+                    self._n += 1
+                    self._id_of.append(None)
+                self._row_of[id_] = row
+                self._id_of[row] = id_
+                self._count += 1
+            rows.append(row)
+        rows_arr = np.asarray(rows, dtype=np.int64)
+        self._write_rows(rows_arr, arr)
+        self._alive[rows_arr] = True
+        return len(ids)
+
+    def remove(self, ids: Sequence[str]) -> int:
+        """Tombstone rows for ``ids``; the matrix is not reallocated."""
+
+        self._ensure_maps()
+        self._ensure_writable()
+        removed = 0
+        for id_ in ids:
+            row = self._row_of.pop(id_, None)
+            if row is None:
+                continue
+            self._alive[row] = False
+            self._id_of[row] = None
+            self._free.append(row)
+            self._count -= 1
+            removed += 1
+        return removed
+
+    def _valid_rows(self, mask=None) -> "np.ndarray":
+        valid = np.asarray(self._alive[: self._n])
+        if mask is not None:
+            valid = valid & np.asarray(mask, dtype=bool)[: self._n]
+        return valid
+
+    def _select(self, rows: "np.ndarray", scores: "np.ndarray", k: int) -> List[Tuple[str, float]]:
+        """Pick the top-``k`` of ``scores`` (parallel to ``rows``)."""
+
+        if not len(rows):
+            return []
+        if k < len(rows):
+            part = np.argpartition(-scores, k - 1)[:k]
+        else:
+            part = np.arange(len(rows))
+        order = part[np.argsort(-scores[part], kind="stable")]
+        return [(self.id_of(int(rows[i])), float(scores[i])) for i in order]
+
+    def search(self, queries, k: int = 10, mask=None, **params: Any) -> List[List[Tuple[str, float]]]:
+        """Return the top-``k`` ``(id, score)`` pairs for each query row.
+
+        ``mask`` is an optional boolean array over matrix rows (length
+        :attr:`rows`) restricting the candidates, e.g. from metadata filters.
+        Extra ``params`` are accepted for API parity with approximate indexes.
+        """
+
+        if self.dim is None or not self._count or k <= 0:
+            return [[] for _ in range(len(queries))]
+        q = self._prepare(queries)
+        rows = np.flatnonzero(self._valid_rows(mask))
+        if not len(rows):
+            return [[] for _ in range(q.shape[0])]
+        # a contiguous slice avoids the gather copy when nothing is filtered out
+        mat = self._mat[: self._n] if len(rows) == self._n else self._mat[rows]
+        scores = q @ mat.T
+        return [self._select(rows, scores[qi], k) for qi in range(q.shape[0])]
+
+    # Persistence ---------------------------------------------------------
+    def _meta(self) -> Dict[str, Any]:
+        return {"kind": self.kind, "dim": self.dim, "metric": self.metric, "count": self._count, "rows": self._n}
+
+    def _arrays(self) -> Dict[str, Any]:
+        from .storage import encode_strings
+
+        n = self._n
+        if self._id_of is None:
+            blob, offsets = self._ids_blob, self._ids_offsets
+        else:
+            blob, offsets = encode_strings([i or "" for i in self._id_of[:n]])
+        arrays = {"alive": np.asarray(self._alive[:n]), "ids_blob": blob, "ids_offsets": offsets}
+        if self._mat is not None:
+            arrays["vectors"] = np.asarray(self._mat[:n]) if self.dim else np.zeros((0, 0), np.float32)
+        return arrays
+
+    def _restore(self, meta: Dict[str, Any], arrays: Dict[str, Any]) -> None:
+        self._n = int(meta.get("rows", len(arrays["alive"])))
+        self._count = int(meta.get("count", int(np.count_nonzero(arrays["alive"]))))
+        self._alive = arrays["alive"]
+        self._mat = arrays.get("vectors")
+        self._ids_blob, self._ids_offsets = arrays["ids_blob"], arrays["ids_offsets"]
+        self._row_of = self._id_of = None
+        self._free = []
+
+    def save(self, path: str | Path) -> Path:
+        """Write the index to ``path`` (see :mod:`.storage`)."""
+
+        from .storage import write_arrays
+
+        return write_arrays(path, self._arrays(), self._meta())
+
+    @classmethod
+    def from_arrays(cls, meta: Dict[str, Any], arrays: Dict[str, Any]) -> "FlatIndex":
+        idx = cls(dim=meta.get("dim"), metric=meta.get("metric", "cosine"))
+        idx._restore(meta, arrays)
+        return idx
+
+
+def create_index(spec: Dict[str, Any] | str | None = None) -> FlatIndex:
+    """Instantiate a vector index from ``spec``.
+
+    ``spec`` is either an index type name (``"flat"`` / ``"ivf"``) or a
+    dictionary with a ``type`` key plus constructor options, e.g.
+    ``{"type": "ivf", "nlist": 1024, "nprobe": 16, "pq_m": 16}``.
+    """
+
+    if isinstance(spec, str):
+        spec = {"type": spec}
+    opts = dict(spec or {})
+    kind = (opts.pop("type", None) or "flat").lower()
+    if kind == "flat":
+        return FlatIndex(**opts)
+    if kind == "ivf":
+        from .ann import IVFIndex
+
+        return IVFIndex(**opts)
+    raise ValueError(f"unknown vector index type: {kind}")
+
+
+def load_index(path: str | Path, mmap: bool = True) -> FlatIndex:
+    """Open an index written by :meth:`FlatIndex.save` (memory-mapped)."""
+
+    from .storage import read_arrays
+
+    meta, arrays = read_arrays(path, mmap=mmap)
+    kind = meta.get("kind", "flat")
+    if kind == "flat":
+        return FlatIndex.from_arrays(meta, arrays)
+    if kind == "ivf":
+        from .ann import IVFIndex
+
+        return IVFIndex.from_arrays(meta, arrays)
+    raise ValueError(f"unknown vector index type: {kind}")
+
+
+__all__ = ["FlatIndex", "METRICS", "create_index", "load_index", "np"]
@@ -7,6 +7,12 @@ ROOT_DIR = Path(__file__).parents[1]
 sys.path.insert(0, str(ROOT_DIR))
 
 from app_unified import create_app
+from core.settings import SETTINGS
+
+@pytest.fixture(autouse=True)
+def _segment_store_in_tmp(tmp_path, monkeypatch):
+    # replace_documents appends to chunking.segment_dir; keep tests out of data/chunks
+    monkeypatch.setitem(SETTINGS.setdefault("chunking", {}), "segment_dir", str(tmp_path / "segments"))
 
 @pytest.fixture
 def app():
@@ -0,0 +1,242 @@
+import pytest
+
+
+class _StubOllama:
+    """Tiny stand-in for Ollama's ``/api/generate`` (threaded HTTP server)."""
+
+    def __init__(self, respond, delay=0.0, fail_first=0, piece=4):
+        import http.server
+        import json
+        import threading
+        import time
+
+        stub = self
+        self.prompts, self.active, self.peak = [], 0, 0
+        self.fail_left = fail_first
+        self.aborted = threading.Event()
+        self._lock = threading.Lock()
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with stub._lock:
+                    stub.prompts.append(body["prompt"])
+                    stub.active += 1
+                    stub.peak = max(stub.peak, stub.active)
+                    fail = stub.fail_left > 0
+                    stub.fail_left -= 1
+                time.sleep(delay)
+                with stub._lock:
+                    stub.active -= 1
+                if body.get("stream") and not fail:
+                    return self.stream(respond(body["prompt"]))
+                out = b"busy" if fail else json.dumps({"response": respond(body["prompt"])}).encode()
+                self.send_response(503 if fail else 200)
+                self.send_header("Content-Length", str(len(out)))
+                self.end_headers()
+                self.wfile.write(out)
+
+            def stream(self, text):
+                # NDJSON, one short piece at a time, like Ollama with stream: true
+                self.send_response(200)
+                self.end_headers()
+                try:
+                    for i in range(0, len(text), piece):
+                        self.wfile.write(json.dumps({"response": text[i:i + piece], "done": False}).encode() + b"\n")
+                        self.wfile.flush()
+                        time.sleep(delay)
+                    self.wfile.write(json.dumps({"response": "", "done": True}).encode() + b"\n")
+                except OSError:
+                    stub.aborted.set()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def ai_config(monkeypatch):
+    """``ai`` settings seen by AIKeywordService (filled in by each test), with
+    MAP/REDUCE test prompts and no generation cache."""
+    from services.ai_keywords import AIKeywordService
+
+    ai = {}
+    monkeypatch.setattr(AIKeywordService, "_ai_config", property(lambda self: ai))
+    monkeypatch.setattr("services.llm_client.get_generation_cache", lambda: None)
+    monkeypatch.setattr("services.ai_keywords.CFG.get", lambda key, default=None: {
+        "map": "MAP {{chunk_text}}", "reduce": "REDUCE {{map_results_json}}"} if key == "prompts" else default)
+    return ai
+
+
+def test_map_reduce_many_interleaves_documents_within_in_flight_limit(ai_config):
+    import json
+    from services.ai_keywords import AIKeywordService
+
+    def respond(prompt):
+        if prompt.startswith("MAP"):
+            return json.dumps({"keywords": [{"term": prompt.split()[1]}]})
+        return json.dumps({"keywords": [k for r in json.loads(prompt[7:]) for k in r["keywords"]]})
+
+    stub = _StubOllama(respond, delay=0.05, fail_first=1)
+    ai_config.update({"provider": "ollama", "url": stub.url, "max_in_flight": 3, "retries": 2,
+                      "retry_backoff_sec": 0.01, "num_ctx": 600, "reserve_tokens": 0, "token_ratio": 1.0})
+    try:
+        docs = {f"d{i}": (f"d{i}", "\n".join(f"d{i}c{j} " + "字" * 400 for j in range(3)), "TEXT") for i in range(4)}
+        results = dict(AIKeywordService().map_reduce_many(docs))
+        assert {k: [kw["term"][:4] for kw in r["keywords"]] for k, r in results.items()} == {
+            f"d{i}": [f"d{i}c{j}" for j in range(3)] for i in range(4)
+        }
+        assert stub.peak == 3 and len(stub.prompts) == 4 * 4 + 1  # one 503 retried
+        first = [p.split()[1][:2] for p in stub.prompts[:6] if p.startswith("MAP")]
+        assert len(set(first)) > 1  # map calls of different documents interleave
+    finally:
+        stub.close()
+
+
+def test_generation_cache_hits_expires_and_follows_config(tmp_path, monkeypatch):
+    import time
+
+    from core.generation_cache import GenerationCache, config_signature
+    from services.llm_client import OllamaClient
+
+    clock = [time.time()]
+    cache = GenerationCache(tmp_path / "gen.db", ttl_sec=60, max_bytes=10_000, now=lambda: clock[0])
+    monkeypatch.setattr("services.llm_client.get_generation_cache", lambda: cache)
+    stub = _StubOllama(lambda prompt: prompt.upper())
+    client = OllamaClient(stub.url, max_in_flight=2)
+    try:
+        assert client.generate("abc", "m") == "ABC" and client.generate("abc", "m") == "ABC"
+        assert client.generate("abc", "m", {"temperature": 0}) == "ABC"  # options are part of the key
+        assert len(stub.prompts) == 2 and cache.stats()["hits"] == 1
+
+        clock[0] += 120  # past the TTL
+        assert client.generate("abc", "m") == "ABC" and len(stub.prompts) == 3
+
+        settings = {"prompts": {"map": "v1"}, "ai": {"model": "m"}}
+        cache.use_signature(config_signature(settings))
+        client.generate("xyz", "m")
+        settings["prompts"]["map"] = "v2"  # edited prompts drop older entries
+        assert cache.use_signature(config_signature(settings)) == 1
+        assert cache.stats()["entries"] == 0
+
+        for i in range(40):
+            client.generate(f"{i:03d}" + "x" * 400, "m")
+        assert cache.stats()["bytes"] <= 10_000
+    finally:
+        client.close()
+        stub.close()
+
+
+def test_keywords_and_tags_single_pass_with_concurrent_fallback(monkeypatch):
+    import json
+
+    from core import ollama
+
+    monkeypatch.setattr("services.llm_client.get_generation_cache", lambda: None)
+    reply = {"text": json.dumps({"keywords": ["预算", "报告"], "tags": ["财务"]}, ensure_ascii=False)}
+    stub = _StubOllama(lambda prompt: reply["text"] if "JSON" in prompt else "甲, 乙", delay=0.05)
+    try:
+        monkeypatch.setattr(ollama, "SETTINGS", {"ai": {"provider": "ollama", "enable": True, "url": stub.url,
+                                                        "model": "m", "retry_backoff_sec": 0}})
+        kw, tags = ollama.call_ollama_keywords_and_tags("年度预算", "正文", seeds="合同")
+        assert (kw, tags) == ("合同, 预算, 报告", "财务")
+        assert len(stub.prompts) == 1
+
+        reply["text"] = "not json"
+        assert ollama.call_ollama_keywords_and_tags("标题", "正文") == ("甲, 乙", "甲, 乙")
+        assert len(stub.prompts) == 4 and stub.peak == 2
+    finally:
+        stub.close()
+
+
+def test_map_reduce_stream_reports_maps_tokens_and_aborts_on_close(ai_config):
+    import json
+
+    from services.ai_keywords import AIKeywordService
+    from services.llm_client import OllamaClient
+
+    def respond(prompt):
+        if prompt.startswith("MAP"):
+            return json.dumps({"keywords": [{"term": prompt.split()[1]}]})
+        return json.dumps({"keywords": [{"term": "合并"}], "summary": "x" * 200})
+
+    stub = _StubOllama(respond, delay=0.01)
+    ai_config.update({"provider": "ollama", "url": stub.url, "model": "m", "retry_backoff_sec": 0,
+                      "num_ctx": 600, "reserve_tokens": 0, "token_ratio": 1.0})
+    service = AIKeywordService()
+    try:
+        body = "\n".join([("甲" * 400), ("乙" * 400)])
+        events = list(service.map_reduce_stream("t", body, "TEXT"))
+        kinds = [k for k, _ in events]
+        assert kinds[:2] == ["map", "map"] and kinds[-1] == "result"
+        assert sorted(v["chunk"] for k, v in events if k == "map") == [1, 2]
+        assert kinds.count("token") > 10
+        assert events[-1][1]["flat_terms"] == ["合并"]
+
+        pieces = OllamaClient(stub.url).stream("REDUCE []", "m", cache=False)
+        assert next(pieces)
+        pieces.close()
+        assert stub.aborted.wait(5)
+    finally:
+        stub.close()
+
+
+def test_keyword_plan_packs_to_context_and_skips_reduce_for_one_chunk(ai_config):
+    import json
+
+    from services.ai_keywords import AIKeywordService
+
+    stub = _StubOllama(lambda prompt: json.dumps({"keywords": [{"term": prompt.split()[1][:2]}]}))
+    ai_config.update({"provider": "ollama", "url": stub.url, "model": "m", "num_ctx": 1000,
+                      "reserve_tokens": 200, "token_ratio": 1.0})
+    service = AIKeywordService()
+    try:
+        body = "\n".join("段" * 100 for _ in range(20))  # 2000 tokens, 799 fit per prompt
+        plan = service.plan("t", body, "TEXT")
+        assert [len(c.replace("\n", "")) for c in plan.chunks] == [700, 700, 600]
+        assert max(plan.prompt_tokens) <= 800 and plan.planned_calls == 4
+
+        result = service.map_reduce_keywords("t", "短文" * 50, "TEXT")
+        assert result["flat_terms"] == ["短文"]
+        assert result["llm_calls"] == {"planned": 1, "made": 1}
+        assert len(stub.prompts) == 1 and stub.prompts[0].startswith("MAP")
+    finally:
+        stub.close()
+
+
+def test_tree_reduce_merges_groups_level_by_level(ai_config):
+    import json
+
+    from services.ai_keywords import AIKeywordService
+
+    def respond(prompt):
+        if prompt.startswith("MAP"):
+            return json.dumps({"keywords": [{"term": prompt.split()[1][:2]}]})
+        return json.dumps({"keywords": [k for r in json.loads(prompt[7:]) for k in r["keywords"]]})
+
+    stub = _StubOllama(respond, delay=0.05)
+    ai_config.update({"provider": "ollama", "url": stub.url, "model": "m", "num_ctx": 600, "reserve_tokens": 0,
+                      "token_ratio": 1.0, "reduce_fanout": 2, "reduce_max_depth": 4})
+    service = AIKeywordService()
+    try:
+        body = "\n".join(f"{c}{c} " + "字" * 400 for c in "甲乙丙丁戊")
+        result = service.map_reduce_keywords("t", body, "TEXT")
+        assert result["flat_terms"] == ["甲甲", "乙乙", "丙丙", "丁丁", "戊戊"]
+        assert result["llm_calls"] == {"planned": 9, "made": 9}  # 5 map + 2 + 1 + final
+        reduces = [json.loads(p[7:]) for p in stub.prompts if p.startswith("REDUCE")]
+        assert [len(r) for r in reduces[:2]] == [2, 2] and max(len(r) for r in reduces) == 2
+        assert stub.peak >= 2
+
+        ai_config["reduce_max_depth"] = 2
+        events = [k for k, _ in service.map_reduce_stream("t", body, "TEXT")]
+        assert events.count("reduce") == 1 and events[-1] == "result"
+        assert len(json.loads(stub.prompts[-1][7:])) == 3  # depth cap: the rest in one call
+    finally:
+        stub.close()
@@ -7,3 +7,22 @@ def test_health_check(client):
     response = client.get("/healthz")
     assert response.status_code == 200
     assert response.json == {"ok": True}
+
+def test_keywords_stream_get_only_replays_a_posted_job(client):
+    assert client.get("/full/keywords/stream?path=/tmp/x").status_code == 401
+    with client.session_transaction() as sess:
+        sess["user"] = "admin"
+    assert client.get("/full/keywords/stream?path=/tmp/x").status_code == 404
+
+    job = client.post("/full/keywords/stream/jobs", json={"paths": []}).json["job_id"]
+    response = client.get(f"/full/keywords/stream?job={job}")
+    assert response.status_code == 200 and b"event: done" in response.data
+    assert client.get(f"/full/keywords/stream?job={job}").status_code == 404  # single use
+
+def test_search_rejects_bad_k_with_400(client):
+    with client.session_transaction() as sess:
+        sess["user"] = "admin"
+    for k in (None, "many", 0, -3):
+        for url, body in (("/full/search", {"query": "x"}), ("/full/search_batch", {"queries": ["x"]})):
+            response = client.post(url, json={**body, "k": k})
+            assert response.status_code == 400 and response.json["ok"] is False
@@ -0,0 +1,76 @@
+import os
+
+from core.catalog import FileCatalog
+
+
+def test_catalog_incremental_refresh(tmp_path):
+    root = tmp_path / "root"
+    (root / "sub" / "deep").mkdir(parents=True)
+    (root / "a.txt").write_text("alpha")
+    (root / "sub" / "b.PDF").write_bytes(b"%PDF")
+    (root / "sub" / "deep" / "c.png").write_bytes(b"png")
+
+    cat = FileCatalog(tmp_path / "catalog.db", workers=4)
+    stats = cat.refresh(str(root), with_hash=True)
+    assert stats["listed"] == 3 and stats["changed"] == 3 and stats["hashed"] == 3
+    rows = list(cat.iter_rows(str(root)))
+    assert [r["name"] for r in rows] == ["a", "b", "c"]
+    assert rows[1]["ext"] == "pdf" and rows[1]["category"] == "PDF" and rows[0]["sha256"]
+
+    # nothing changed: every directory is skipped by mtime and nothing re-hashed
+    stats = cat.refresh(str(root), with_hash=True)
+    assert stats == {"listed": 0, "skipped": 3, "changed": 0, "removed": 0, "hashed": 0}
+
+    (root / "sub" / "b.PDF").unlink()
+    (root / "sub" / "new.md").write_text("x")
+    os.rename(root / "sub" / "deep", root / "sub" / "moved")
+    stats = cat.refresh(str(root))
+    assert stats["changed"] == 2 and stats["removed"] == 2
+    assert [r["name"] for r in cat.iter_rows(str(root / "sub"))] == ["c", "new"]
+    assert cat.count(str(root), category="IMAGE") == 1
+    assert [r["name"] for r in cat.iter_rows(str(root), recursive=False)] == ["a"]
+
+    # rewriting a file in place leaves its directory's mtime alone but is still picked up
+    before = next(iter(cat.iter_rows(str(root), recursive=False)))
+    dir_mtime = os.stat(root).st_mtime_ns
+    (root / "a.txt").write_text("alpha, longer")
+    os.utime(root, ns=(dir_mtime, dir_mtime))
+    stats = cat.refresh(str(root), recursive=False, with_hash=True)
+    after = next(iter(cat.iter_rows(str(root), recursive=False)))
+    assert stats["skipped"] == 1 and stats["changed"] == 1 and stats["hashed"] == 1
+    assert after["size"] == 13 and after["sha256"] != before["sha256"]
+
+
+def test_catalog_refresh_stops_between_directories(tmp_path):
+    import threading
+
+    root = tmp_path / "root"
+    for d in "abc":
+        (root / d).mkdir(parents=True)
+        (root / d / "f.txt").write_text(d)
+    cat = FileCatalog(tmp_path / "catalog.db", workers=1)
+    stop = threading.Event()
+    stats = cat.refresh(str(root), on_dir=lambda d: stop.set(), stop=stop)
+    assert stats["listed"] == 1 and cat.count(str(root)) == 0
+
+    # directories left unvisited are picked up by the next refresh
+    assert cat.refresh(str(root))["listed"] == 3 and cat.count(str(root)) == 3
+
+
+def test_scan_session_cursor_pages(tmp_path):
+    from core.scan_session import ScanSession
+
+    root = tmp_path / "root"
+    for d in ("x", "y", "z"):
+        (root / d).mkdir(parents=True)
+        for i in range(3):
+            (root / d / f"{d}{i}.txt").write_text(d)
+
+    session = ScanSession(FileCatalog(tmp_path / "catalog.db"), str(root), True, False, None, None).start()
+    seen, seq, after = [], 0, None
+    while not session.finished(seq):
+        rows, seq, after = session.page(seq, after, 2, wait=5)
+        assert len(rows) <= 2
+        seen += [r["name"] for r in rows]
+    assert sorted(seen) == [f"{d}{i}" for d in "xyz" for i in range(3)]
+    assert session.total == 9
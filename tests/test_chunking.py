@@ -0,0 +1,82 @@
+def test_chunk_sections_respects_structure_and_budget(tmp_path):
+    from core.chunking import chunk_sections, count_tokens
+    from plugins.text_basic import TextBasic
+
+    doc = tmp_path / "doc.md"
+    body = " ".join(f"w{i}." for i in range(30))
+    doc.write_text(f"# Intro\nshort intro\n## Details\n{body}\n# 结论\n这是中文。没有空格。\n", encoding="utf-8")
+    sections = list(TextBasic().iter_sections(str(doc)))
+    assert [s.section_path for s in sections] == [("Intro",), ("Intro", "Details"), ("结论",)]
+
+    chunks = list(chunk_sections("d", sections, max_tokens=8, overlap_tokens=2))
+    joined = "\n".join(s.text for s in sections)
+    assert [c.id for c in chunks[:2]] == ["d#c0", "d#c1"]
+    for c in chunks:
+        assert count_tokens(c.text) <= 8 and c.metadata["tokens"] == count_tokens(c.text)
+        assert joined[c.span[0]:c.span[1]] == c.text
+    details = [c for c in chunks if c.section_path == ("Intro", "Details")]
+    assert len(details) > 1 and details[1].span[0] < details[0].span[1]  # overlapping windows
+    assert chunks[-1].section_path == ("结论",) and count_tokens("这是中文。") == 4
+
+
+def test_segment_store_appends_tombstones_and_compacts(tmp_path):
+    from core.chunk_segments import SegmentStore
+    from core.chunking import Chunk
+
+    store = SegmentStore(tmp_path / "chunks", small_rows=10, max_small_segments=2, background=False)
+    store.append([Chunk(id="a", doc_id="x", text="a1", metadata={"clip_vector": [1.0, 2.0]}),
+                  Chunk(id="b", doc_id="x", text="b1", span=(0, 2))])
+    store.delete(["a"])
+    store.append([Chunk(id="c", doc_id="y", text="c1")])
+    assert len(store.segments) == 2  # appends never rewrite earlier segments
+    store.append([Chunk(id="a", doc_id="x", text="a2", metadata={"clip_vector": [3.0, 4.0]})])
+    assert len(store.segments) == 1  # three small segments > 2: merged
+
+    live = {c.id: c for c in SegmentStore(tmp_path / "chunks").iter_chunks()}
+    assert {k: c.text for k, c in live.items()} == {"a": "a2", "b": "b1", "c": "c1"}
+    assert live["a"].metadata["clip_vector"] == [3.0, 4.0] and live["b"].span == (0, 2)
+
+    store.delete(["b"])
+    store.compact(full=True)
+    assert sorted(c.id for c in store.iter_chunks()) == ["a", "c"]
+    assert sorted(p.name for p in (tmp_path / "chunks").iterdir() if p.name.startswith("seg-")) == [
+        store.segments[0]["file"], store.segments[0]["vec"]
+    ]
+
+
+def test_iter_chunks_streams_and_caches_only_small_documents(tmp_path, monkeypatch):
+    from core import extract_cache, extractors
+    from core.chunking import Section
+    from core.extract_cache import ExtractCache
+
+    class Plugin:
+        name, version, sections = "sections", "1", 0
+
+        def can_handle(self, path):
+            return True
+
+        def iter_sections(self, path):
+            for i in range(int(open(path).read())):
+                Plugin.sections += 1
+                yield Section(text=f"section {i} " + "x" * 40, section_path=(f"s{i}",))
+
+    cache = ExtractCache(tmp_path / "cache.db")
+    monkeypatch.setattr(extract_cache, "get_extract_cache", lambda: cache)
+    monkeypatch.setattr(extractors, "get_plugins", lambda: [Plugin()])
+    monkeypatch.setattr(extractors, "_CACHE_MAX_CHARS", 500)
+    small, big = tmp_path / "small.txt", tmp_path / "big.txt"
+    small.write_text("3")
+    big.write_text("50")
+
+    it = extractors.iter_chunks(str(big))
+    next(it)
+    assert Plugin.sections < 50  # the first chunk arrives before the document is read through
+    assert len(list(it)) + 1 == len(extractors.extract_chunks(str(big)))
+    read = Plugin.sections
+    extractors.extract_chunks(str(big))
+    assert Plugin.sections == read + 50  # over the bound: never cached
+
+    first = extractors.extract_chunks(str(small))
+    read = Plugin.sections
+    assert [c.id for c in extractors.iter_chunks(str(small))] == [c.id for c in first]
+    assert Plugin.sections == read  # small documents come from the cache
@@ -0,0 +1,69 @@
+import os
+
+import pytest
+
+
+def test_extract_cache_hits_and_evicts(tmp_path, monkeypatch):
+    from core import extract_cache
+    from core.chunking import Chunk
+    from core.extract_cache import ExtractCache, cached_extract
+
+    class Plugin:
+        name, version, calls = "fake", "1", 0
+
+        def extract(self, path, max_chars=4000):
+            Plugin.calls += 1
+            text = open(path).read()[:max_chars]
+            return {"text": text, "chunks": [Chunk(id=f"{path}#0", doc_id=path, text=text, span=(0, 1))]}
+
+    cache = ExtractCache(tmp_path / "cache.db", max_bytes=10_000)
+    monkeypatch.setattr(extract_cache, "get_extract_cache", lambda: cache)
+    src = tmp_path / "a.txt"
+    src.write_text("hello world")
+    plugin = Plugin()
+
+    first = cached_extract(plugin, str(src), 100)
+    again = cached_extract(plugin, str(src), 100)
+    assert Plugin.calls == 1 and again["text"] == first["text"]
+    assert again["chunks"][0].span == (0, 1)
+    cached_extract(plugin, str(src), 5)  # max_chars is part of the key
+    assert Plugin.calls == 2
+
+    moved = tmp_path / "b.txt"
+    os.rename(src, moved)  # same inode/size/mtime: hit, rebased onto the new path
+    hit = cached_extract(plugin, str(moved), 100)
+    assert Plugin.calls == 2 and hit["chunks"][0].id == f"{moved}#0"
+
+    for i in range(50):
+        f = tmp_path / f"big{i}.txt"
+        f.write_text(os.urandom(400).hex())
+        cached_extract(plugin, str(f), 1000)
+    assert cache.total_bytes <= 10_000
+
+    # another process sharing the database: the size limit covers both writers
+    other = ExtractCache(tmp_path / "cache.db", max_bytes=10_000)
+    for i in range(20):
+        blob = {"text": os.urandom(400).hex()}
+        (cache if i % 2 else other).put(f"k{i}", f"/p{i}", blob)
+    assert cache.total_bytes == other.total_bytes <= 10_000
+    with cache._conn() as conn:
+        assert conn.execute("SELECT SUM(size) FROM extract_cache").fetchone()[0] == cache.total_bytes
+
+
+def test_extract_many_times_out_stuck_files(tmp_path):
+    from core.extract_pool import ExtractionExecutor
+
+    if not hasattr(os, "mkfifo"):
+        pytest.skip("needs a FIFO to simulate a hung parser")
+    (tmp_path / "a.txt").write_text("alpha")
+    (tmp_path / "b.md").write_text("beta")
+    os.mkfifo(tmp_path / "stuck.txt")  # opening it for reading blocks forever
+
+    ex = ExtractionExecutor(workers=2, timeout_sec=3, max_tasks_per_child=1)
+    try:
+        paths = [str(tmp_path / n) for n in ("stuck.txt", "a.txt", "b.md")]
+        out = {o.path: o for o in ex.extract_many(paths, mode="text")}
+    finally:
+        ex.shutdown()
+    assert out[paths[0]].error == "timeout" and out[paths[0]].elapsed >= 3
+    assert (out[paths[1]].text, out[paths[2]].text) == ("alpha", "beta")
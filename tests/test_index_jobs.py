@@ -0,0 +1,56 @@
+from core.catalog import FileCatalog
+
+
+def test_index_job_pipelines_directory_into_collection(tmp_path):
+    from core.chunking import Chunk
+    from core.extract_pool import ExtractOutcome
+    from core.index_jobs import IndexJob
+    from services.retrieval import CollectionManager
+
+    root = tmp_path / "root"
+    (root / "sub").mkdir(parents=True)
+    for i in range(5):
+        (root / "sub" / f"f{i}.txt").write_text(f"word{i} shared")
+    (root / "skip.png").write_bytes(b"png")
+
+    def extract(paths):
+        for p in paths:
+            if p.endswith("f3.txt"):
+                yield ExtractOutcome(p, False, error="boom")
+                continue
+            words = open(p).read().split()
+            yield ExtractOutcome(p, True, chunks=[Chunk(id=f"{p}#{i}", doc_id=p, text=w) for i, w in enumerate(words)])
+
+    manager = CollectionManager({"collections": {"c": {"persist": False}}})
+    job = IndexJob(manager, "c", [str(root)], types=["txt"], batch_size=3,
+                   catalog=FileCatalog(tmp_path / "catalog.db"), extract=extract).start()
+    assert job.wait(10)
+    st = job.status()
+    assert (st["state"], st["files_total"], st["files_done"], st["files_failed"], st["chunks"]) == ("done", 5, 4, 1, 8)
+    assert st["total_final"] and st["errors"][0]["error"] == "boom"
+
+    # re-indexing replaces a file's chunks instead of leaving stale ones behind
+    (root / "sub" / "f0.txt").write_text("only")
+    job = IndexJob(manager, "c", [str(root / "sub" / "f0.txt")], extract=extract,
+                   catalog=FileCatalog(tmp_path / "catalog.db")).start()
+    assert job.wait(10) and job.status()["deleted"] == 1
+    assert manager.ids_where("c", {"path": str(root / "sub" / "f0.txt")}) == [f"{root / 'sub' / 'f0.txt'}#0"]
+
+
+def test_replace_documents_mirrors_into_configured_segment_store(tmp_path, monkeypatch):
+    from core.chunk_segments import get_segment_store
+    from core.chunking import Chunk
+    from core.index_jobs import replace_documents
+    from core.settings import SETTINGS
+    from services.retrieval import CollectionManager
+
+    monkeypatch.setitem(SETTINGS["chunking"], "segment_dir", str(tmp_path / "chunks"))
+    store = get_segment_store(tmp_path / "chunks")
+    manager = CollectionManager({"collections": {"c": {"persist": False}}})
+    doc = "/docs/d.txt"
+    replace_documents(manager, "c", {doc: [Chunk(id="d#0", doc_id=doc, text="one"),
+                                           Chunk(id="d#1", doc_id=doc, text="two")]})
+    replace_documents(manager, "c", {doc: [Chunk(id="d#0", doc_id=doc, text="uno")]})
+    assert {c.id: c.text for c in store.iter_chunks()} == {"d#0": "uno"}
+    replace_documents(manager, "c", {}, removed=[doc])
+    assert list(store.iter_chunks()) == []
@@ -0,0 +1,21 @@
+def test_keyword_store_imports_state_json_and_batches(tmp_path):
+    import json
+    from concurrent.futures import ThreadPoolExecutor
+    from core.keyword_store import KeywordStore
+
+    legacy = tmp_path / "state.json"
+    legacy.write_text(json.dumps({
+        "keywords": {"/a": ["x", "y"], "/b": "旧，格式"},
+        "keywords_log": [{"n": i} for i in range(150)],
+    }, ensure_ascii=False), encoding="utf-8")
+    store = KeywordStore(tmp_path / "kw.db")
+    assert store.import_state_json(legacy) == 2
+    assert store.get_many(["/a", "/b", "/missing"]) == {"/a": ["x", "y"], "/b": ["旧", "格式"]}
+    assert [e["n"] for e in store.recent_log()] == list(range(50, 150))
+
+    with ThreadPoolExecutor(8) as ex:
+        list(ex.map(lambda i: store.set_many({f"/f{i}-{j}": [str(j)] for j in range(20)}), range(8)))
+    assert store.count() == 162 and store.get("/f7-19") == ["19"]
+    assert store.delete_many(["/a", "/nope"]) == 1 and store.get("/a") is None
+    store.append_log({"n": 150})
+    assert len(store.recent_log()) == 100 and store.recent_log(1) == [{"n": 150}]
@@ -0,0 +1,115 @@
+import os
+
+import pytest
+
+
+def _write_pdf(path, texts):
+    objs = ["<< /Type /Catalog /Pages 2 0 R >>", "", "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for t in texts:
+        stream = f"BT /F1 12 Tf 72 720 Td ({t}) Tj ET"
+        objs.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objs.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                    f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objs)} 0 R >>")
+        kids.append(f"{len(objs)} 0 R")
+    objs[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+    out, offsets = b"%PDF-1.4\n", []
+    for i, o in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n{o}\nendobj\n".encode()
+    xref = len(out)
+    out += f"xref\n0 {len(objs) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{o:010d} 00000 n \n" for o in offsets).encode()
+    out += f"trailer\n<< /Size {len(objs) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    path.write_bytes(out)
+
+
+def test_pdf_pages_stream_by_range_budget_and_workers(tmp_path):
+    pytest.importorskip("PyPDF2")
+    from core.pdf_stream import iter_pages, iter_pages_parallel, parse_pages, write_markdown
+
+    pdf = tmp_path / "a.pdf"
+    _write_pdf(pdf, [f"page {i}" for i in range(1, 11)])
+    assert list(iter_pages(str(pdf), parse_pages("3-4"))) == [(3, "page 3"), (4, "page 4")]
+    assert [no for no, _ in iter_pages(str(pdf), max_chars=13, block_pages=2)] == [1, 2, 3]
+    assert list(iter_pages_parallel(str(pdf), workers=2, block_pages=3)) == list(iter_pages(str(pdf)))
+    assert write_markdown(str(pdf), tmp_path / "a.md", pages=parse_pages("9-")) == 2
+    assert (tmp_path / "a.md").read_text(encoding="utf-8") == "## 第 9 页\n\npage 9\n\n## 第 10 页\n\npage 10\n"
+
+    from plugins.pdf_basic import PdfBasic
+
+    _write_pdf(tmp_path / "blank.pdf", ["first", "second", "", ""])  # blank trailing pages still count
+    assert PdfBasic().extract(str(tmp_path / "blank.pdf"))["meta"]["pages_scanned"] == 4
+    assert PdfBasic().extract(str(pdf), max_chars=13)["meta"]["pages_scanned"] == 2  # budget stops early
+
+    (tmp_path / "bad.pdf").write_bytes(b"not a pdf")
+    with pytest.raises(Exception):
+        write_markdown(str(tmp_path / "bad.pdf"), tmp_path / "bad.md")
+    assert not (tmp_path / "bad.md.part").exists() and not (tmp_path / "bad.md").exists()
+
+
+def test_normalizer_pool_runs_plugins_in_warm_workers(tmp_path):
+    docx = pytest.importorskip("docx")
+    from core.normalize_pool import NormalizerPool
+
+    src = tmp_path / "a.docx"
+    d = docx.Document()
+    d.add_paragraph("hello pool")
+    d.save(src)
+    pool = NormalizerPool(max_concurrency=1).warm()
+    try:
+        res = pool.run("docx", str(src), str(tmp_path / "out"), timeout=60)
+        assert res.ok and (tmp_path / "out" / "document.md").read_text(encoding="utf-8") == "hello pool\n\n"
+        assert pool.run("nope", str(src), str(tmp_path / "out")).message == "normalizer 'nope' not available"
+    finally:
+        pool.shutdown()
+
+    # a cold single-worker pool: start-up and waiting for the worker do not count against the timeout
+    from concurrent.futures import ThreadPoolExecutor
+
+    pool = NormalizerPool(max_concurrency=1)
+    try:
+        with ThreadPoolExecutor(3) as callers:
+            results = list(callers.map(
+                lambda i: pool.run("docx", str(src), str(tmp_path / f"out{i}"), timeout=20), range(3)))
+        assert all(r.ok for r in results) and pool._ready_epoch == pool._epoch == 1
+    finally:
+        pool.shutdown()
+
+
+def test_normalize_skips_hashing_when_stat_unchanged_and_dedupes_copies(tmp_path, monkeypatch):
+    from core import normalize_runner
+
+    a, b = tmp_path / "a.txt", tmp_path / "b.txt"
+    a.write_text("same content", encoding="utf-8")
+    b.write_text("same content", encoding="utf-8")
+    out = tmp_path / "out"
+    assert normalize_runner.normalize_file(str(a), out).message == "fallback"
+    res = normalize_runner.normalize_file(str(b), out)
+    assert res.message == "dedup" and open(res.md_paths[0], encoding="utf-8").read() == "same content"
+    first = normalize_runner.normalize_file(str(a), out).md_paths[0]
+    assert not os.path.samefile(first, res.md_paths[0])  # copies, not hardlinks
+
+    hashed = []
+    real = normalize_runner.sha256_file
+    monkeypatch.setattr(normalize_runner, "sha256_file", lambda p: hashed.append(p) or real(p))
+    assert normalize_runner.normalize_file(str(a), out).message == "cached" and hashed == []
+    os.utime(a, ns=(0, 10**9))  # touched, content unchanged
+    assert normalize_runner.normalize_file(str(a), out).message == "cached" and hashed == [str(a)]
+    assert normalize_runner.normalize_file(str(a), out).message == "cached" and len(hashed) == 1
+
+    # plugin-handled files: the plugin hands back the previous sidecar, which must still be refreshed
+    docx = pytest.importorskip("docx")
+    from core.normalize_base import REGISTRY
+
+    normalize_runner._ensure_plugins()
+    plugin = next(pl for pl in REGISTRY if pl.name == "docx")
+    monkeypatch.setattr(type(plugin), "normalize", lambda self, path, out_root: self.process(path, out_root))
+    src = tmp_path / "c.docx"
+    for text in ("first", "second"):
+        d = docx.Document()
+        d.add_paragraph(text)
+        d.save(src)
+        hashed.clear()
+        assert normalize_runner.normalize_file(str(src), out).ok and hashed == [str(src)]
+        assert normalize_runner.normalize_file(str(src), out).message == "cached" and len(hashed) == 1
@@ -0,0 +1,278 @@
+import pytest
+
+from services.retrieval.bm25_local import BM25Local
+
+
+def _chunks():
+    return [
+        {"id": "a", "text": "groundhog day report", "metadata": {"year": 2023}},
+        {"id": "b", "text": "annual groundhog groundhog census", "metadata": {"year": 2024}},
+        {"id": "c", "text": "季度数据分析报告", "metadata": {"year": 2024}},
+    ]
+
+
+def test_bm25_ranks_by_term_frequency():
+    bm = BM25Local()
+    bm.upsert(_chunks())
+    hits = bm.query(["groundhog"], k=5)
+    assert [h["id"] for h in hits] == ["b", "a"]
+    assert hits[0]["score"] > hits[1]["score"] > 0
+
+
+def test_bm25_cjk_and_incremental_updates():
+    bm = BM25Local()
+    bm.upsert(_chunks())
+    assert [h["id"] for h in bm.query(["数据分析"])] == ["c"]
+
+    bm.upsert([{"id": "c", "text": "groundhog only", "metadata": {}}])
+    assert bm.query(["数据"]) == []
+    assert bm.delete(["a", "missing"]) == 1
+    assert {h["id"] for h in bm.query(["groundhog"])} == {"b", "c"}
+
+
+def test_bm25_filters():
+    bm = BM25Local()
+    bm.upsert(_chunks())
+    hits = bm.query(["groundhog"], where={"year": {"$lt": 2024}})
+    assert [h["id"] for h in hits] == ["a"]
+
+
+def test_flat_index_topk_and_tombstones():
+    from services.retrieval.vector_index import FlatIndex
+
+    idx = FlatIndex(metric="cosine", capacity=2)
+    idx.add(["x", "y", "z"], [[1, 0], [0, 1], [1, 1]])
+    assert [i for i, _ in idx.search([[1, 0.1]], k=2)[0]] == ["x", "z"]
+
+    assert idx.remove(["x"]) == 1
+    idx.add(["w"], [[-1, 0]])
+    assert idx.rows == 3  # freed row reused, matrix not grown
+    assert [i for i, _ in idx.search([[1, 0]], k=5)[0]] == ["z", "y", "w"]
+
+
+def test_faiss_local_vector_mode_with_filter():
+    from services.retrieval.faiss_local import FaissLocal
+
+    fl = FaissLocal()
+    fl.upsert([
+        {"id": "img1", "text": "", "metadata": {"clip_vector": [1.0, 0.0], "kind": "a"}},
+        {"id": "img2", "text": "", "metadata": {"clip_vector": [0.9, 0.1], "kind": "b"}},
+    ])
+    hits = fl.query([""], k=2, query_embeddings=[[1.0, 0.0]])
+    assert [h["id"] for h in hits] == ["img1", "img2"]
+    assert hits[0]["metadata"]["clip_vector"] == [1.0, 0.0]
+    hits = fl.query([""], k=2, where={"kind": "b"}, query_embeddings=[[1.0, 0.0]])
+    assert [h["id"] for h in hits] == ["img2"]
+
+
+def test_ivf_index_recall_and_persistence(tmp_path):
+    import numpy as np
+    from services.retrieval.vector_index import create_index, load_index
+
+    rng = np.random.default_rng(1)
+    vecs = rng.normal(size=(400, 16)).astype("float32")
+    ids = [f"v{i}" for i in range(len(vecs))]
+    for spec in ({"type": "ivf", "nlist": 8, "nprobe": 8, "train_min": 200},
+                 {"type": "ivf", "nlist": 8, "nprobe": 8, "train_min": 200, "pq_m": 4}):
+        idx = create_index(spec)
+        idx.add(ids[:300], vecs[:300])
+        assert idx.is_trained
+        idx.add(ids[300:], vecs[300:])  # incremental insert after training
+        idx.remove(["v5"])
+        top = [i for i, _ in idx.search(vecs[[7, 350]], k=5)[0]]
+        assert "v5" not in top
+        if not spec.get("pq_m"):
+            assert top[0] == "v7"
+
+        path = idx.save(tmp_path / "vec.index")
+        loaded = load_index(path)
+        assert len(loaded) == 399
+        assert loaded.search(vecs[[7]], k=5) == idx.search(vecs[[7]], k=5)
+        loaded.add(["new"], vecs[[9]])
+        assert "new" in loaded
+
+
+def test_ivf_index_readd_and_row_reuse_return_unique_ids():
+    import numpy as np
+    from services.retrieval.vector_index import create_index
+
+    rng = np.random.default_rng(2)
+    vecs = rng.normal(size=(200, 8)).astype("float32")
+    ids = [f"v{i}" for i in range(len(vecs))]
+    for spec in ({"type": "ivf", "nlist": 4, "nprobe": 4, "train_min": 100},
+                 {"type": "ivf", "nlist": 4, "nprobe": 4, "train_min": 100, "pq_m": 2}):
+        idx = create_index(spec)
+        idx.add(ids, vecs)
+        idx.add(["v7"], vecs[[7]])  # overwrite in place
+        idx.remove(["v9"])
+        idx.add(["w"], vecs[[7]])  # reuses the freed row
+        idx.add(["w"], vecs[[7]])
+        top = [i for i, _ in idx.search(vecs[[7]], k=10)[0]]
+        assert len(top) == len(set(top)) and {"v7", "w"} <= set(top)
+
+        idx.train()  # retrain, from PQ codes when the raw vectors are gone
+        top = [i for i, _ in idx.search(vecs[[7]], k=10)[0]]
+        assert len(top) == len(set(top)) and {"v7", "w"} <= set(top) and len(idx) == 200
+
+
+def test_persistent_collection_checkpoint_and_wal_replay(tmp_path):
+    from services.retrieval.hybrid import HybridRetriever
+    from services.retrieval.store import PersistentRetriever
+
+    ref = HybridRetriever()
+    pr = PersistentRetriever(tmp_path)
+    batch = _chunks() + [{"id": "v", "text": "groundhog photo", "embedding": [1.0, 0.0]}]
+    for r in (ref, pr):
+        r.upsert(batch)
+    pr.checkpoint()
+    for r in (ref, pr):
+        r.upsert([{"id": "d", "text": "groundhog groundhog groundhog"}])
+        r.delete(["b"])
+
+    def ranked(r):
+        return [(h["id"], round(h["score"], 6)) for h in r.query(["groundhog"], search_type="keyword")]
+
+    reopened = PersistentRetriever(tmp_path)  # base from disk + WAL replay
+    assert ranked(reopened) == ranked(ref)
+    assert reopened.query(["数据分析"], search_type="keyword")[0]["metadata"] == {"year": 2024}
+    hits = reopened.query([""], k=1, search_type="vector", query_embeddings=[[1.0, 0.1]])
+    assert [h["id"] for h in hits] == ["v"] and "embedding" not in reopened.docs["v"]
+
+    reopened.checkpoint()
+    again = PersistentRetriever(tmp_path)
+    assert len(again.docs) == 4
+    assert ranked(again) == ranked(ref)
+
+
+def test_checkpoint_swaps_generation_under_concurrent_queries(tmp_path):
+    import threading
+
+    from services.retrieval.store import PersistentRetriever
+
+    pr = PersistentRetriever(tmp_path)
+    pr.upsert(_chunks())
+    errors, stop = [], threading.Event()
+
+    def reader():
+        while not stop.is_set():
+            try:
+                ids = {h["id"] for h in pr.query(["groundhog"], k=10, search_type="keyword")}
+                assert {"a", "b"} <= ids
+            except Exception as e:  # pragma: no cover - reported below
+                errors.append(e)
+                return
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    for t in threads:
+        t.start()
+    try:
+        for i in range(15):
+            pr.upsert([{"id": f"n{i}", "text": f"note {i}"}])
+            pr.checkpoint()
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+    assert not errors
+    assert [p.name for p in tmp_path.glob("gen-*")] == [f"gen-{pr.generation:06d}"]
+
+
+def test_persistent_retriever_reopens_ndarray_embeddings(tmp_path):
+    np = pytest.importorskip("numpy")
+    from services.retrieval.store import PersistentRetriever
+
+    pr = PersistentRetriever(tmp_path)
+    pr.upsert([{"id": "v", "text": "x", "embedding": np.array([1.0, 0.0], "float32"),
+                "metadata": {"score": np.float32(0.5)}}])
+    reopened = PersistentRetriever(tmp_path)  # replays the WAL
+    assert reopened.docs["v"]["metadata"]["score"] == 0.5
+    hits = reopened.query([""], k=1, search_type="vector", query_embeddings=[[1.0, 0.0]])
+    assert [h["id"] for h in hits] == ["v"]
+    reopened.checkpoint()
+    assert PersistentRetriever(tmp_path).docs["v"]["metadata"]["score"] == 0.5
+
+
+def test_checkpoint_drains_old_readers_without_blocking_writers(tmp_path):
+    import threading
+    import time
+
+    from services.retrieval.store import PersistentRetriever
+
+    pr = PersistentRetriever(tmp_path)
+    pr.upsert(_chunks())
+    pr.checkpoint()
+    with pr._readers_cv:  # a slow query still running on the current generation
+        pr._readers[pr.generation] = 1
+    old = pr.generation
+    done = threading.Event()
+    t = threading.Thread(target=lambda: (pr.checkpoint(drain_timeout=10), done.set()))
+    t.start()
+    while pr.generation == old:
+        time.sleep(0.01)
+    started = time.monotonic()
+    pr.upsert([{"id": "w", "text": "written while draining"}])
+    assert time.monotonic() - started < 1 and not done.is_set()
+    with pr._readers_cv:
+        del pr._readers[old]
+        pr._readers_cv.notify_all()
+    t.join(5)
+    assert done.is_set() and [p.name for p in tmp_path.glob("gen-*")] == [f"gen-{pr.generation:06d}"]
+
+
+def test_hybrid_fusion_rrf_and_weighted():
+    from services.retrieval.fusion import rrf, weighted
+
+    vec = [{"id": "x", "score": 0.9}, {"id": "y", "score": 0.8}]
+    kw = [{"id": "y", "score": 12.0}, {"id": "z", "score": 3.0}]
+    for h in vec + kw:
+        h.update(document="", metadata={}, chunk={})
+    assert [h["id"] for h in rrf({"vector": vec, "keyword": kw}, k=3)] == ["y", "x", "z"]
+    fused = weighted({"vector": vec, "keyword": kw}, k=3, weights={"vector": 2.0})
+    assert [h["id"] for h in fused] == ["x", "y", "z"]
+    assert fused[0]["score"] == 2.0
+
+    from services.retrieval.hybrid import HybridRetriever
+
+    hr = HybridRetriever(fusion={"method": "rrf", "min_depth": 5})
+    hr.upsert(_chunks())
+    assert [h["id"] for h in hr.query(["groundhog census"], k=2)] == ["b", "a"]
+    for bad in (5, ["rrf"], {"method": "weighted", "normalize": "softmax"}, {"rrf_k": "x"}):
+        with pytest.raises(ValueError):
+            hr.query(["groundhog"], fusion=bad)
+
+
+def test_filter_index_plans_and_tracks_updates(tmp_path):
+    from services.retrieval.store import PersistentRetriever
+
+    pr = PersistentRetriever(tmp_path)
+    pr.upsert(_chunks())
+    pr.checkpoint()
+    where = {"year": {"$gte": 2024}}
+    assert {h["id"] for h in pr.query(["groundhog"], where=where, search_type="keyword")} == {"b"}
+    assert pr.filters.select(None, {"$regex": "数据.析"}) == {"c"}
+
+    pr.upsert([{"id": "a", "text": "groundhog report", "metadata": {"year": 2025}}])
+    pr.delete(["b"])
+    assert {h["id"] for h in pr.query(["groundhog"], where=where, search_type="keyword")} == {"a"}
+    assert pr.filters.select({"year": {"$in": [2023, 2024]}}, None) == {"c"}
+    assert pr.filters.select({"year": 2025}, {"$contains": "report"}) == {"a"}
+    assert not pr.filters._grams  # disk-backed chunks are never loaded into a text index
+
+    from services.retrieval.hybrid import HybridRetriever
+
+    hr = HybridRetriever()
+    hr.upsert(_chunks())
+    assert hr.filters.select(None, {"$regex": "数据.析"}) == {"c"} and hr.filters._grams
+
+
+def test_query_batch_matches_single_queries():
+    from services.retrieval.hybrid import HybridRetriever
+
+    hr = HybridRetriever()
+    hr.upsert(_chunks())
+    queries = ["groundhog", "数据分析", "census report", "nothing"]
+    for search_type in ("keyword", "vector", "hybrid"):
+        batch = hr.query_batch(queries, k=2, where={"year": {"$gte": 2023}}, search_type=search_type)
+        single = [hr.query([q], k=2, where={"year": {"$gte": 2023}}, search_type=search_type) for q in queries]
+        assert batch == single
+    assert hr.query_batch(queries, search_type="keyword")[3] == []
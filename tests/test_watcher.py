@@ -0,0 +1,62 @@
+from core.catalog import FileCatalog
+
+
+def test_watcher_poll_batches_into_collection(tmp_path):
+    from core.chunking import Chunk
+    from core.watcher import Debouncer, LiveIndexer, PollingBackend
+    from services.retrieval import CollectionManager
+
+    root = tmp_path / "root"
+    root.mkdir()
+    (root / "a.txt").write_text("alpha")
+    cat = FileCatalog(tmp_path / "catalog.db")
+    cat.refresh(str(root))
+
+    def extract(path):
+        text = open(path).read()
+        return [Chunk(id=f"{path}#{i}", doc_id=path, text=w) for i, w in enumerate(text.split())]
+
+    manager = CollectionManager({"collections": {"c": {"persist": False}}})
+    sink = LiveIndexer(manager, "c", extract=extract)
+    debouncer = Debouncer(sink, delay=60)
+    backend = PollingBackend([str(root)], debouncer.push, cat)
+
+    (root / "a.txt").write_text("alpha beta")
+    (root / "b.txt").write_text("gamma")
+    (root / "b.txt.part").write_text("ignored")
+    backend.poll_once()
+    assert not debouncer.ready()
+    assert debouncer.flush() == {str(root / "a.txt"): "upsert", str(root / "b.txt"): "upsert"}
+    assert sorted(manager.ids_where("c", {"path": str(root / "a.txt")})) == [
+        f"{root / 'a.txt'}#0", f"{root / 'a.txt'}#1"
+    ]
+
+    (root / "a.txt").write_text("delta")  # shrinks to one chunk
+    (root / "b.txt").unlink()
+    backend.poll_once()
+    debouncer.flush()
+    docs = manager._ensure_collection("c").docs
+    assert sorted(d["text"] for d in docs.values()) == ["delta"]
+
+
+def test_watcher_start_syncs_catalog_in_background(tmp_path):
+    import threading
+
+    from core.watcher import Watcher
+
+    gate = threading.Event()
+
+    class SlowCatalog(FileCatalog):
+        def refresh(self, *args, **kwargs):
+            gate.wait(5)
+            return super().refresh(*args, **kwargs)
+
+    (tmp_path / "root").mkdir()
+    watcher = Watcher([str(tmp_path / "root")], lambda batch: None, backend="poll",
+                      catalog=SlowCatalog(tmp_path / "catalog.db")).start()
+    try:
+        assert not watcher.ready.wait(0.2)  # start() returned while the initial refresh is blocked
+        gate.set()
+        assert watcher.ready.wait(5) and watcher.backend.name == "poll"
+    finally:
+        watcher.stop()